@@ -22,7 +22,7 @@ import os
 import logging
 import datetime
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.types import TypeDecorator, String
 from sqlalchemy.exc import IntegrityError
@@ -106,6 +106,68 @@ def get_db():
 # ------------------------------------------------------------------
 # 5) Table Initialization + User + Account Seeding
 # ------------------------------------------------------------------
+def _upgrade_schema():
+    """
+    create_all() only creates missing tables. Add the columns introduced
+    after a table first shipped, so existing databases keep working.
+    """
+    from backend.models.transaction import Transaction, LedgerEntry, BitcoinLot, LotCheckpoint
+    from backend.models.portfolio_summary import PortfolioSummary
+
+    tx_columns = {col["name"] for col in inspect(engine).get_columns("transactions")}
+    ledger_columns = {col["name"] for col in inspect(engine).get_columns("ledger_entries")}
+    lot_columns = {col["name"] for col in inspect(engine).get_columns("bitcoin_lots")}
+    checkpoint_columns = {col["name"] for col in inspect(engine).get_columns("lot_checkpoints")}
+    with engine.begin() as conn:
+        if "account_id" not in lot_columns:
+            logger.info("Adding bitcoin_lots.account_id (backfilled from the creating transaction)")
+            conn.execute(text(
+                "ALTER TABLE bitcoin_lots ADD COLUMN account_id INTEGER REFERENCES accounts(id)"
+            ))
+            conn.execute(text(
+                "UPDATE bitcoin_lots SET account_id = ("
+                " SELECT to_account_id FROM transactions"
+                " WHERE transactions.id = bitcoin_lots.created_txn_id)"
+            ))
+        if "parent_lot_id" not in lot_columns:
+            # Lineage is filled in by _backfill_lot_lineage() once seeded.
+            logger.info("Adding bitcoin_lots.parent_lot_id")
+            conn.execute(text(
+                "ALTER TABLE bitcoin_lots ADD COLUMN parent_lot_id INTEGER REFERENCES bitcoin_lots(id)"
+            ))
+        if "frozen_year" not in checkpoint_columns:
+            logger.info("Adding lot_checkpoints.frozen_year")
+            conn.execute(text("ALTER TABLE lot_checkpoints ADD COLUMN frozen_year INTEGER"))
+        if "locked_by_year" not in tx_columns:
+            # Rows locked by an earlier close stay locked on reopen: which
+            # of them were locked by hand was never recorded.
+            logger.info("Adding transactions.locked_by_year")
+            conn.execute(text("ALTER TABLE transactions ADD COLUMN locked_by_year INTEGER"))
+        if "timestamp" not in ledger_columns:
+            logger.info("Adding ledger_entries.timestamp (copied from the transaction)")
+            conn.execute(text("ALTER TABLE ledger_entries ADD COLUMN timestamp VARCHAR"))
+            conn.execute(text(
+                "UPDATE ledger_entries SET timestamp = ("
+                " SELECT timestamp FROM transactions"
+                " WHERE transactions.id = ledger_entries.transaction_id)"
+            ))
+    summary_table = inspect(engine).has_table("portfolio_summary")
+    summary_columns = (
+        {col["name"] for col in inspect(engine).get_columns("portfolio_summary")} if summary_table else set()
+    )
+    if summary_table and summary_columns != set(PortfolioSummary.__table__.columns.keys()):
+        # Derived data: recreate it empty, _rebuild_portfolio_summary refills it.
+        logger.info("portfolio_summary columns changed; recreating the table")
+        PortfolioSummary.__table__.drop(bind=engine)
+        PortfolioSummary.__table__.create(bind=engine)
+    indexes = (
+        *Transaction.__table__.indexes, *LedgerEntry.__table__.indexes,
+        *BitcoinLot.__table__.indexes, *LotCheckpoint.__table__.indexes,
+    )
+    for index in indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
 def create_tables():
     """
     Always creates all database tables and inserts:
@@ -118,10 +180,15 @@ def create_tables():
     # ✅ Ensure all models are imported so Base.metadata is aware of them
     from backend.models.user import User
     from backend.models.account import Account
-    from backend.models.transaction import Transaction, LedgerEntry, BitcoinLot, LotDisposal
+    from backend.models.transaction import (
+        Transaction, LedgerEntry, BitcoinLot, LotDisposal, LotCheckpoint, LotCheckpointEntry,
+    )
+    from backend.models.btc_price import BtcDailyPrice
+    from backend.models.portfolio_summary import PortfolioSummary
 
     Base.metadata.create_all(bind=engine)
     logger.debug("Executed Base.metadata.create_all to create tables")
+    _upgrade_schema()
 
     db = SessionLocal()
     try:
@@ -182,4 +249,67 @@ def create_tables():
         db.close()
         logger.debug("Closed session in create_tables")
 
+    _backfill_lot_lineage()
+    _rebuild_portfolio_summary()
     print("✅ Database initialized successfully.")
+
+
+def _backfill_lot_lineage():
+    """
+    One-time migration: transfer lots written before parent_lot_id existed
+    carry no lineage, which the as-of lot history needs
+    (calculation.get_held_lots_as_of, e.g. the report's start-of-year
+    holdings). Rebuild every lot once, from scratch (a re-lot from a closed
+    year's frozen baseline would leave the older lots as they are), and
+    commit.
+
+    A failure (e.g. no price for a transfer fee) is logged and retried at
+    the next startup.
+    """
+    from backend.models.transaction import Transaction, BitcoinLot
+    from backend.services.transaction import recalculate_all_transactions
+
+    db = SessionLocal()
+    try:
+        legacy = (
+            db.query(BitcoinLot.id)
+            .join(Transaction, Transaction.id == BitcoinLot.created_txn_id)
+            .filter(Transaction.type == "Transfer", BitcoinLot.parent_lot_id.is_(None))
+            .first()
+        )
+        if legacy is None:
+            return
+        logger.info("Transfer lots without lineage found; re-lotting once to record parent_lot_id")
+        recalculate_all_transactions(db, from_scratch=True)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Lot lineage backfill failed; it will be retried at the next startup")
+    finally:
+        db.close()
+
+
+def _rebuild_portfolio_summary():
+    """
+    Fill the materialized PortfolioSummary rows from the ledger and lots and
+    commit, when the table is empty but the ledger is not: databases written
+    before it existed, or whose summary layout changed (_upgrade_schema
+    recreates it). Otherwise every write keeps it current
+    (services/portfolio_summary.py) and startup leaves it alone.
+    """
+    from backend.models.portfolio_summary import PortfolioSummary
+    from backend.models.transaction import Transaction
+    from backend.services.portfolio_summary import refresh_portfolio_summary
+
+    db = SessionLocal()
+    try:
+        if db.query(PortfolioSummary.id).first() is not None or db.query(Transaction.id).first() is None:
+            return
+        logger.info("Portfolio summary is empty; building it from the ledger")
+        refresh_portfolio_summary(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Portfolio summary rebuild failed; it will be retried at the next startup")
+    finally:
+        db.close()
@@ -69,14 +69,26 @@ from backend.database import create_tables, get_db
 async def lifespan(app: FastAPI):
     """
     Lifespan context manager for startup/shutdown events.
-    Ensures tables are created when FastAPI starts.
+    Ensures tables are created when FastAPI starts, merges BTC_PRICE_FILE
+    into the local price store, opens the shared pooled price API client,
+    and runs the background re-lot worker when ASYNC_RECALC is enabled.
     """
+    from backend.services.price_client import start_price_client, stop_price_client
+    from backend.services.price_store import load_bundled_prices
+    from backend.services.recalc_worker import start_recalc_worker, stop_recalc_worker
+
     # Startup
     logger.info("Running create_tables() at startup...")
     create_tables()
     logger.info("Database tables created or verified.")
+    load_bundled_prices()
+    start_price_client()
+    start_recalc_worker()
     yield
-    # Shutdown (nothing needed currently)
+    # Shutdown: let a queued re-lot finish (it may still need prices), then
+    # close the pooled connections
+    stop_recalc_worker()
+    stop_price_client()
 
 # ---------------------------------------------------------
 # Initialize the FastAPI application
@@ -167,18 +179,21 @@ def get_current_user(
 # Routers (Transaction, User, Account, Calculation, Bitcoin, Reports, Debug)
 # ---------------------------------------------------------
 # (Mandatory) Routers (Transaction, User, Account, Calculation, Bitcoin, Reports)
-from backend.routers import transaction, user, account, calculation, bitcoin, reports, backup, csv_import, river_import
+from backend.routers import transaction, user, account, calculation, bitcoin, reports, backup, csv_import, river_import, recalc, tax_year
+from backend.routers.recalc import wait_for_recalc
 
 # Mandatory routers
 app.include_router(transaction.router, prefix="/api/transactions", tags=["transactions"], dependencies=[Depends(get_current_user)])
 app.include_router(user.router, prefix="/api/users", tags=["users"])  # No auth — register must work
 app.include_router(account.router, prefix="/api/accounts", tags=["accounts"], dependencies=[Depends(get_current_user)])
-app.include_router(calculation.router, prefix="/api/calculations", tags=["calculations"], dependencies=[Depends(get_current_user)])
+app.include_router(calculation.router, prefix="/api/calculations", tags=["calculations"], dependencies=[Depends(get_current_user), Depends(wait_for_recalc)])
 app.include_router(bitcoin.router, prefix="/api/bitcoin", tags=["Bitcoin"], dependencies=[Depends(get_current_user)])
-app.include_router(reports.reports_router, prefix="/api/reports", tags=["reports"], dependencies=[Depends(get_current_user)])
+app.include_router(reports.reports_router, prefix="/api/reports", tags=["reports"], dependencies=[Depends(get_current_user), Depends(wait_for_recalc)])
 app.include_router(backup.router, prefix="/api/backup", tags=["backup"], dependencies=[Depends(get_current_user)])
 app.include_router(csv_import.router, prefix="/api/import", tags=["import"], dependencies=[Depends(get_current_user)])
 app.include_router(river_import.router, prefix="/api/import/river", tags=["import"], dependencies=[Depends(get_current_user)])
+app.include_router(recalc.router, prefix="/api/recalc", tags=["recalc"], dependencies=[Depends(get_current_user)])
+app.include_router(tax_year.router, prefix="/api/tax-years", tags=["tax-years"], dependencies=[Depends(get_current_user)])
 
 # (Optional) Debug Router
 try:
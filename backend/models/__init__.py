@@ -15,4 +15,12 @@ from .user import User
 from .account import Account
 
 # Models from transaction.py
-from .transaction import Transaction, LedgerEntry, BitcoinLot, LotDisposal
+from .transaction import (
+    Transaction, LedgerEntry, BitcoinLot, LotDisposal, LotCheckpoint, LotCheckpointEntry,
+)
+
+# Models from btc_price.py
+from .btc_price import BtcDailyPrice
+
+# Models from portfolio_summary.py
+from .portfolio_summary import PortfolioSummary
@@ -0,0 +1,44 @@
+"""
+backend/models/btc_price.py
+
+Local store of daily BTC/USD prices (one row per UTC day).
+
+Historical lookups (transfer-fee valuation during a re-lot, report
+valuations, FMV autofill) read this table before asking any price API, so
+once it is filled the app needs no network to recompute anything. Rows come
+from a bulk-loaded CSV/JSON file or from provider range endpoints; see
+backend/services/price_store.py.
+"""
+
+from sqlalchemy import Column, Date, Numeric, String, func
+
+from backend.database import Base, UTCDateTime
+
+
+class BtcDailyPrice(Base):
+    __tablename__ = "btc_daily_prices"
+
+    day = Column(
+        Date,
+        primary_key=True,
+        doc="UTC calendar day the price applies to."
+    )
+    price_usd = Column(
+        Numeric(18, 8),
+        nullable=False,
+        doc="BTC price in USD for that day, as reported by `source`."
+    )
+    source = Column(
+        String(32),
+        nullable=False,
+        doc="Where the price came from: 'file' (bulk load) or 'api' (price providers)."
+    )
+    fetched_at = Column(
+        UTCDateTime,
+        server_default=func.now(),
+        nullable=False,
+        doc="When the row was written."
+    )
+
+    def __repr__(self):
+        return f"<BtcDailyPrice(day={self.day}, price_usd={self.price_usd}, source={self.source})>"
@@ -0,0 +1,87 @@
+"""
+backend/models/portfolio_summary.py
+
+Materialized per-account, per-year totals behind /api/calculations/*.
+
+One row per (account, year, holding_period):
+ - holding_period 'SHORT' / 'LONG': realized gains and losses of the
+   disposals made that year from the account's lots.
+ - holding_period 'N/A': everything else — the account's net ledger amount
+   for the year, sell proceeds / spent withdrawals / fees of the
+   transactions leaving it, deposits by source arriving in it, and the BTC
+   (and its cost basis) still held in lots acquired into it that year.
+
+The rows are derived data, kept current by backend/services/portfolio_summary.py
+in the same database transaction as the ledger and lot writes they summarize.
+"""
+
+from sqlalchemy import Column, ForeignKey, Integer, Numeric, String, UniqueConstraint
+
+from backend.database import Base
+
+
+def _usd(doc: str) -> Column:
+    return Column(Numeric(18, 2), nullable=False, default=0, doc=doc)
+
+
+def _btc(doc: str) -> Column:
+    return Column(Numeric(18, 8), nullable=False, default=0, doc=doc)
+
+
+class PortfolioSummary(Base):
+    __tablename__ = "portfolio_summary"
+    __table_args__ = (
+        UniqueConstraint("account_id", "year", "holding_period", name="uq_portfolio_summary_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+
+    account_id = Column(
+        Integer,
+        ForeignKey("accounts.id"),
+        nullable=True,
+        index=True,
+        doc="Account the totals belong to (NULL for legacy rows without one)."
+    )
+    year = Column(
+        Integer,
+        nullable=False,
+        index=True,
+        doc="UTC calendar year of the transactions (for held BTC: of the lots' acquisition)."
+    )
+    holding_period = Column(
+        String(10),
+        nullable=False,
+        doc="'SHORT' or 'LONG' for realized gains; 'N/A' for every other total."
+    )
+
+    # Ledger
+    balance = _btc("Net of the account's ledger lines that year.")
+
+    # Open lots
+    held_btc = _btc("BTC still held in lots acquired that year.")
+    held_cost_usd = _usd("Cost basis of held_btc (each lot's leftover fraction).")
+
+    # Disposals
+    realized_gains_usd = _usd("Sum of positive realized gains.")
+    realized_losses_usd = _usd("Sum of realized losses, as a positive amount.")
+
+    # Transaction-level totals
+    sells_proceeds_usd = _usd("Proceeds of Sell transactions.")
+    withdrawals_spent_usd = _usd("Proceeds of 'Spent' withdrawals.")
+    income_usd = _usd("Cost basis of 'Income' deposits.")
+    interest_usd = _usd("Cost basis of 'Interest' deposits.")
+    rewards_usd = _usd("Cost basis of 'Reward' deposits.")
+    gifts_usd = _usd("Cost basis of 'Gift' deposits.")
+    income_btc = _btc("BTC received as 'Income'.")
+    interest_btc = _btc("BTC received as 'Interest'.")
+    rewards_btc = _btc("BTC received as 'Reward'.")
+    gifts_btc = _btc("BTC received as 'Gift'.")
+    fees_usd = _btc("USD fees (kept at fee_amount's 8 decimals).")
+    fees_btc = _btc("BTC fees.")
+
+    def __repr__(self):
+        return (
+            f"<PortfolioSummary(account_id={self.account_id}, year={self.year}, "
+            f"holding_period={self.holding_period}, balance={self.balance})>"
+        )
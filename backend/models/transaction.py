@@ -6,6 +6,7 @@ Full double-entry design with separate models:
 2) LedgerEntry (individual debit/credit lines)
 3) BitcoinLot (tracking BTC acquired for FIFO)
 4) LotDisposal (partial usage of BitcoinLots on disposal)
+5) LotCheckpoint / LotCheckpointEntry (saved lot balances for partial re-lots)
 
 We keep everything in one file to maintain your 3-file approach:
 (transaction.py, account.py, user.py). Extensive comments clarify each model
@@ -27,7 +28,9 @@ from sqlalchemy import (
     Boolean,
     Numeric,
     ForeignKey,
-    func
+    Index,
+    func,
+    text
 )
 from sqlalchemy.orm import relationship
 
@@ -69,6 +72,7 @@ class Transaction(Base):
         UTCDateTime,        # REPLACED DateTime(timezone=True) with UTCDateTime
         server_default=func.now(),
         nullable=False,
+        index=True,
         doc="When the transaction actually occurred (user-facing)."
     )
 
@@ -79,6 +83,13 @@ class Transaction(Base):
         nullable=False,
         doc="Once locked, no further updates or deletion allowed."
     )
+    locked_by_year = Column(
+        Integer,
+        nullable=True,
+        index=True,
+        doc="Tax year whose close locked this row (reopening it unlocks the row); "
+            "NULL if locked by hand or not locked."
+    )
 
     # Audit fields
     created_at = Column(
@@ -225,6 +236,10 @@ class LedgerEntry(Base):
     """
 
     __tablename__ = "ledger_entries"
+    __table_args__ = (
+        # Balances as of a point in time: covers the whole query, no row lookups.
+        Index("ix_ledger_entries_account_time", "account_id", "timestamp", "amount"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -249,6 +264,11 @@ class LedgerEntry(Base):
         nullable=True,
         doc="Optional label: 'FEE', 'TRANSFER_IN', 'BUY', etc."
     )
+    timestamp = Column(
+        UTCDateTime,
+        nullable=True,
+        doc="Copy of the transaction's timestamp (ledger lines are rebuilt when it changes)."
+    )
 
     # Relationship to the Transaction
     transaction = relationship(
@@ -277,9 +297,22 @@ class BitcoinLot(Base):
     represent that chunk of BTC. 'remaining_btc' gets reduced as partial sells
     or withdrawals occur (see LotDisposal).
     cost_basis_usd is the total cost for the entire lot, possibly including fees.
+
+    A Transfer between BTC accounts closes out part of the source lot(s) and
+    creates child lots in the destination account; parent_lot_id records
+    which lot each child was carved from.
     """
 
     __tablename__ = "bitcoin_lots"
+    __table_args__ = (
+        # FIFO lot selection: open lots of one account, oldest first.
+        Index(
+            "ix_bitcoin_lots_open_fifo",
+            "account_id", "acquired_date", "id",
+            sqlite_where=text("remaining_btc > 0"),
+            postgresql_where=text("remaining_btc > 0"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -291,10 +324,26 @@ class BitcoinLot(Base):
         doc="Points to the Transaction where the user acquired this BTC."
     )
 
+    account_id = Column(
+        Integer,
+        ForeignKey("accounts.id"),
+        nullable=True,
+        doc="BTC account holding this lot (the creating transaction's to_account)."
+    )
+
+    parent_lot_id = Column(
+        Integer,
+        ForeignKey("bitcoin_lots.id"),
+        nullable=True,
+        index=True,
+        doc="For lots created by a Transfer: the source lot they were split from."
+    )
+
     acquired_date = Column(
         UTCDateTime,        # REPLACED DateTime(timezone=True) with UTCDateTime
         server_default=func.now(),
         nullable=False,
+        index=True,
         doc="When the BTC was acquired. Usually equals transaction's timestamp."
     )
 
@@ -415,3 +464,108 @@ class LotDisposal(Base):
             f"disposed_btc={self.disposed_btc}, realized_gain_usd={self.realized_gain_usd}, "
             f"holding_period={self.holding_period})>"
         )
+
+
+class LotCheckpoint(Base):
+    """
+    Snapshot of every open BitcoinLot's remaining_btc at a point in the
+    chronological replay, taken right after the transaction (as_of_timestamp,
+    as_of_txn_id) was applied.
+
+    Editing or deleting a transaction only invalidates checkpoints at or after
+    its timestamp, so a re-lot can restore the nearest earlier checkpoint and
+    replay forward from there instead of rebuilding the whole history.
+
+    Closing a tax year writes a frozen checkpoint (frozen_year set) after the
+    year's last transaction. Frozen checkpoints are never discarded by a
+    re-lot; even a full re-lot starts from the newest one.
+    """
+
+    __tablename__ = "lot_checkpoints"
+
+    id = Column(Integer, primary_key=True)
+
+    as_of_timestamp = Column(
+        UTCDateTime,
+        nullable=False,
+        index=True,
+        doc="Timestamp of the last transaction included in this snapshot."
+    )
+    as_of_txn_id = Column(
+        Integer,
+        nullable=False,
+        doc="ID of the last transaction included (tie-breaker for equal timestamps)."
+    )
+    tx_count = Column(
+        Integer,
+        nullable=False,
+        doc="How many transactions (in timestamp, id order) the snapshot covers."
+    )
+    created_at = Column(
+        UTCDateTime,
+        server_default=func.now(),
+        nullable=False,
+        doc="When the snapshot was written."
+    )
+    frozen_year = Column(
+        Integer,
+        nullable=True,
+        index=True,
+        doc="Tax year closed by this snapshot (lot state as of Dec 31), or NULL."
+    )
+
+    entries = relationship(
+        "LotCheckpointEntry",
+        back_populates="checkpoint",
+        cascade="all, delete-orphan",
+        doc="One row per lot that still held BTC at this point."
+    )
+
+    def __repr__(self):
+        return (
+            f"<LotCheckpoint(id={self.id}, as_of={self.as_of_timestamp}, "
+            f"txn_id={self.as_of_txn_id}, tx_count={self.tx_count}, "
+            f"frozen_year={self.frozen_year})>"
+        )
+
+
+class LotCheckpointEntry(Base):
+    """
+    remaining_btc of one open lot inside a LotCheckpoint. Lots not listed
+    were fully consumed at that point.
+    """
+
+    __tablename__ = "lot_checkpoint_entries"
+
+    id = Column(Integer, primary_key=True)
+
+    checkpoint_id = Column(
+        Integer,
+        ForeignKey("lot_checkpoints.id"),
+        nullable=False,
+        index=True,
+        doc="The snapshot this entry belongs to."
+    )
+    lot_id = Column(
+        Integer,
+        ForeignKey("bitcoin_lots.id"),
+        nullable=False,
+        doc="The lot whose balance is recorded."
+    )
+    remaining_btc = Column(
+        Numeric(18, 8),
+        nullable=False,
+        doc="BTC left in the lot as of the checkpoint."
+    )
+
+    checkpoint = relationship(
+        "LotCheckpoint",
+        back_populates="entries",
+        doc="Parent snapshot."
+    )
+
+    def __repr__(self):
+        return (
+            f"<LotCheckpointEntry(checkpoint={self.checkpoint_id}, lot_id={self.lot_id}, "
+            f"remaining_btc={self.remaining_btc})>"
+        )
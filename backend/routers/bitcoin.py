@@ -1,5 +1,19 @@
-from fastapi import APIRouter, Query
-from backend.services import bitcoin
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from sqlalchemy.orm import Session
+
+from backend.database import get_db
+from backend.schemas.bitcoin import HistoricalPriceBatchRequest, HistoricalPriceBatchResponse
+from backend.services import bitcoin, price_store
+from backend.services.provider_health import provider_health
+from backend.services.price_cache import block_height_cache, cached_response, current_price_cache
+
+# Largest price file accepted by /price/history/import.
+MAX_PRICE_FILE_BYTES = 20 * 1024 * 1024
+# Longest chart window (/price/history/timeseries), about 16 years.
+MAX_SERIES_DAYS = 6000
 
 router = APIRouter(
     tags=["Bitcoin"]
@@ -10,35 +24,94 @@ async def get_current_bitcoin_price():
     """
     Endpoint to retrieve the current Bitcoin price (USD).
     Leverages fallback logic in services/bitcoin.py.
-    Raises HTTP 502 if all providers fail.
+    Cached for PRICE_CACHE_TTL seconds (see services/price_cache.py);
+    `cache_age_seconds` says how old the price is.
+    Raises HTTP 502 if all providers fail and nothing is cached.
     """
-    return await bitcoin.get_current_price()
+    return await cached_response(current_price_cache)
 
 
 @router.get("/price/history", summary="Get historical Bitcoin price (one date)")
-async def get_historical_bitcoin_price(date: str):
+async def get_historical_bitcoin_price(date: str, db: Session = Depends(get_db)):
     """
     Endpoint to retrieve Bitcoin price (USD) for a specific date.
     Format: YYYY-MM-DD
-    
-    If you only need multi‐day time‐series,
-    you can remove or rename this single‐day route.
+
+    Served from the local price store when it has the day.
+    """
+    return await bitcoin.get_historical_price(date, db)
+
+
+@router.post(
+    "/price/history/batch",
+    response_model=HistoricalPriceBatchResponse,
+    summary="Get historical Bitcoin prices for many dates",
+)
+async def get_historical_bitcoin_prices(payload: HistoricalPriceBatchRequest, db: Session = Depends(get_db)):
+    """
+    Daily Bitcoin prices (USD) for a list of dates in one call. Stored days
+    come from the local price store; the rest are fetched with a handful of
+    range requests instead of one request per date. Dates no provider
+    could price are listed under `missing`.
+    """
+    prices = await bitcoin.get_historical_prices(payload.dates, db)
+    return {
+        "prices": prices,
+        "missing": sorted(day for day in set(payload.dates) if day not in prices),
+    }
+
+
+@router.get("/price/history/coverage", summary="Days held by the local price store")
+def get_price_store_coverage(db: Session = Depends(get_db)):
+    """
+    How many daily prices are stored, their range, and how many days since
+    the first transaction still need fetching before re-lots and reports
+    can run offline.
     """
-    return await bitcoin.get_historical_price(date)
+    return price_store.coverage(db)
+
+
+@router.post("/price/history/import", summary="Bulk-load daily BTC prices from CSV/JSON")
+def import_price_history(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    Load a CSV (date + price/close columns, e.g. a CoinGecko export) or JSON
+    file of daily prices into the local store, replacing stored days.
+    Plain `def`: parsing and the store write run in FastAPI's threadpool.
+    """
+    content = file.file.read(MAX_PRICE_FILE_BYTES + 1)
+    if len(content) > MAX_PRICE_FILE_BYTES:
+        raise HTTPException(status_code=413, detail="Price file is too large.")
+    loaded = price_store.load_price_file(db, content, file.filename or "")
+    return {"loaded": loaded}
+
+
+@router.post("/price/history/backfill", summary="Fill missing daily BTC prices from the APIs")
+async def backfill_price_history(
+    start: Optional[date] = Query(None, description="First day (default: first transaction)"),
+    end: Optional[date] = Query(None, description="Last day (default: yesterday)"),
+    db: Session = Depends(get_db),
+):
+    """
+    Fetch every day in start..end missing from the local store using the
+    providers' range endpoints.
+    """
+    return await price_store.backfill_prices(db, start, end)
 
 
 @router.get("/price/history/timeseries", summary="Get multi-day BTC price data")
 async def get_btc_price_time_series(
-    days: int = Query(7, ge=1, le=365, description="Number of days (1 to 365)")
+    days: int = Query(7, ge=1, le=MAX_SERIES_DAYS, description=f"Number of days (1 to {MAX_SERIES_DAYS})"),
+    points: Optional[int] = Query(None, ge=3, le=5000, description="Downsample to at most this many points"),
+    db: Session = Depends(get_db),
 ):
     """
-    Returns daily BTC prices for the last `days` days in USD,
-    suitable for line charts (time-series).
+    Returns daily BTC prices for the last `days` days in USD, plus the live
+    price, suitable for line charts (time-series).
 
-    The services/bitcoin.py should have get_time_series(days)
-    that fetches from CoinGecko (fallback to Kraken, etc.).
+    Served from the locally persisted daily series; only days not stored
+    yet are fetched. Pass `points` to downsample long ranges (LTTB).
     """
-    return await bitcoin.get_time_series(days)
+    return await bitcoin.get_time_series(days, points, db)
 
 
 @router.get("/blockheight", summary="Get current Bitcoin block height")
@@ -46,6 +119,18 @@ async def get_current_block_height():
     """
     Endpoint to retrieve the current Bitcoin block height.
     Uses Blockchain.info as primary, with Blockstream and Mempool.space as fallbacks.
-    Raises HTTP 502 if all providers fail.
+    Cached for BLOCKHEIGHT_CACHE_TTL seconds; `cache_age_seconds` says how
+    old the height is.
+    Raises HTTP 502 if all providers fail and nothing is cached.
+    """
+    return await cached_response(block_height_cache)
+
+
+@router.get("/providers", summary="Price / block-height provider health")
+def get_provider_status():
+    """
+    Per-provider circuit state (closed, open, half_open), remaining
+    cool-down, request budget, call outcomes, recent error rate and
+    latency. Providers appear once they have been asked.
     """
-    return await bitcoin.get_block_height()
+    return provider_health.snapshot()
@@ -6,15 +6,20 @@ It exposes endpoints for:
   - Retrieving a single account's balance.
   - Retrieving all accounts' balances.
   - Retrieving gains and losses calculations.
+  - Retrieving the daily portfolio value / cost basis time series.
+
+Balances and the average cost basis also answer "as of" a past moment
+(?as_of=<ISO timestamp>), read from the ledger and lot history.
 
 The underlying logic is implemented in backend/services/calculation.py.
 This modular design lets you display each calculation category (or totals) in your frontend.
 """
 
-from fastapi import APIRouter, Depends
-from typing import List, Dict
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
 from decimal import Decimal
+from datetime import date, datetime
 
 # Import calculation functions from our service file.
 from backend.services.calculation import (
@@ -23,6 +28,7 @@ from backend.services.calculation import (
     get_gains_and_losses,
     get_average_cost_basis
 )
+from backend.services.portfolio_timeseries import get_portfolio_timeseries
 
 # Import the database session dependency.
 from backend.database import get_db
@@ -33,7 +39,11 @@ router = APIRouter(tags=["calculations"])
 
 
 @router.get("/account/{account_id}/balance")
-def api_get_account_balance(account_id: int, db: Session = Depends(get_db)) -> Dict:
+def api_get_account_balance(
+    account_id: int,
+    as_of: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+) -> Dict:
     """
     API endpoint to retrieve the balance for a specific account.
     
@@ -45,18 +55,22 @@ def api_get_account_balance(account_id: int, db: Session = Depends(get_db)) -> D
     
     Args:
       account_id (int): The unique identifier of the account.
+      as_of (datetime, optional): Balance as of this moment (naive = UTC); default now.
       db (Session): The SQLAlchemy database session provided via dependency injection.
     
     Returns:
       dict: A dictionary in the format:
             { "account_id": <int>, "balance": <float> }
     """
-    balance = get_account_balance(db, account_id)
+    balance = get_account_balance(db, account_id, as_of)
     return {"account_id": account_id, "balance": float(balance)}
 
 
 @router.get("/accounts/balances")
-def api_get_all_account_balances(db: Session = Depends(get_db)) -> List[Dict]:
+def api_get_all_account_balances(
+    as_of: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+) -> List[Dict]:
     """
     API endpoint to retrieve balances for all accounts in the system.
     
@@ -64,29 +78,34 @@ def api_get_all_account_balances(db: Session = Depends(get_db)) -> List[Dict]:
       1. Uses the database session to call get_all_account_balances, which returns a list of dictionaries.
       2. Iterates over the results and converts each account's balance from Decimal to float.
       3. Returns the updated list for JSON serialization.
+
+    With `as_of`, each balance counts only the transactions up to that moment.
     
     Returns:
       List[dict]: Each dictionary includes:
                   { "account_id": <int>, "name": <str>, "currency": <str>, "balance": <float> }
     """
-    results = get_all_account_balances(db)
+    results = get_all_account_balances(db, as_of)
     # Convert each Decimal balance to float for JSON output.
     for item in results:
         item["balance"] = float(item["balance"])
     return results
 
 @router.get("/average-cost-basis")
-def api_get_average_cost_basis(db: Session = Depends(get_db)) -> Dict:
+def api_get_average_cost_basis(
+    as_of: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+) -> Dict:
     """
     API endpoint that returns the average USD cost basis per BTC
-    across all currently held BTC lots.
+    across all currently held BTC lots (or those held at `as_of`).
 
     Returns:
         {
           "averageCostBasis": float
         }
     """
-    average_basis_decimal = get_average_cost_basis(db)
+    average_basis_decimal = get_average_cost_basis(db, as_of)
     average_basis = float(average_basis_decimal)  # Convert Decimal -> float
 
     return {"averageCostBasis": average_basis}
@@ -127,3 +146,28 @@ def api_get_gains_and_losses(db: Session = Depends(get_db)) -> Dict:
         return item
 
     return convert_decimal(calculations)
+
+
+@router.get("/portfolio/timeseries")
+async def api_get_portfolio_timeseries(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    points: Optional[int] = Query(None, ge=3, le=5000, description="Downsample to at most this many points"),
+    db: Session = Depends(get_db),
+) -> List[Dict]:
+    """
+    API endpoint returning BTC holdings, cost basis, market value and
+    unrealized gain for every day in start..end (default: first lot through
+    the last closed day), computed in one sweep of the lot history against
+    the daily price series. Pass `points` to downsample long ranges (LTTB).
+
+    Returns:
+        [
+          { "time": <UTC midnight, ms>, "price": float, "holdings_btc": float,
+            "cost_basis_usd": float, "value_usd": float, "unrealized_gain_usd": float },
+          ...
+        ]
+    """
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return await get_portfolio_timeseries(db, start, end, points)
@@ -24,6 +24,8 @@ def _lot_dict(lot: BitcoinLot) -> dict:
     return {
         "id": lot.id,
         "created_txn_id": lot.created_txn_id,
+        "account_id": lot.account_id,
+        "parent_lot_id": lot.parent_lot_id,
         "acquired_date": lot.acquired_date,
         "total_btc": str(lot.total_btc),
         "remaining_btc": str(lot.remaining_btc),
@@ -0,0 +1,46 @@
+"""
+backend/routers/recalc.py
+
+Status of the background re-lot worker (ASYNC_RECALC, see
+backend/services/recalc_worker.py), plus the dependency that makes
+calculation and report endpoints wait for it.
+"""
+
+from typing import Dict
+
+from fastapi import APIRouter, Response
+
+from backend.services.recalc_worker import (
+    RECALC_WAIT_SECONDS,
+    get_recalc_worker,
+    recalc_status,
+)
+
+router = APIRouter()
+
+
+@router.get("/status")
+def get_recalc_status() -> Dict:
+    """
+    Re-lot state: mode ("sync" or "async"), state (idle / queued / running /
+    done / failed), ledger_version vs. recalculated_version, last duration
+    and error.
+    """
+    return recalc_status()
+
+
+def wait_for_recalc(response: Response):
+    """
+    Dependency for endpoints that read lots/disposals: wait up to
+    RECALC_WAIT_SECONDS for queued re-lots. If they are still pending (or
+    the last one failed), answer anyway and say so in the headers.
+    """
+    worker = get_recalc_worker()
+    if worker is None:
+        return
+    settled = worker.wait(RECALC_WAIT_SECONDS)
+    status = worker.status()
+    response.headers["X-Ledger-Version"] = str(status["ledger_version"])
+    response.headers["X-Recalculated-Version"] = str(status["recalculated_version"])
+    if not settled:
+        response.headers["X-Recalc-Pending"] = status["state"]
@@ -12,7 +12,7 @@ from __future__ import annotations
 
 import logging
 from decimal import Decimal
-from typing import Dict, List, Optional
+from typing import Dict, List
 
 from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
 from sqlalchemy.orm import Session
@@ -26,8 +26,9 @@ from backend.schemas.river_import import (
     RiverProposalOut,
 )
 from backend.schemas.csv_import import CSVParseError
-from backend.services.bitcoin import get_historical_price
+from backend.services.bitcoin import get_historical_prices
 from backend.services.csv_import import _validate_row, execute_import
+from backend.services.intraday_prices import get_intraday_series
 from backend.services.river_import import (
     STATUS_DISCREPANCY,
     STATUS_MATCHED,
@@ -48,35 +49,52 @@ async def _autofill_fmv_basis(
 ) -> None:
     """
     Prefill cost_basis_usd (fair market value at receipt) on Deposit
-    proposals (Interest/Income) using the historical daily BTC price.
+    proposals (Interest/Income) using the historical daily BTC price,
+    fetched for all deposit dates in one batch (get_historical_prices), or
+    the nearest intraday bar when an intraday series is configured.
     Degrades gracefully: on lookup failure the basis stays blank and a
     warning tells the user to fill it in.
     """
-    price_cache: Dict[str, Optional[Decimal]] = {}
+    deposits = [
+        p for p in proposals
+        if p.type == "Deposit" and p.cost_basis_usd is None
+    ]
+    if not deposits:
+        return
+    at_time: Dict[int, Decimal] = {}
+    intraday = get_intraday_series()
+    if intraday is not None:
+        found = intraday.nearest_many([p.timestamp for p in deposits])
+        at_time = {id(p): price for p, price in zip(deposits, found) if price is not None}
+
+    try:
+        prices = await get_historical_prices({
+            p.timestamp.date() for p in deposits if id(p) not in at_time
+        })
+    except Exception as exc:
+        logger.warning("FMV lookup failed: %s", exc)
+        prices = {}
 
-    for proposal in proposals:
-        if proposal.type != "Deposit" or proposal.cost_basis_usd is not None:
+    warned = set()
+    for proposal in deposits:
+        day = proposal.timestamp.date()
+        price = at_time.get(id(proposal), prices.get(day))
+        if price is None:
+            if day in warned:
+                continue
+            warned.add(day)
+            date_str = day.strftime("%Y-%m-%d")
+            warnings.append(CSVParseError(
+                row_number=proposal.row_number, column="cost_basis_usd",
+                severity="warning",
+                message=(
+                    f"Could not fetch the BTC price for {date_str}; "
+                    "enter the USD value of this deposit manually."
+                ),
+            ))
             continue
-        date_str = proposal.timestamp.strftime("%Y-%m-%d")
-        if date_str not in price_cache:
-            try:
-                price_data = await get_historical_price(date_str)
-                price_cache[date_str] = Decimal(str(price_data["USD"]))
-            except Exception as exc:
-                price_cache[date_str] = None
-                logger.warning("FMV lookup failed for %s: %s", date_str, exc)
-                warnings.append(CSVParseError(
-                    row_number=proposal.row_number, column="cost_basis_usd",
-                    severity="warning",
-                    message=(
-                        f"Could not fetch the BTC price for {date_str}; "
-                        "enter the USD value of this deposit manually."
-                    ),
-                ))
-        price = price_cache[date_str]
-        if price is not None:
-            proposal.cost_basis_usd = (price * proposal.amount).quantize(Decimal("0.01"))
-            proposal.basis_autofilled = True
+        proposal.cost_basis_usd = (Decimal(str(price)) * proposal.amount).quantize(Decimal("0.01"))
+        proposal.basis_autofilled = True
 
 
 def _proposal_to_out(p: RiverProposal) -> RiverProposalOut:
@@ -0,0 +1,44 @@
+"""
+backend/routers/tax_year.py
+
+Close and reopen tax years (see backend/services/tax_year.py). Closing a
+year locks its transactions and freezes the lot state at Dec 31, so later
+re-lots only replay the open years.
+"""
+
+from typing import Dict, List
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from backend.database import get_db
+from backend.services import tax_year as tax_year_service
+
+router = APIRouter()
+
+
+@router.get("")
+def list_closed_tax_years(db: Session = Depends(get_db)) -> List[Dict]:
+    """
+    Closed years with the last transaction and open-lot count of their
+    frozen baseline.
+    """
+    return tax_year_service.list_closed_years(db)
+
+
+@router.post("/{year}/close")
+def close_tax_year(year: int, db: Session = Depends(get_db)) -> Dict:
+    """
+    Lock every transaction through Dec 31 of `year` (and earlier years) and
+    freeze the end-of-year lot state as the baseline for later re-lots.
+    """
+    return tax_year_service.close_tax_year(db, year)
+
+
+@router.post("/{year}/reopen")
+def reopen_tax_year(year: int, db: Session = Depends(get_db)) -> Dict:
+    """
+    Unlock `year` and every later closed year.
+    """
+    unlocked = tax_year_service.reopen_tax_year(db, year)
+    return {"year": year, "unlocked_transactions": unlocked}
@@ -16,9 +16,12 @@ Refactor Notes:
    consistent format across the entire API.
  - Added a 404 check in get_transaction(tx_id).
  - Otherwise, we've retained your existing create, update, and delete endpoints.
+ - POST /batch applies many creates/updates/deletes atomically with a single
+   lot re-calculation instead of one per request.
 """
 
 from fastapi import APIRouter, Depends, HTTPException
+from pydantic import ValidationError
 from typing import List
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
@@ -27,7 +30,9 @@ from datetime import datetime, timezone
 from backend.schemas.transaction import (
     TransactionCreate,
     TransactionUpdate,
-    TransactionRead
+    TransactionRead,
+    TransactionBatchRequest,
+    TransactionBatchResult,
 )
 
 # The service layer that handles double-entry creation, BTC lots, FIFO disposal, etc.
@@ -115,6 +120,49 @@ def create_transaction(tx: TransactionCreate, db: Session = Depends(get_db)):
     return _attach_utc_and_build_read_model(new_tx)
 
 
+@router.post("/batch", response_model=List[TransactionBatchResult])
+def apply_transaction_batch(batch: TransactionBatchRequest, db: Session = Depends(get_db)):
+    """
+    Apply several creates, updates, deletes and delete_matching filters in
+    one database transaction, with a single lot re-calculation at the end.
+
+    All-or-nothing: if any item is invalid or the batch fails to apply,
+    nothing is saved and the 400 response's detail lists every item's
+    status ("ok", "error" or "rolled_back") and error.
+    """
+    operations, results = [], []
+    for index, item in enumerate(batch.operations):
+        op = {"op": item.op.value, "id": item.id}
+        result = {"index": index, "op": item.op.value, "status": "ok", "id": item.id}
+        try:
+            if item.op.value == "create":
+                op["data"] = TransactionCreate.model_validate(item.data or {}).model_dump()
+            elif item.op.value == "update":
+                op["data"] = TransactionUpdate.model_validate(item.data or {}).model_dump(exclude_unset=True)
+            elif item.op.value == "delete_matching":
+                if item.filter is None:
+                    raise HTTPException(status_code=400, detail="delete_matching => filter is required.")
+                op["filter"] = item.filter.model_dump(exclude_none=True)
+        except ValidationError as e:
+            result["status"] = "error"
+            result["detail"] = e.errors(include_url=False, include_context=False)
+        except HTTPException as e:
+            result["status"] = "error"
+            result["detail"] = e.detail
+        operations.append(op)
+        results.append(result)
+
+    if any(r["status"] == "error" for r in results):
+        for r in results:
+            if r["status"] == "ok":
+                r["status"] = "rolled_back"
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "Batch rejected; no operation was applied.", "results": results},
+        )
+    return tx_service.apply_transaction_batch(operations, db)
+
+
 @router.put("/{transaction_id}", response_model=TransactionRead)
 def update_transaction(transaction_id: int, tx: TransactionUpdate, db: Session = Depends(get_db)):
     """
@@ -0,0 +1,25 @@
+"""
+backend/schemas/bitcoin.py
+
+Pydantic schemas for the BTC price endpoints that take a request body.
+
+- HistoricalPriceBatchRequest: the days to price (POST /price/history/batch)
+- HistoricalPriceBatchResponse: day => USD price, plus days nobody could price
+"""
+
+from datetime import date
+from typing import Dict, List
+
+from pydantic import BaseModel, Field
+
+# Most days one batch request may ask for (~27 years of daily prices).
+MAX_BATCH_DATES = 10000
+
+
+class HistoricalPriceBatchRequest(BaseModel):
+    dates: List[date] = Field(min_length=1, max_length=MAX_BATCH_DATES)
+
+
+class HistoricalPriceBatchResponse(BaseModel):
+    prices: Dict[date, float]
+    missing: List[date]
@@ -18,13 +18,14 @@ FIFO acquisitions/disposals are in BitcoinLot and LotDisposal schemas.
 - LedgerEntryCreate, LedgerEntryRead: line items
 - BitcoinLotCreate, BitcoinLotRead: track BTC acquired
 - LotDisposalCreate, LotDisposalRead: partial usage of those BTC lots
+- TransactionBatchRequest, TransactionBatchResult: POST /api/transactions/batch
 """
 
 from __future__ import annotations
 
 from enum import Enum
 from pydantic import BaseModel, Field, field_validator, ConfigDict
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime, timezone
 from decimal import Decimal
 
@@ -250,6 +251,65 @@ class TransactionRead(TransactionBase):
 
     model_config = ConfigDict(from_attributes=True)  # Enables ORM-to-Pydantic conversion
 
+# -------------------------------------------------
+# BATCH SCHEMAS
+# -------------------------------------------------
+
+class BatchOp(str, Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    DELETE_MATCHING = "delete_matching"
+
+class TransactionFilter(BaseModel):
+    """
+    Selects transactions for a delete_matching batch operation. Every given
+    criterion must hold; account_id matches either side, start/end are
+    inclusive. Locked transactions are never matched.
+    """
+    ids: Optional[List[int]] = None
+    type: Optional[TxType] = None
+    account_id: Optional[int] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+    model_config = ConfigDict(use_enum_values=True)
+
+    @field_validator("start", "end")
+    def force_utc_bounds(cls, v: datetime | None) -> datetime | None:
+        if v is None:
+            return None
+        if v.tzinfo is None:
+            return v.replace(tzinfo=timezone.utc)
+        return v.astimezone(timezone.utc)
+
+class TransactionBatchOperation(BaseModel):
+    """
+    One item of a batch: 'data' holds TransactionCreate fields for create
+    and TransactionUpdate fields for update; 'id' is required for
+    update/delete, 'filter' for delete_matching.
+    """
+    op: BatchOp
+    id: Optional[int] = None
+    data: Optional[Dict[str, Any]] = None
+    filter: Optional[TransactionFilter] = None
+
+class TransactionBatchRequest(BaseModel):
+    operations: List[TransactionBatchOperation] = Field(min_length=1)
+
+class TransactionBatchResult(BaseModel):
+    """
+    Outcome of one batch item. status is "ok", "error" or "rolled_back"
+    (valid, but undone because another item failed). id is the created,
+    updated or deleted transaction; deleted counts delete_matching rows.
+    """
+    index: int
+    op: BatchOp
+    status: str
+    id: Optional[int] = None
+    deleted: Optional[int] = None
+    detail: Optional[Any] = None
+
 # -------------------------------------------------
 # LEDGER ENTRY SCHEMAS
 # -------------------------------------------------
@@ -341,6 +401,8 @@ class BitcoinLotRead(BitcoinLotBase):
     id: int
     created_txn_id: int
     acquired_date: datetime
+    account_id: Optional[int] = None
+    parent_lot_id: Optional[int] = None
 
     model_config = ConfigDict(from_attributes=True)
 
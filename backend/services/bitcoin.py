@@ -1,117 +1,62 @@
+import asyncio
+import logging
 import httpx
 from datetime import datetime, date as date_cls, timezone, timedelta
-from fastapi import HTTPException
-
-# ---------------------------------------------------------------------
-# API endpoints for primary and backup services
-# ---------------------------------------------------------------------
-COINGECKO_PRICE_URL = (
-    "https://api.coingecko.com/api/v3/simple/price"
-    "?ids=bitcoin&vs_currencies=usd"
-)
-
-# CoinGecko single-date historical (DD-MM-YYYY format)
-COINGECKO_HISTORY_URL = (
-    "https://api.coingecko.com/api/v3/coins/bitcoin/history?date={date}"
-)
-
-# CoinGecko multi-day market chart endpoint (e.g., last 7 days)
-COINGECKO_TIMESERIES_URL = (
-    "https://api.coingecko.com/api/v3/coins/bitcoin/market_chart"
-    "?vs_currency=usd&days={days}&interval=daily"
-)
-
-KRAKEN_TICKER_URL = "https://api.kraken.com/0/public/Ticker?pair=XBTUSD"
-KRAKEN_OHLC_URL = (
-    "https://api.kraken.com/0/public/OHLC?pair=XBTUSD&interval=1440&since={since}"
-)
+from typing import Dict, Iterable, Optional
 
-COINDESK_CURRENT_URL = "https://api.coindesk.com/v1/bpi/currentprice/USD.json"
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
 
-# CoinDesk single-date historical (YYYY-MM-DD for start/end)
-COINDESK_HISTORICAL_URL = (
-    "https://api.coindesk.com/v1/bpi/historical/close.json?start={date}&end={date}"
-)
+from backend.services import price_series, price_store
+from backend.services.downsample import lttb
+from backend.services.price_hedge import failover, hedged
+from backend.services.price_client import get_price_client
+from backend.services.price_providers import get_providers
 
+logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------
 # 1) Current Bitcoin Price (live)
 # ---------------------------------------------------------------------
 async def get_current_price():
     """
-    Fetch the current Bitcoin price in USD from multiple sources,
-    using CoinGecko as primary, then Kraken, then CoinDesk if needed.
-    Raises HTTP 502 if all fail.
+    Fetch the current Bitcoin price in USD from the configured providers
+    (services/price_providers.py; by default CoinGecko as primary, then
+    Kraken, then CoinDesk if needed). Hedged: a backup is also asked once
+    the primary is slow (services/price_hedge.py). Raises HTTP 502 if all
+    fail.
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        # 1. Try CoinGecko API for current price
-        try:
-            resp = await client.get(COINGECKO_PRICE_URL)
-        except Exception:
-            resp = None
-        if resp and resp.status_code == 200:
-            try:
-                data = resp.json()
-                # CoinGecko simple price returns {"bitcoin": {"usd": <price>}}
-                price = data["bitcoin"]["usd"]
-                if price is not None:
-                    return {"USD": price}
-            except Exception:
-                pass
-
-        # 2. If CoinGecko failed, try Kraken API for current price
-        try:
-            resp = await client.get(KRAKEN_TICKER_URL)
-        except Exception:
-            resp = None
-        if resp and resp.status_code == 200:
-            try:
-                data = resp.json()
-                # Kraken returns an 'error' list; must be empty for success
-                if data.get("error") == []:
-                    result = data.get("result")
-                    if result:
-                        # The BTC/USD pair key is e.g. "XXBTZUSD" => look at "c" for last trade
-                        pair = next(iter(result))
-                        price_str = result[pair]["c"][0]  # last trade price
-                        price = float(price_str)
-                        return {"USD": price}
-            except Exception:
-                pass
-
-        # 3. If Kraken failed, try CoinDesk API for current price
-        try:
-            resp = await client.get(COINDESK_CURRENT_URL)
-        except Exception:
-            resp = None
-        if resp and resp.status_code == 200:
-            try:
-                data = resp.json()
-                # CoinDesk current price is at data["bpi"]["USD"]["rate_float"]
-                price = data["bpi"]["USD"]["rate_float"]
-                if price is not None:
-                    return {"USD": price}
-            except Exception:
-                pass
-
-    # If all APIs failed, raise an HTTP 502 Bad Gateway
-    raise HTTPException(
-        status_code=502,
-        detail="Unable to retrieve current Bitcoin price from CoinGecko, Kraken, or backup API."
-    )
+    return await get_price_client().call(_current_price, key=("price",))
+
+
+async def _current_price(client: httpx.AsyncClient):
+    price = await hedged([
+        (p.name, lambda p=p: p.current_price(client)) for p in get_providers()
+    ])
+    if price is None:
+        # If all APIs failed, raise an HTTP 502 Bad Gateway
+        raise HTTPException(
+            status_code=502,
+            detail="Unable to retrieve current Bitcoin price from CoinGecko, Kraken, or backup API."
+        )
+    return {"USD": price}
 
 
 # ---------------------------------------------------------------------
 # 2) Single‐Date Historical Price
 # ---------------------------------------------------------------------
-async def get_historical_price(date: str):
+async def get_historical_price(date: str, db: Optional[Session] = None):
     """
-    Fetch the Bitcoin price (USD) for a specific date (YYYY-MM-DD),
-    with failover from CoinGecko to Kraken to CoinDesk.
+    Bitcoin price (USD) for a specific date (YYYY-MM-DD). Reads the local
+    price store first; on a miss, fetches it (fetch_historical_price) and
+    stores it if the day is over. Without `db`, a short-lived session is
+    used for the store. Store reads and writes run in a worker thread; only
+    the fetch is awaited on the event loop.
 
     Raises:
       - 400 if the date is invalid or in the future
-      - 502 if all sources fail
+      - 502 if the store has no price and all sources fail
     """
     # Validate date format
     try:
@@ -123,89 +68,131 @@ async def get_historical_price(date: str):
     if target_date > date_cls.today():
         raise HTTPException(status_code=400, detail="Date cannot be in the future.")
 
-    # Format dates for each API
-    coingecko_date = target_date.strftime("%d-%m-%Y")  # DD-MM-YYYY for CoinGecko
-    coindesk_date = target_date.strftime("%Y-%m-%d")   # YYYY-MM-DD for CoinDesk
+    with price_store.session_scope(db) as session:
+        stored = await run_in_threadpool(price_store.get_stored_price, session, target_date)
+        if stored is not None:
+            return {"USD": float(stored)}
+        price_data = await fetch_historical_price(target_date)
+        await run_in_threadpool(price_store.save_prices, session, {target_date: price_data["USD"]})
+        return price_data
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        # 1. Try CoinGecko API for single-day historical price
-        try:
-            resp = await client.get(COINGECKO_HISTORY_URL.format(date=coingecko_date))
-        except Exception:
-            resp = None
-        if resp and resp.status_code == 200:
-            try:
-                data = resp.json()
-                # CoinGecko returns price under data["market_data"]["current_price"]["usd"]
-                market_data = data.get("market_data")
-                if market_data and "current_price" in market_data:
-                    price = market_data["current_price"].get("usd")
-                    if price is not None:
-                        return {"USD": price}
-            except Exception:
-                pass
-
-        # 2. If CoinGecko failed, try Kraken daily OHLC for the given date
-        #    Prepare Unix timestamp for the target date at 00:00:00 UTC
-        dt_start = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=timezone.utc)
-        timestamp = int(dt_start.timestamp())
-        try:
-            resp = await client.get(KRAKEN_OHLC_URL.format(since=timestamp))
-        except Exception:
-            resp = None
-        if resp and resp.status_code == 200:
-            try:
-                data = resp.json()
-                if data.get("error") == []:
-                    result = data.get("result")
-                    if result:
-                        pair = next(iter(result))  # e.g., "XXBTZUSD"
-                        ohlc_data = result.get(pair, [])
-                        # Each OHLC entry => [time, open, high, low, close, vwap, volume, count]
-                        for entry in ohlc_data:
-                            if len(entry) >= 5 and int(entry[0]) == timestamp:
-                                # Use the open price at 00:00 UTC of that day
-                                price = float(entry[1])
-                                return {"USD": price}
-                        # If exact timestamp not found, fallback to the first entry's open
-                        if ohlc_data:
-                            price = float(ohlc_data[0][1])
-                            return {"USD": price}
-            except Exception:
-                pass
-
-        # 3. If Kraken failed, try CoinDesk API for single-day historical price
+
+async def fetch_historical_price(target_date: date_cls):
+    """
+    Fetch the Bitcoin price (USD) for one day from the configured
+    providers, with hedged failover (by default CoinGecko, Kraken,
+    CoinDesk). Never touches the
+    local store. Raises HTTP 502 if all sources fail.
+    """
+    return await get_price_client().call(_historical_price, target_date, key=("history", target_date))
+
+
+async def _historical_price(client: httpx.AsyncClient, target_date: date_cls):
+    price = await hedged([
+        (p.name, lambda p=p: p.historical_price(client, target_date)) for p in get_providers()
+    ])
+    if price is None:
+        # If all sources fail, return an HTTP 502 error
+        raise HTTPException(
+            status_code=502,
+            detail="Unable to retrieve Bitcoin price for the given date from CoinGecko, Kraken, or backup API."
+        )
+    return {"USD": price}
+
+
+# ---------------------------------------------------------------------
+# 2b) Daily Prices For A Date Range (backfill)
+# ---------------------------------------------------------------------
+async def get_price_range(start: date_cls, end: date_cls) -> Dict[date_cls, float]:
+    """
+    Daily BTC prices (USD) for start..end inclusive, keyed by UTC day, from
+    the first configured provider that answers (by default CoinGecko
+    market_chart/range, first point of each day; Kraken daily OHLC, open;
+    CoinDesk, close). A
+    source may cover only part of the range (API history limits); the
+    caller stores what came back.
+
+    Raises HTTP 502 if all sources fail.
+    """
+    return await get_price_client().call(_price_range, start, end, key=("range", start, end))
+
+
+async def _price_range(client: httpx.AsyncClient, start: date_cls, end: date_cls) -> Dict[date_cls, float]:
+    prices = await failover([
+        (p.name, lambda p=p: p.price_range(client, start, end)) for p in get_providers()
+    ])
+    if not prices:
+        raise HTTPException(
+            status_code=502,
+            detail="Unable to retrieve BTC prices for the date range from CoinGecko, Kraken, or CoinDesk."
+        )
+    return prices
+
+
+# ---------------------------------------------------------------------
+# 2c) Many Historical Prices (batch)
+# ---------------------------------------------------------------------
+async def get_historical_prices(days: Iterable[date_cls], db: Optional[Session] = None) -> Dict[date_cls, float]:
+    """
+    Bitcoin prices (USD) for many days with as few upstream requests as
+    possible: the local store answers what it has and the rest comes from
+    fetch_historical_prices. Fetched days that are over are stored.
+
+    Returns {day: price}; days no source could price are left out.
+    Raises 400 if a day is in the future.
+    """
+    wanted = sorted(set(days))
+    if not wanted:
+        return {}
+    if wanted[-1] > date_cls.today():
+        raise HTTPException(status_code=400, detail="Date cannot be in the future.")
+
+    with price_store.session_scope(db) as session:
+        stored = await run_in_threadpool(price_store.get_stored_prices, session, wanted[0], wanted[-1])
+        prices = {day: float(stored[day]) for day in wanted if day in stored}
+        fetched = await fetch_historical_prices([day for day in wanted if day not in prices])
+        if fetched:
+            await run_in_threadpool(price_store.save_prices, session, fetched)
+    prices.update(fetched)
+    return prices
+
+
+async def fetch_historical_prices(days: Iterable[date_cls]) -> Dict[date_cls, float]:
+    """
+    Fetch many days from the price APIs: one range request per
+    BACKFILL_WINDOW_DAYS span of days (get_price_range), then single-day
+    lookups, concurrently, for the days a range left out. Never touches
+    the local store. Days no source could price are left out.
+    """
+    wanted = sorted(set(days))
+    prices: Dict[date_cls, float] = {}
+    for start, end in price_store.range_windows(wanted):
         try:
-            resp = await client.get(COINDESK_HISTORICAL_URL.format(date=coindesk_date))
-        except Exception:
-            resp = None
-        if resp and resp.status_code == 200:
-            try:
-                data = resp.json()
-                # CoinDesk historical => data["bpi"] is a dict { "YYYY-MM-DD": <price> }
-                bpi = data.get("bpi", {})
-                if coindesk_date in bpi:
-                    price = bpi[coindesk_date]
-                    if price is not None:
-                        return {"USD": price}
-            except Exception:
-                pass
-
-    # If all sources fail, return an HTTP 502 error
-    raise HTTPException(
-        status_code=502,
-        detail="Unable to retrieve Bitcoin price for the given date from CoinGecko, Kraken, or backup API."
-    )
+            fetched = await get_price_range(start, end)
+        except HTTPException as e:
+            logger.warning(f"[Prices] Range {start}..{end} failed: {e.detail}")
+            continue
+        prices.update({day: fetched[day] for day in wanted if start <= day <= end and day in fetched})
+
+    left = [day for day in wanted if day not in prices]
+    results = await asyncio.gather(*(fetch_historical_price(day) for day in left), return_exceptions=True)
+    for day, result in zip(left, results):
+        if isinstance(result, dict):
+            prices[day] = result["USD"]
+    return prices
 
 
 # ---------------------------------------------------------------------
 # 3) Multi‐Day Time‐Series (For Charting)
 # ---------------------------------------------------------------------
-async def get_time_series(days: int = 7):
+async def get_time_series(days: int = 7, points: Optional[int] = None, db: Optional[Session] = None):
     """
-    Fetch daily BTC prices for the last `days` days (1 <= days <= 365),
-    returning a list of { time, price }. Primary: CoinGecko's 'market_chart'.
-    Fallback: tries Kraken's OHLC if CoinGecko fails.
+    Daily BTC prices for the last `days` closed days, followed by the live
+    price, as a list of { time, price }. Served from the persisted daily
+    series (services/price_series.py): only days not stored yet are
+    fetched. With `points`, the series is downsampled (LTTB) to at most
+    that many points, so multi-year charts stay small. Without `db`, a
+    short-lived session is used for the store.
 
     Example output:
       [
@@ -214,66 +201,31 @@ async def get_time_series(days: int = 7):
         ...
       ]
     The 'time' is a UNIX timestamp in milliseconds (UTC), and 'price' is in USD.
+    Raises HTTP 502 if there is no price at all for the window.
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        # 1. Try CoinGecko
-        try:
-            url = COINGECKO_TIMESERIES_URL.format(days=days)
-            cg_resp = await client.get(url)
-            cg_resp.raise_for_status()  # raises if status != 2xx
-            data = cg_resp.json()
-
-            # Expect data["prices"] => [ [ts_ms, price], [ts_ms, price], ... ]
-            if "prices" in data:
-                results = []
-                for entry in data["prices"]:
-                    if len(entry) == 2:
-                        ts_ms, price_usd = entry
-                        results.append({"time": int(ts_ms), "price": float(price_usd)})
-                return results
-        except Exception:
-            pass
-
-        # 2. Fallback: daily OHLC from Kraken
-        #    We'll approximate N days by computing a 'since' timestamp for N days ago.
-        #    Then parse each day from that up to the present.
-        try:
-            # e.g., 7 days ago from now
-            dt_start = datetime.now(timezone.utc) - timedelta(days=days)
-            since_ts = int(dt_start.timestamp())
-
-            kr_resp = await client.get(KRAKEN_OHLC_URL.format(since=since_ts))
-            kr_resp.raise_for_status()
-            data = kr_resp.json()
-
-            # If there's no error in data["error"], parse the "result"
-            if data.get("error") == []:
-                kr_result = data.get("result")
-                if kr_result:
-                    pair = next(iter(kr_result))  # e.g. "XXBTZUSD"
-                    ohlc_list = kr_result.get(pair, [])
-                    # Each OHLC entry => [time_sec, open, high, low, close, vwap, volume, count]
-                    # We'll store them in ascending order
-                    results = []
-                    for row in ohlc_list:
-                        if len(row) >= 5:
-                            time_sec = int(row[0])
-                            close_price = float(row[4])  # choose "close" as daily price
-                            # Convert seconds to ms
-                            time_ms = time_sec * 1000
-                            results.append({"time": time_ms, "price": close_price})
-
-                    # Sort by time ascending
-                    results.sort(key=lambda r: r["time"])
-                    return results
-        except Exception:
-            pass
-
-    # If all fail
-    raise HTTPException(
-        status_code=502,
-        detail="Unable to retrieve multi-day BTC data from CoinGecko or fallback."
-    )
+    from backend.services.price_cache import current_price_cache
+
+    end = price_store.last_closed_day()
+    start = end - timedelta(days=days - 1)
+    rows = await price_series.get_daily_series(start, end, db)
+    results = [
+        (int(datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc).timestamp() * 1000), price)
+        for day, price in rows
+    ]
+    try:
+        live, _ = await current_price_cache.get()
+        results.append((int(datetime.now(timezone.utc).timestamp() * 1000), float(live["USD"])))
+    except HTTPException:
+        pass
+
+    if not results:
+        raise HTTPException(
+            status_code=502,
+            detail="Unable to retrieve multi-day BTC data from the price store or APIs."
+        )
+    if points:
+        results = lttb(results, points)
+    return [{"time": int(ts_ms), "price": price} for ts_ms, price in results]
 
 
 # ---------------------------------------------------------------------
@@ -287,39 +239,28 @@ MEMPOOL_HEIGHT_URL = "https://mempool.space/api/blocks/tip/height"
 async def get_block_height():
     """
     Fetch the current Bitcoin block height from multiple sources,
-    using Blockchain.info as primary, then Blockstream, then Mempool.space.
-    Raises HTTP 502 if all fail.
+    using Blockchain.info as primary, then Blockstream, then Mempool.space
+    (hedged, like get_current_price). Raises HTTP 502 if all fail.
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        # 1. Try Blockchain.info
-        try:
-            resp = await client.get(BLOCKCHAIN_INFO_HEIGHT_URL)
-            if resp.status_code == 200:
-                height = int(resp.text.strip())
-                return {"height": height}
-        except Exception:
-            pass
-
-        # 2. Try Blockstream.info
-        try:
-            resp = await client.get(BLOCKSTREAM_HEIGHT_URL)
-            if resp.status_code == 200:
-                height = int(resp.text.strip())
-                return {"height": height}
-        except Exception:
-            pass
-
-        # 3. Try Mempool.space
-        try:
-            resp = await client.get(MEMPOOL_HEIGHT_URL)
-            if resp.status_code == 200:
-                height = int(resp.text.strip())
-                return {"height": height}
-        except Exception:
-            pass
-
-    # If all APIs failed, raise an HTTP 502 Bad Gateway
-    raise HTTPException(
-        status_code=502,
-        detail="Unable to retrieve Bitcoin block height from any API source."
-    )
+    return await get_price_client().call(_block_height, key=("blockheight",))
+
+
+async def _block_height(client: httpx.AsyncClient):
+    height = await hedged([
+        ("blockchain.info", lambda: _tip_height(client, BLOCKCHAIN_INFO_HEIGHT_URL)),
+        ("blockstream", lambda: _tip_height(client, BLOCKSTREAM_HEIGHT_URL)),
+        ("mempool.space", lambda: _tip_height(client, MEMPOOL_HEIGHT_URL)),
+    ])
+    if height is None:
+        # If all APIs failed, raise an HTTP 502 Bad Gateway
+        raise HTTPException(
+            status_code=502,
+            detail="Unable to retrieve Bitcoin block height from any API source."
+        )
+    return {"height": height}
+
+
+async def _tip_height(client: httpx.AsyncClient, url: str):
+    resp = await client.get(url)
+    resp.raise_for_status()
+    return int(resp.text.strip())
@@ -9,84 +9,220 @@ but are not treated as a capital loss.
 We've also added a small safeguard warning if any disposal lacks holding_period,
 and now we compute a new "year_to_date_capital_gains" field by filtering disposals
 to only those whose Transaction timestamp is >= January 1 of the current year.
+
+Every figure here is read from the materialized PortfolioSummary rows
+(one per account, year and holding period; see services/portfolio_summary.py),
+which the ledger and lot writes keep current, so a request costs
+O(accounts x years) however long the history is.
 """
 
+from collections import defaultdict
 from datetime import datetime, timezone
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Query, Session
+from sqlalchemy import String, func, literal
 from decimal import Decimal, ROUND_HALF_DOWN
-from typing import List, Dict
+from typing import List, Dict, Optional
 import logging
 
 from backend.models.account import Account
+from backend.models.portfolio_summary import PortfolioSummary
 from backend.models.transaction import Transaction, LedgerEntry, LotDisposal, BitcoinLot
+from backend.services.lot_math import (
+    CENTS_PER_USD,
+    SATS_PER_BTC,
+    btc,
+    usd,
+    to_sats,
+    to_cents,
+    fraction_e8,
+    scale_cents_e8,
+    price_per_btc_cents,
+)
+from backend.services.lot_replay import _not_after, _not_before, _surely_before
+from backend.services.portfolio_summary import units
 
 logger = logging.getLogger(__name__)
 
-def get_account_balance(db: Session, account_id: int) -> Decimal:
+
+def _total(column):
+    """SQL: exact sum of a summary column, in 1e-8 units (fits USD columns too)."""
+    return func.coalesce(func.sum(units(column, SATS_PER_BTC)), 0)
+
+
+# ------------------------------------------------------------------------------
+# Point-in-time ("as of") helpers
+# ------------------------------------------------------------------------------
+def _utc(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _sums_as_of(base: Query, key, value, ts_column, as_of: datetime) -> Dict:
+    """
+    {key: sum(value)} over the rows of `base` whose ts_column <= as_of.
+    Rows certainly earlier are summed in SQL; the few within the seconds
+    around as_of (where ISO-string order is not time order, see
+    lot_replay._not_before) are compared exactly in Python.
+    """
+    sums = defaultdict(int)
+    certain = base.with_entities(key, func.sum(value)).filter(_surely_before(ts_column, as_of)).group_by(key)
+    for k, total in certain:
+        sums[k] += total or 0
+    edge = base.with_entities(key, value, ts_column).filter(
+        _not_before(ts_column, as_of), _not_after(ts_column, as_of)
+    )
+    for k, amount, ts in edge:
+        if _utc(ts) <= as_of:
+            sums[k] += amount or 0
+    return sums
+
+
+def _rows_as_of(base: Query, ts_column, as_of: datetime) -> list:
+    """Rows of `base` (selecting ts_column last) whose ts_column <= as_of."""
+    rows = base.filter(_surely_before(ts_column, as_of)).all()
+    edge = base.filter(_not_before(ts_column, as_of), _not_after(ts_column, as_of)).all()
+    return rows + [row for row in edge if _utc(row[-1]) <= as_of]
+
+
+def _ledger_sats_as_of(db: Session, as_of: datetime, account_id: Optional[int] = None) -> Dict[int, int]:
+    """
+    Per-account ledger totals (satoshi units) as of `as_of`: the summary
+    rows of the years before as_of's year, plus that year's ledger lines up
+    to as_of, read through ix_ledger_entries_account_time.
     """
-    Return the numeric balance for a given account_id by summing
-    LedgerEntry.amount in the ledger_entries table. Returns Decimal("0.0") if none.
+    as_of = _utc(as_of)
+    earlier = (
+        db.query(PortfolioSummary.account_id, func.sum(units(PortfolioSummary.balance, SATS_PER_BTC)))
+          .filter(PortfolioSummary.year < as_of.year)
+    )
+    # ISO strings: every timestamp of as_of's year or later sorts at or after "YYYY".
+    lines = db.query(LedgerEntry).filter(LedgerEntry.timestamp >= literal(f"{as_of.year:04d}", String))
+    if account_id is not None:
+        earlier = earlier.filter(PortfolioSummary.account_id == account_id)
+        lines = lines.filter(LedgerEntry.account_id == account_id)
+
+    sums = _sums_as_of(
+        lines, LedgerEntry.account_id, units(LedgerEntry.amount, SATS_PER_BTC), LedgerEntry.timestamp, as_of,
+    )
+    for acct, total in earlier.group_by(PortfolioSummary.account_id):
+        sums[acct] += total or 0
+    return sums
+
+
+def get_held_lots_as_of(db: Session, as_of: datetime) -> List[Dict]:
     """
+    The BTC lots held at `as_of` and how much of each was still held, read
+    from the lot and disposal history without touching any row.
+
+    A lot exists once its creating transaction has happened. Its balance at
+    as_of is its total minus what was taken from it by then: disposals
+    (LotDisposal) and transfers out (the child lots carved from it, see
+    BitcoinLot.parent_lot_id). FIFO consumes lots in time order, so this is
+    exactly what a re-lot stopped at as_of would leave.
+    """
+    as_of = _utc(as_of)
+    lots = _rows_as_of(
+        db.query(
+            BitcoinLot.id, BitcoinLot.account_id, BitcoinLot.acquired_date,
+            BitcoinLot.total_btc, BitcoinLot.cost_basis_usd, Transaction.timestamp,
+        ).join(Transaction, Transaction.id == BitcoinLot.created_txn_id),
+        Transaction.timestamp, as_of,
+    )
+    disposed = _sums_as_of(
+        db.query(LotDisposal).join(Transaction, Transaction.id == LotDisposal.transaction_id),
+        LotDisposal.lot_id, units(LotDisposal.disposed_btc, SATS_PER_BTC), Transaction.timestamp, as_of,
+    )
+    moved = _sums_as_of(
+        db.query(BitcoinLot)
+          .join(Transaction, Transaction.id == BitcoinLot.created_txn_id)
+          .filter(BitcoinLot.parent_lot_id.isnot(None)),
+        BitcoinLot.parent_lot_id, units(BitcoinLot.total_btc, SATS_PER_BTC), Transaction.timestamp, as_of,
+    )
+
+    held = []
+    for lot_id, account_id, acquired_date, total_btc, cost_basis_usd, _ in sorted(lots):
+        remaining_sats = to_sats(total_btc) - disposed.get(lot_id, 0) - moved.get(lot_id, 0)
+        if remaining_sats > 0:
+            held.append({
+                "lot_id": lot_id,
+                "account_id": account_id,
+                "acquired_date": acquired_date,
+                "total_btc": total_btc,
+                "remaining_btc": btc(remaining_sats),
+                "cost_basis_usd": cost_basis_usd,
+            })
+    return held
+
+
+def get_account_balance(db: Session, account_id: int, as_of: Optional[datetime] = None) -> Decimal:
+    """
+    Return the numeric balance for a given account_id: the sum of its
+    ledger lines, read from the per-year summary rows. Returns Decimal("0.0") if none.
+    With `as_of`, only the lines of transactions up to that moment count.
+    """
+    if as_of is not None:
+        sums = _ledger_sats_as_of(db, as_of, account_id)
+        return btc(sums[account_id]) if account_id in sums else Decimal("0.0")
     total = (
-        db.query(func.sum(LedgerEntry.amount))
-          .filter(LedgerEntry.account_id == account_id)
+        db.query(func.sum(units(PortfolioSummary.balance, SATS_PER_BTC)))
+          .filter(PortfolioSummary.account_id == account_id)
           .scalar()
     )
-    return total or Decimal("0.0")
+    return Decimal("0.0") if total is None else btc(total)
 
 
-def get_all_account_balances(db: Session) -> List[Dict]:
+def get_all_account_balances(db: Session, as_of: Optional[datetime] = None) -> List[Dict]:
     """
-    Returns a list of all accounts (id, name, currency) plus their current balance.
-    Balances are computed in a single grouped query instead of one query per account.
+    Returns a list of all accounts (id, name, currency) plus their current balance
+    (or their balance as of `as_of`). Balances are computed in a single
+    grouped query over the summary rows.
     """
-    sums = dict(
-        db.query(LedgerEntry.account_id, func.sum(LedgerEntry.amount))
-          .group_by(LedgerEntry.account_id)
-          .all()
-    )
+    if as_of is not None:
+        sums = _ledger_sats_as_of(db, as_of)
+    else:
+        sums = dict(
+            db.query(PortfolioSummary.account_id, func.sum(units(PortfolioSummary.balance, SATS_PER_BTC)))
+              .group_by(PortfolioSummary.account_id)
+              .all()
+        )
     accounts = db.query(Account).all()
     return [
         {
             "account_id": account.id,
             "name": account.name,
             "currency": account.currency,
-            "balance": sums.get(account.id, Decimal("0.0")),
+            "balance": btc(sums[account.id]) if account.id in sums else Decimal("0.0"),
         }
         for account in accounts
     ]
 
 
-def get_average_cost_basis(db: Session) -> Decimal:
+def get_average_cost_basis(db: Session, as_of: Optional[datetime] = None) -> Decimal:
     """
-    Returns the average USD cost basis per BTC across all currently held BTC lots,
-    i.e. sum of leftover cost basis / sum of remaining_btc, rounded to 2 decimals.
+    Returns the average USD cost basis per BTC across all currently held BTC lots
+    (or the lots held at `as_of`), i.e. sum of leftover cost basis / sum of
+    remaining_btc, rounded to 2 decimals.
+    The leftover basis of each lot (lot_math.py, half-down at each step) is
+    summed into the summary rows when the lots are written.
     """
-    lots = db.query(BitcoinLot).filter(BitcoinLot.remaining_btc > 0).all()
-    total_btc_remaining = Decimal("0")
-    total_cost_basis_remaining = Decimal("0")
-
-    for lot in lots:
-        if lot.total_btc > 0:
-            # fraction of the original lot still held
-            fraction_left = (lot.remaining_btc / lot.total_btc).quantize(
-                Decimal("0.00000001"),
-                rounding=ROUND_HALF_DOWN
-            )
-            # leftover cost basis for that fraction
-            leftover_cost_basis = (
-                lot.cost_basis_usd * fraction_left
-            ).quantize(Decimal("0.01"), rounding=ROUND_HALF_DOWN)
-
-            total_btc_remaining += lot.remaining_btc
-            total_cost_basis_remaining += leftover_cost_basis
-
-    if total_btc_remaining == 0:
+    if as_of is not None:
+        held_sats = held_cents = 0
+        for lot in get_held_lots_as_of(db, as_of):
+            total_sats = to_sats(lot["total_btc"])
+            remaining_sats = to_sats(lot["remaining_btc"])
+            fraction_left = fraction_e8(remaining_sats, total_sats)
+            held_sats += remaining_sats
+            held_cents += scale_cents_e8(to_cents(lot["cost_basis_usd"]), fraction_left)
+    else:
+        held_sats, held_cents = (
+            db.query(
+                func.coalesce(func.sum(units(PortfolioSummary.held_btc, SATS_PER_BTC)), 0),
+                func.coalesce(func.sum(units(PortfolioSummary.held_cost_usd, CENTS_PER_USD)), 0),
+            ).one()
+        )
+    if held_sats == 0:
         return Decimal("0")
 
-    average_basis = total_cost_basis_remaining / total_btc_remaining
-    return average_basis.quantize(Decimal("0.01"), rounding=ROUND_HALF_DOWN)
+    return usd(price_per_btc_cents(held_cents, held_sats))
 
 
 def get_gains_and_losses(db: Session) -> dict:
@@ -95,6 +231,10 @@ def get_gains_and_losses(db: Session) -> dict:
     etc.) for display in the frontend. Uses only 'LotDisposal' for capital gain events,
     thus avoiding double-counting with transaction-level fields.
 
+    The totals are grouped sums over the summary rows (gains by holding
+    period and sign, deposits by source, fees by currency were aggregated
+    into them when the ledger was written).
+
     - 'Spent' withdrawals:
          We track the USD proceeds in 'withdrawals_spent' for personal finance,
          but do NOT treat that as a separate capital loss. The actual gain/loss
@@ -104,103 +244,45 @@ def get_gains_and_losses(db: Session) -> dict:
          We now filter disposals to only those whose Transaction.timestamp
          is >= Jan 1 of the current year, summing realized_gain_usd.
     """
-    # --------------------- 1) Initialize Aggregators ---------------------
-    sells_proceeds = Decimal("0.0")
-    withdrawals_spent = Decimal("0.0")
-
-    # Per-source deposit aggregators (USD cost basis and BTC amount per source)
-    deposit_usd = {s: Decimal("0.0") for s in ("income", "interest", "reward", "gift")}
-    deposit_btc = {s: Decimal("0.0") for s in deposit_usd}
-
-    fees_usd = Decimal("0.0")
-    fees_btc = Decimal("0.0")
-
-    # Gains vs. Losses
-    short_term_gains = Decimal("0.0")
-    short_term_losses = Decimal("0.0")
-    long_term_gains = Decimal("0.0")
-    long_term_losses = Decimal("0.0")
-
-    # --------------------- 2) Summarize Gains from LotDisposal ---------------------
-    disposals = db.query(LotDisposal).all()
-    for disposal in disposals:
-        gain = disposal.realized_gain_usd
-        # If no holding_period is set, we default to SHORT but log a warning
-        if not disposal.holding_period:
-            logger.warning(
-                f"LotDisposal ID={disposal.id} has no holding_period; defaulting to SHORT in aggregator."
+    # --------------------- 1) Gains by Holding Period and Sign ---------------------
+    gains = {
+        period: (btc(gain_units), btc(loss_units))
+        for period, gain_units, loss_units in (
+            db.query(
+                PortfolioSummary.holding_period,
+                _total(PortfolioSummary.realized_gains_usd),
+                _total(PortfolioSummary.realized_losses_usd),
             )
-        holding_period = disposal.holding_period.upper() if disposal.holding_period else "SHORT"
-
-        if gain is not None:
-            if gain > 0:
-                if holding_period == "SHORT":
-                    short_term_gains += gain
-                else:
-                    long_term_gains += gain
-            elif gain < 0:
-                abs_loss = abs(gain)
-                if holding_period == "SHORT":
-                    short_term_losses += abs_loss
-                else:
-                    long_term_losses += abs_loss
-
-    # --------------------- 3) Parse Transactions for Non-Disposal Aggregations ---------------------
-    transactions = db.query(Transaction).all()
-    for tx in transactions:
-        tx_type = tx.type.lower()
-
-        # SELL => track proceeds for reference
-        if tx_type == "sell" and tx.proceeds_usd is not None:
-            try:
-                sells_proceeds += Decimal(str(tx.proceeds_usd))
-            except Exception as e:
-                logger.warning(f"Error converting proceeds_usd for Sell txn {tx.id}: {e}")
-
-        # WITHDRAWAL (Spent) => track how many USD were spent, but not as a capital loss
-        if (
-            tx_type == "withdrawal"
-            and (tx.purpose or "").lower() == "spent"
-            and tx.proceeds_usd is not None
-        ):
-            try:
-                withdrawals_spent += Decimal(str(tx.proceeds_usd))
-            except Exception as e:
-                logger.warning(f"Error converting proceeds_usd for Spent withdrawal txn {tx.id}: {e}")
-
-        # DEPOSIT (Income / Interest / Reward / Gift) => per-source USD + BTC totals
-        if tx_type == "deposit" and tx.cost_basis_usd is not None and tx.amount is not None:
-            source = (tx.source or "").lower()
-            if source in deposit_usd:
-                try:
-                    cb = Decimal(str(tx.cost_basis_usd))
-                    amt = Decimal(str(tx.amount))
-                    if cb > 0:
-                        deposit_usd[source] += cb
-                    if amt > 0:
-                        deposit_btc[source] += amt
-                except Exception as e:
-                    logger.warning(
-                        f"Error converting cost_basis_usd for {source.title()} Deposit txn {tx.id}: {e}"
-                    )
-
-        # FEES (USD or BTC)
-        if tx.fee_amount is not None and tx.fee_currency is not None:
-            try:
-                fee_amt = Decimal(str(tx.fee_amount))
-                currency = tx.fee_currency.lower()
-                if currency == "usd":
-                    fees_usd += fee_amt
-                elif currency == "btc":
-                    fees_btc += fee_amt
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Failed to parse fee_amount {tx.fee_amount} for tx {tx.id}: {e}")
-
-    # --------------------- 4) Final Summaries & YTD Gains Logic ---------------------
+            .filter(PortfolioSummary.holding_period.in_(("SHORT", "LONG")))
+            .group_by(PortfolioSummary.holding_period)
+            .all()
+        )
+    }
+    short_term_gains, short_term_losses = gains.get("SHORT", (Decimal("0.0"), Decimal("0.0")))
+    long_term_gains, long_term_losses = gains.get("LONG", (Decimal("0.0"), Decimal("0.0")))
+
+    # --------------------- 2) Proceeds, Deposits by Source, Fees by Currency ---------------------
+    names = (
+        "sells_proceeds_usd", "withdrawals_spent_usd",
+        "income_usd", "interest_usd", "rewards_usd", "gifts_usd",
+        "income_btc", "interest_btc", "rewards_btc", "gifts_btc",
+        "fees_usd", "fees_btc",
+    )
+    sums = db.query(*(_total(getattr(PortfolioSummary, name)) for name in names)).one()
+    totals = {name: btc(value) for name, value in zip(names, sums)}
+
+    sells_proceeds = totals["sells_proceeds_usd"]
+    withdrawals_spent = totals["withdrawals_spent_usd"]
+    deposit_usd = {s: totals[f"{s}_usd"] for s in ("income", "interest", "rewards", "gifts")}
+    deposit_btc = {s: totals[f"{s}_btc"] for s in deposit_usd}
+    fees_usd = totals["fees_usd"]
+    fees_btc = totals["fees_btc"]
+
+    # --------------------- 3) Final Summaries & YTD Gains Logic ---------------------
     income_earned, income_btc = deposit_usd["income"], deposit_btc["income"]
     interest_earned, interest_btc = deposit_usd["interest"], deposit_btc["interest"]
-    rewards_earned, rewards_btc = deposit_usd["reward"], deposit_btc["reward"]
-    gifts_received, gifts_btc = deposit_usd["gift"], deposit_btc["gift"]
+    rewards_earned, rewards_btc = deposit_usd["rewards"], deposit_btc["rewards"]
+    gifts_received, gifts_btc = deposit_usd["gifts"], deposit_btc["gifts"]
 
     total_income = income_earned + interest_earned + rewards_earned
 
@@ -215,13 +297,12 @@ def get_gains_and_losses(db: Session) -> dict:
     now_utc = datetime.now(timezone.utc)
     start_of_year = datetime(now_utc.year, 1, 1, tzinfo=timezone.utc)
 
-    ytd_gain_sum = (
-        db.query(func.coalesce(func.sum(LotDisposal.realized_gain_usd), 0))
-          .join(Transaction, LotDisposal.transaction_id == Transaction.id)
-          .filter(Transaction.timestamp >= start_of_year)
-          .scalar()
+    ytd_gain_units, ytd_loss_units = (
+        db.query(_total(PortfolioSummary.realized_gains_usd), _total(PortfolioSummary.realized_losses_usd))
+          .filter(PortfolioSummary.year >= start_of_year.year)
+          .one()
     )
-    ytd_gain_sum = Decimal(str(ytd_gain_sum or 0))
+    ytd_gain_sum = btc(ytd_gain_units - ytd_loss_units)
 
     # Convert ytd_gain_sum => float
     year_to_date_capital_gains = float(
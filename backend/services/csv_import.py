@@ -17,7 +17,7 @@ from typing import List, Optional, Tuple, Dict, Any
 from sqlalchemy.orm import Session
 
 from backend.models.transaction import Transaction
-from backend.services.transaction import create_transaction_record
+from backend.services.transaction import create_transaction_record, deferred_recalculation
 from backend.schemas.csv_import import CSVRowPreview, CSVParseError
 from backend.constants import (
     ACCOUNT_NAME_TO_ID,
@@ -630,7 +630,9 @@ def execute_import(db: Session, transactions: List[Dict[str, Any]]) -> int:
     Import transactions atomically.
 
     All transactions are created without committing, then committed together
-    at the end. If any transaction fails, all are rolled back.
+    at the end. If any transaction fails, all are rolled back. Rows are
+    inserted in deferred-recalculation mode, so lots are rebuilt by one
+    re-lot from the earliest imported timestamp instead of per row.
 
     Args:
         db: Database session
@@ -654,10 +656,11 @@ def execute_import(db: Session, transactions: List[Dict[str, Any]]) -> int:
     imported_count = 0
 
     try:
-        for tx_data in sorted_txns:
-            # Use auto_commit=False to defer commit until all transactions succeed
-            create_transaction_record(tx_data, db, auto_commit=False)
-            imported_count += 1
+        with deferred_recalculation(db):
+            for tx_data in sorted_txns:
+                # Use auto_commit=False to defer commit until all transactions succeed
+                create_transaction_record(tx_data, db, auto_commit=False)
+                imported_count += 1
 
         # All transactions succeeded - commit them all
         db.commit()
@@ -0,0 +1,156 @@
+"""
+backend/services/intraday_prices.py
+
+Optional sub-daily (e.g. hourly) BTC price series for valuing a
+transaction at its own time instead of at its day's price.
+
+Set BTC_INTRADAY_FILE to a CSV (a time column: timestamp/time/date/
+snapped_at, and a price column: price/close/price_usd/usd) or JSON file
+([[time, price], ...] or {"prices": [[unix_ms, price], ...]}, e.g. a
+CoinGecko market_chart export). Times may be ISO strings or Unix
+seconds/milliseconds. The file is loaded once into two parallel sorted
+arrays (microsecond timestamps, prices).
+
+Lookups take the bar nearest to the timestamp, if it is within
+INTRADAY_MAX_GAP_SECONDS; otherwise the caller falls back to the daily
+price (get_btc_price in transaction.py does). nearest_many() answers
+thousands of timestamps in one sorted sweep.
+
+Without BTC_INTRADAY_FILE nothing changes: every valuation uses the daily
+price store.
+"""
+
+import bisect
+import csv
+import io
+import json
+import logging
+import os
+import threading
+from array import array
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BTC_INTRADAY_FILE = os.getenv("BTC_INTRADAY_FILE")
+# Farthest a bar may be from the timestamp it values.
+INTRADAY_MAX_GAP_SECONDS = float(os.getenv("INTRADAY_MAX_GAP_SECONDS", "7200"))
+
+_TIME_COLUMNS = ("timestamp", "time", "date", "snapped_at", "datetime")
+_PRICE_COLUMNS = ("price", "close", "price_usd", "usd")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _to_micros(value) -> int:
+    """ISO datetime string or Unix seconds/milliseconds => UTC microseconds."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        delta = value - _EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.replace(".", "", 1).isdigit():
+            return _to_micros(datetime.fromisoformat(value.replace("Z", "+00:00").replace(" UTC", "+00:00")))
+    seconds = float(value)
+    if seconds > 1e11:  # milliseconds
+        seconds /= 1000
+    return int(round(seconds * 1_000_000))
+
+
+class IntradaySeries:
+    """
+    Parallel sorted arrays of bar times (UTC microseconds) and USD prices.
+    """
+
+    def __init__(self, bars: Iterable[Tuple[int, float]], max_gap_seconds: float = INTRADAY_MAX_GAP_SECONDS):
+        ordered = sorted(dict(bars).items())
+        self.times = array("q", (t for t, _ in ordered))
+        self.prices = array("d", (p for _, p in ordered))
+        self.max_gap = int(max_gap_seconds * 1_000_000)
+
+    def __len__(self):
+        return len(self.times)
+
+    def _nearest_index(self, micros: int, lo: int = 0) -> Tuple[Optional[int], int]:
+        """(index of the nearest bar within max_gap or None, insertion point)."""
+        i = bisect.bisect_left(self.times, micros, lo)
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(self.times):
+                gap = abs(self.times[j] - micros)
+                if gap <= self.max_gap and (best is None or gap < abs(self.times[best] - micros)):
+                    best = j
+        return best, i
+
+    def nearest(self, timestamp: datetime) -> Optional[Decimal]:
+        """Price of the bar nearest `timestamp`, or None if none is close enough."""
+        i, _ = self._nearest_index(_to_micros(timestamp))
+        return None if i is None else Decimal(repr(self.prices[i]))
+
+    def nearest_many(self, timestamps: List[datetime]) -> List[Optional[Decimal]]:
+        """
+        nearest() for many timestamps, in input order. The queries are
+        sorted once and each search starts where the previous one ended.
+        """
+        micros = [_to_micros(ts) for ts in timestamps]
+        results: List[Optional[Decimal]] = [None] * len(micros)
+        lo = 0
+        for n in sorted(range(len(micros)), key=micros.__getitem__):
+            i, at = self._nearest_index(micros[n], lo)
+            lo = max(at - 1, 0)
+            if i is not None:
+                results[n] = Decimal(repr(self.prices[i]))
+        return results
+
+
+def parse_intraday_file(content: bytes, filename: str = "") -> List[Tuple[int, float]]:
+    """(UTC microseconds, price) rows from a CSV or JSON file; raises ValueError."""
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".json") or text.lstrip()[:1] in ("{", "["):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("prices", [])
+        rows = [(item[0], item[1]) for item in data]
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        fields = {name.strip().lower(): name for name in (reader.fieldnames or [])}
+        time_col = next((fields[c] for c in _TIME_COLUMNS if c in fields), None)
+        price_col = next((fields[c] for c in _PRICE_COLUMNS if c in fields), None)
+        if time_col is None or price_col is None:
+            raise ValueError("intraday CSV needs a time column and a price column")
+        rows = [(row[time_col], row[price_col]) for row in reader]
+    return [(_to_micros(ts), float(price)) for ts, price in rows]
+
+
+_series: Optional[IntradaySeries] = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def get_intraday_series() -> Optional[IntradaySeries]:
+    """The BTC_INTRADAY_FILE series, loaded on first use; None if not configured."""
+    global _series, _loaded
+    if _loaded:
+        return _series
+    with _lock:
+        if not _loaded:
+            if BTC_INTRADAY_FILE:
+                try:
+                    with open(BTC_INTRADAY_FILE, "rb") as fh:
+                        _series = IntradaySeries(parse_intraday_file(fh.read(), BTC_INTRADAY_FILE))
+                    logger.info(f"[Prices] Loaded {len(_series)} intraday bars from {BTC_INTRADAY_FILE}.")
+                except (OSError, ValueError, KeyError, IndexError) as e:
+                    logger.warning(f"[Prices] Could not load BTC_INTRADAY_FILE {BTC_INTRADAY_FILE}: {e}")
+            _loaded = True
+    return _series
+
+
+def set_intraday_series(series: Optional[IntradaySeries]):
+    """Replace the loaded series (None: none configured)."""
+    global _series, _loaded
+    with _lock:
+        _series, _loaded = series, True
@@ -0,0 +1,243 @@
+"""
+backend/services/lot_math.py
+
+Integer core for FIFO lot arithmetic: BTC as satoshis, USD as cents.
+
+The lot logic used to run every proration through Decimal division,
+multiplication and quantize(Decimal("0.01"), ROUND_HALF_DOWN). Here those
+steps are exact integer arithmetic with the same rounding rule (half-down
+to the cent). Values convert to and from Decimal only at the edges:
+ - to_sats / to_cents when loading lots and transaction fields (rounded to
+   the Numeric(18, 8) / Numeric(18, 2) column scale, as SQLite stores them),
+ - btc / usd when writing columns back.
+
+Reproducing the Decimal results exactly:
+The old expressions round twice at 28 significant digits before the final
+quantize, so they can land on the other side of a half-cent from the exact
+value when the exact value sits within ~1e-27 (relative) of a tie. Each
+helper checks that distance with integers and, only in that case, evaluates
+the original Decimal expression instead. Everywhere else the exact integer
+answer is provably the one Decimal would give.
+"""
+
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_DOWN, ROUND_HALF_EVEN
+from typing import Optional
+
+SATS_PER_BTC = 100_000_000
+CENTS_PER_USD = 100
+
+_SAT = Decimal("0.00000001")
+_CENT = Decimal("0.01")
+
+# Bound on how far two 28-digit Decimal roundings can move a result,
+# scaled so the comparisons below stay in integers.
+_PRECISION_SCALE = 10 ** 27
+
+
+# ------------------------------------------------------------------------------
+# Conversions (persistence boundary)
+# ------------------------------------------------------------------------------
+def to_sats(value) -> int:
+    """
+    BTC amount (Decimal / str / int / None) => integer satoshis.
+    """
+    if value is None:
+        return 0
+    d = value if isinstance(value, Decimal) else Decimal(str(value))
+    return int(d.quantize(_SAT, rounding=ROUND_HALF_EVEN).scaleb(8))
+
+
+def to_cents(value) -> int:
+    """
+    USD amount (Decimal / str / int / None) => integer cents.
+    """
+    if value is None:
+        return 0
+    d = value if isinstance(value, Decimal) else Decimal(str(value))
+    return int(d.quantize(_CENT, rounding=ROUND_HALF_EVEN).scaleb(2))
+
+
+def btc(sats: int) -> Decimal:
+    """
+    Satoshis => Decimal BTC with 8 places.
+    """
+    return Decimal(sats).scaleb(-8)
+
+
+def usd(cents: int) -> Decimal:
+    """
+    Cents => Decimal USD with 2 places.
+    """
+    return Decimal(cents).scaleb(-2)
+
+
+def _decimal_cents(value: Decimal) -> int:
+    return int(value.quantize(_CENT, rounding=ROUND_HALF_DOWN).scaleb(2))
+
+
+# ------------------------------------------------------------------------------
+# Rounding
+# ------------------------------------------------------------------------------
+def _round_half_down(num: int, den: int) -> int:
+    """
+    num / den rounded to the nearest integer, ties toward zero.
+    """
+    q, r = divmod(abs(num), den)
+    if 2 * r > den:
+        q += 1
+    return q if num >= 0 else -q
+
+
+def _is_clear_of_tie(num: int, den: int, error: int) -> bool:
+    """
+    True if num / den is further from the nearest .5 than the Decimal error
+    bound `error` (expressed as error * den / _PRECISION_SCALE / 2).
+    """
+    r = abs(num) % den
+    return abs(2 * r - den) * _PRECISION_SCALE > error
+
+
+# ------------------------------------------------------------------------------
+# Prorations
+# ------------------------------------------------------------------------------
+def prorate_cost(cost_cents: int, part_sats: int, whole_sats: int) -> int:
+    """
+    Basis of `part_sats` out of a lot of `whole_sats` costing `cost_cents`:
+    ((cost / whole) * part).quantize(0.01, ROUND_HALF_DOWN), in cents.
+    """
+    if whole_sats <= 0:
+        return 0
+    num = cost_cents * part_sats
+    if _is_clear_of_tie(num, whole_sats, 10 * abs(num)):
+        return _round_half_down(num, whole_sats)
+    return _decimal_cents((usd(cost_cents) / btc(whole_sats)) * btc(part_sats))
+
+
+def prorate_proceeds(total_cents: int, part_sats: int, whole_sats: int) -> int:
+    """
+    Share of `total_cents` for `part_sats` out of `whole_sats`:
+    ((part / whole) * total).quantize(0.01, ROUND_HALF_DOWN), in cents.
+    """
+    if whole_sats <= 0:
+        return 0
+    num = total_cents * part_sats
+    if _is_clear_of_tie(num, whole_sats, 10 * abs(num)):
+        return _round_half_down(num, whole_sats)
+    return _decimal_cents((btc(part_sats) / btc(whole_sats)) * usd(total_cents))
+
+
+def prorate_proceeds_net_of_fee(total_cents: int, part_sats: int, whole_sats: int,
+                                fee_sats: int) -> int:
+    """
+    Like prorate_proceeds, after taking the BTC fee (valued at the implied
+    price total / whole) off the total:
+
+        net = total - fee * (total / whole)
+        ((part / whole) * net).quantize(0.01, ROUND_HALF_DOWN)
+    """
+    if whole_sats <= 0:
+        return 0
+    num = total_cents * part_sats * (whole_sats - fee_sats)
+    den = whole_sats * whole_sats
+    if _is_clear_of_tie(num, den, 20 * abs(total_cents * part_sats * whole_sats)):
+        return _round_half_down(num, den)
+    total = usd(total_cents)
+    whole = btc(whole_sats)
+    net = total - btc(fee_sats) * (total / whole)
+    if net < 0:
+        net = Decimal("0")
+    return _decimal_cents((btc(part_sats) / whole) * net)
+
+
+def value_cents(price_usd: Decimal, sats: int) -> int:
+    """
+    USD value of `sats` at `price_usd` per BTC, half-down to the cent.
+    Prices come from outside as arbitrary Decimals, so this stays Decimal.
+    """
+    return _decimal_cents(Decimal(price_usd) * btc(sats))
+
+
+def fraction_e8(part_sats: int, whole_sats: int) -> int:
+    """
+    (part / whole).quantize(0.00000001, ROUND_HALF_DOWN) as an integer
+    count of 1e-8 units.
+    """
+    num = part_sats * SATS_PER_BTC
+    if _is_clear_of_tie(num, whole_sats, 10 * abs(num)):
+        return _round_half_down(num, whole_sats)
+    ratio = (btc(part_sats) / btc(whole_sats)).quantize(_SAT, rounding=ROUND_HALF_DOWN)
+    return int(ratio.scaleb(8))
+
+
+def scale_cents_e8(cents: int, fraction: int) -> int:
+    """
+    (usd * fraction).quantize(0.01, ROUND_HALF_DOWN) for a fraction given in
+    1e-8 units. The Decimal product is exact at these magnitudes, so plain
+    integer rounding matches it.
+    """
+    return _round_half_down(cents * fraction, SATS_PER_BTC)
+
+
+def price_per_btc_cents(cents: int, sats: int) -> int:
+    """
+    (usd / btc).quantize(0.01, ROUND_HALF_DOWN): USD per BTC, in cents.
+    """
+    num = cents * SATS_PER_BTC
+    if _is_clear_of_tie(num, sats, 10 * abs(num)):
+        return _round_half_down(num, sats)
+    return _decimal_cents(usd(cents) / btc(sats))
+
+
+# ------------------------------------------------------------------------------
+# Lot record
+# ------------------------------------------------------------------------------
+class LotRecord:
+    """
+    A BitcoinLot in integer units. Used by the FIFO helpers for both the
+    per-transaction ORM path and the in-memory replay.
+    """
+    __slots__ = (
+        "id",
+        "created_txn_id",
+        "account_id",
+        "acquired_date",
+        "total_sats",
+        "remaining_sats",
+        "cost_cents",
+        "parent_lot_id",
+    )
+
+    def __init__(self, id: Optional[int], created_txn_id: Optional[int], account_id: Optional[int],
+                 acquired_date: datetime, total_sats: int, remaining_sats: int, cost_cents: int,
+                 parent_lot_id: Optional[int] = None):
+        self.id = id
+        self.created_txn_id = created_txn_id
+        self.account_id = account_id
+        self.acquired_date = acquired_date
+        self.total_sats = total_sats
+        self.remaining_sats = remaining_sats
+        self.cost_cents = cost_cents
+        self.parent_lot_id = parent_lot_id
+
+    @classmethod
+    def from_row(cls, lot) -> "LotRecord":
+        """
+        Build from a BitcoinLot row (Decimal columns).
+        """
+        return cls(
+            id=lot.id,
+            created_txn_id=lot.created_txn_id,
+            account_id=lot.account_id,
+            acquired_date=lot.acquired_date,
+            total_sats=to_sats(lot.total_btc),
+            remaining_sats=to_sats(lot.remaining_btc),
+            cost_cents=to_cents(lot.cost_basis_usd),
+            parent_lot_id=lot.parent_lot_id,
+        )
+
+    def __repr__(self):
+        return (
+            f"<LotRecord(id={self.id}, account={self.account_id}, "
+            f"remaining_sats={self.remaining_sats}/{self.total_sats}, cost_cents={self.cost_cents})>"
+        )
@@ -0,0 +1,594 @@
+"""
+backend/services/lot_replay.py
+
+In-memory FIFO replay engine behind recalculate_all_transactions.
+
+The ORM path (create_transaction_record) handles one transaction at a time
+and is happy to query lots and flush per step. A full re-lot replays the
+whole ledger, where that per-row round-tripping dominates: one db.get per
+account, a joined lot query per disposal and several flushes per row.
+
+The replay instead:
+ - loads every Transaction (one query) and every Account (one query),
+ - keeps the open lots of each BTC account in memory, in FIFO order, as
+   integer LotRecords (satoshis / cents, see lot_math.py),
+ - computes BitcoinLot / LotDisposal rows with the same helpers the ORM
+   path uses (backend/services/transaction.py), and
+ - writes them back with bulk INSERTs in a single flush.
+
+LedgerEntry rows are not part of the replay: they depend only on their own
+transaction and are written when it is created or edited.
+
+Lot ids are assigned here (max(id) + 1 onward, exactly what SQLite would
+hand out) so disposals can reference their lot without a round trip.
+
+Checkpoints: every CHECKPOINT_INTERVAL transactions the replay saves the
+remaining_btc of each open lot (LotCheckpoint). An edit at time T only
+invalidates checkpoints at or after T, so replay_transactions_since restores
+the nearest earlier checkpoint and replays forward from there; the cost of
+an edit follows the activity after it, not the size of the whole history.
+
+Closed tax years (backend/services/tax_year.py) leave a frozen checkpoint
+after their last transaction. Nothing before it can change any more, so it
+is never discarded and even a full re-lot starts from the newest one.
+
+A checkpoint stores lot ids. If the lot rows it names are gone (something
+outside the replay rebuilt lots before it, e.g. an older version of the
+app or a manual edit), resuming from it would be wrong; the replay then
+starts from scratch instead and re-snapshots the frozen checkpoints on the
+way. The tax report no longer rebuilds lots: its start-of-year holdings are
+read from the lot and disposal history (calculation.get_held_lots_as_of).
+"""
+
+import bisect
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session
+
+from backend.models.transaction import (
+    Transaction, BitcoinLot, LotDisposal, LotCheckpoint, LotCheckpointEntry,
+)
+from backend.services.intraday_prices import get_intraday_series
+from backend.services.lot_math import LotRecord, btc, usd, to_sats
+from backend.services.portfolio_summary import mark_summary_stale
+from backend.services.transaction import (
+    _acquired_lot_values,
+    _as_utc,
+    _apply_gross_sell_proceeds,
+    _apply_sell_summary,
+    _disposal_columns,
+    _disposal_outflow,
+    _dispose_lots_fifo,
+    _load_accounts,
+    _split_lots_for_transfer,
+    _tx_data_from_record,
+)
+from backend.services import transaction as tx_service
+
+logger = logging.getLogger(__name__)
+
+# Transactions between two saved lot checkpoints.
+CHECKPOINT_INTERVAL = 250
+
+# Keeps "IN (...)" lists well below SQLite's bound-parameter limit.
+_IN_CHUNK = 500
+
+
+def _fifo_key(lot: LotRecord):
+    return (lot.acquired_date, lot.id)
+
+
+class LotBook:
+    """
+    Open lots per account, oldest acquisition first (acquired_date, id) —
+    the same order the ORM path gets from its lot query.
+    """
+
+    def __init__(self):
+        self._open: Dict[int, List[LotRecord]] = defaultdict(list)
+
+    def add(self, lot: LotRecord):
+        bisect.insort(self._open[lot.account_id], lot, key=_fifo_key)
+
+    def open_lots(self, account_id: int) -> List[LotRecord]:
+        """
+        Lots with BTC left in `account_id`. FIFO consumption always empties
+        lots from the front, so trimming the exhausted prefix is enough.
+        """
+        lots = self._open.get(account_id)
+        if not lots:
+            return []
+        spent = 0
+        while spent < len(lots) and lots[spent].remaining_sats <= 0:
+            spent += 1
+        if spent:
+            del lots[:spent]
+        return lots
+
+    def snapshot(self) -> List[LotRecord]:
+        """
+        Every lot that still holds BTC, across all accounts.
+        """
+        return [lot for lots in self._open.values() for lot in lots if lot.remaining_sats > 0]
+
+
+def _replay_order(tx: Transaction):
+    return (_as_utc(tx.timestamp), tx.id)
+
+
+def _chunks(ids: List[int]):
+    for start in range(0, len(ids), _IN_CHUNK):
+        yield ids[start:start + _IN_CHUNK]
+
+
+class _ReplayWriter:
+    """
+    Collects the rows produced by a replay and bulk-inserts them at the end.
+    """
+
+    def __init__(self, next_lot_id: int):
+        self.next_lot_id = next_lot_id
+        self.lot_rows: List[LotRecord] = []
+        self.disposal_rows: List[dict] = []
+        # Lots restored from a checkpoint: they already exist, so only their
+        # final remaining_btc is written back.
+        self.restored_lots: List[LotRecord] = []
+        self.checkpoints: List[LotCheckpoint] = []
+
+    def new_lot(self, tx: Transaction, account_id: int, acquired_date: datetime,
+                sats: int, cost_cents: int,
+                parent: Optional[LotRecord] = None) -> LotRecord:
+        lot = LotRecord(
+            id=self.next_lot_id,
+            created_txn_id=tx.id,
+            account_id=account_id,
+            acquired_date=_as_utc(acquired_date),
+            total_sats=sats,
+            remaining_sats=sats,
+            cost_cents=cost_cents,
+            parent_lot_id=parent.id if parent is not None else None,
+        )
+        self.next_lot_id += 1
+        self.lot_rows.append(lot)
+        return lot
+
+    def add_disposals(self, tx: Transaction, disposals: List[dict]):
+        for disp in disposals:
+            row = _disposal_columns(disp)
+            row["lot_id"] = disp["lot"].id
+            row["transaction_id"] = tx.id
+            self.disposal_rows.append(row)
+
+    def add_checkpoint(self, tx: Transaction, tx_count: int, book: LotBook,
+                       frozen_year: Optional[int] = None):
+        self.checkpoints.append(LotCheckpoint(
+            as_of_timestamp=_as_utc(tx.timestamp),
+            as_of_txn_id=tx.id,
+            tx_count=tx_count,
+            frozen_year=frozen_year,
+            entries=[
+                LotCheckpointEntry(lot_id=lot.id, remaining_btc=btc(lot.remaining_sats))
+                for lot in book.snapshot()
+            ],
+        ))
+
+    def refresh_checkpoint(self, checkpoint: LotCheckpoint, tx_count: int, book: LotBook):
+        """
+        Re-snapshot an existing (frozen) checkpoint during a from-scratch
+        replay: same point in the ledger, new lot ids.
+        """
+        checkpoint.tx_count = tx_count
+        checkpoint.entries = [
+            LotCheckpointEntry(lot_id=lot.id, remaining_btc=btc(lot.remaining_sats))
+            for lot in book.snapshot()
+        ]
+
+    def flush(self, db: Session):
+        """
+        Write everything in one go, converting satoshis/cents back to the
+        Decimal columns. Lots are inserted with their final remaining_btc,
+        so no per-lot UPDATEs follow.
+        """
+        if self.lot_rows:
+            db.execute(insert(BitcoinLot), [
+                {
+                    "id": lot.id,
+                    "created_txn_id": lot.created_txn_id,
+                    "account_id": lot.account_id,
+                    "parent_lot_id": lot.parent_lot_id,
+                    "acquired_date": lot.acquired_date,
+                    "total_btc": btc(lot.total_sats),
+                    "remaining_btc": btc(lot.remaining_sats),
+                    "cost_basis_usd": usd(lot.cost_cents),
+                }
+                for lot in self.lot_rows
+            ])
+        if self.disposal_rows:
+            db.execute(insert(LotDisposal), self.disposal_rows)
+        if self.restored_lots:
+            db.execute(update(BitcoinLot), [
+                {"id": lot.id, "remaining_btc": btc(lot.remaining_sats)}
+                for lot in self.restored_lots
+            ])
+        db.add_all(self.checkpoints)
+        db.flush()
+
+
+def replay_transactions(
+    db: Session,
+    txs: List[Transaction],
+    book: LotBook,
+    writer: _ReplayWriter,
+    price_for: Optional[Callable[[datetime], Decimal]] = None,
+    tx_count: int = 0,
+    close_after: Optional[Tuple[int, int]] = None,
+    refreeze: Optional[Dict[int, List[LotCheckpoint]]] = None,
+):
+    """
+    Replay `txs` (already in timestamp, id order) against the open lots in
+    `book`, collecting lots and disposals in `writer`. Transaction-level
+    summary fields are updated on the ORM objects. Ledger lines are not
+    touched: they only change when their own transaction does.
+
+    `tx_count` is how many transactions precede txs[0]; a checkpoint is
+    queued whenever the running count hits a multiple of CHECKPOINT_INTERVAL.
+    `close_after` = (txn_id, year) queues the frozen checkpoint of a tax
+    year being closed right after that transaction. `refreeze` maps a
+    transaction id to existing frozen checkpoints taken right after it,
+    which are re-snapshotted in place.
+
+    Without `price_for`, transfer fees are priced up front (_fee_prices).
+    """
+    accounts = _load_accounts(db)
+    if price_for is None:
+        price_for = _fee_prices(db, txs)
+
+    for tx in txs:
+        _replay_one(tx, accounts, book, writer, price_for)
+        tx_count += 1
+        for checkpoint in (refreeze or {}).get(tx.id, ()):
+            writer.refresh_checkpoint(checkpoint, tx_count, book)
+        if close_after is not None and tx.id == close_after[0]:
+            writer.add_checkpoint(tx, tx_count, book, frozen_year=close_after[1])
+        elif tx_count % CHECKPOINT_INTERVAL == 0:
+            writer.add_checkpoint(tx, tx_count, book)
+
+
+def _fee_prices(db: Session, txs: List[Transaction]) -> Callable[[datetime], Decimal]:
+    """
+    Price every BTC transfer fee in `txs` before the FIFO loop runs, so the
+    loop itself never waits on the network. With an intraday series, all
+    fee timestamps are looked up in one sweep (nearest bar); the distinct
+    days of the rest are resolved in one batch (get_btc_prices). Returns
+    price_for(timestamp).
+    """
+    fee_times = [
+        tx.timestamp for tx in txs
+        if tx.type == "Transfer"
+        and (tx.fee_currency or "").upper() == "BTC"
+        and Decimal(tx.fee_amount or 0) > 0
+    ]
+    at_time: Dict[datetime, Decimal] = {}
+    intraday = get_intraday_series()
+    if intraday is not None and fee_times:
+        at_time = {
+            ts: price for ts, price in zip(fee_times, intraday.nearest_many(fee_times))
+            if price is not None
+        }
+    prices = tx_service.get_btc_prices({ts.date() for ts in fee_times if ts not in at_time}, db)
+
+    def price_for(ts: datetime) -> Decimal:
+        price = at_time.get(ts)
+        if price is None:
+            price = prices.get(ts.date())
+        return price if price is not None else tx_service.get_btc_price(ts, db)
+
+    return price_for
+
+
+def _replay_one(tx: Transaction, accounts: dict, book: LotBook, writer: _ReplayWriter, price_for):
+    tx_data = _tx_data_from_record(tx)
+    from_acct = accounts.get(tx.from_account_id)
+    to_acct = accounts.get(tx.to_account_id)
+
+    if tx.type in ("Deposit", "Buy"):
+        if not to_acct or to_acct.currency != "BTC":
+            return
+        acquisition = _acquired_lot_values(tx, tx_data)
+        if acquisition is None:
+            return
+        sats, cost_cents = acquisition
+        book.add(writer.new_lot(tx, to_acct.id, tx.timestamp, sats, cost_cents))
+
+    elif tx.type in ("Sell", "Withdrawal"):
+        if not from_acct or from_acct.currency != "BTC":
+            return
+        if tx.type == "Sell" and to_acct and to_acct.currency == "USD":
+            _apply_gross_sell_proceeds(tx, tx_data)
+        outflow_sats = _disposal_outflow(tx)
+        if outflow_sats <= 0:
+            return
+        disposals = _dispose_lots_fifo(tx, tx_data, book.open_lots(from_acct.id), outflow_sats)
+        if disposals:
+            _apply_sell_summary(tx, [
+                (d["basis_cents"], d["gain_cents"], d["proceeds_cents"], d["lot"].acquired_date)
+                for d in disposals
+            ])
+        writer.add_disposals(tx, disposals)
+
+    elif tx.type == "Transfer":
+        if not from_acct or not to_acct:
+            return
+        if from_acct.currency != "BTC" or to_acct.currency != "BTC":
+            return
+        split = _split_lots_for_transfer(tx, book.open_lots(from_acct.id), price_for)
+        if split is None:
+            return
+        fee_disposals, dest_lots = split
+        writer.add_disposals(tx, fee_disposals)
+        for dest in dest_lots:
+            book.add(writer.new_lot(
+                tx, to_acct.id, dest["acquired_date"],
+                dest["sats"], dest["cost_cents"], parent=dest["parent"],
+            ))
+
+
+def replay_all_transactions(db: Session, close_after: Optional[Tuple[int, int]] = None):
+    """
+    "Scorched Earth" re-lot of the entire ledger, computed in memory. Once a
+    tax year is closed, only the transactions after its frozen checkpoint
+    are re-lotted.
+    """
+    frozen = newest_frozen_checkpoint(db)
+    if frozen is not None:
+        replay_from_checkpoint(db, frozen, close_after)
+        return
+    replay_from_scratch(db, close_after)
+
+
+def replay_from_scratch(db: Session, close_after: Optional[Tuple[int, int]] = None):
+    """
+    Delete every lot and disposal and replay the whole ledger, ignoring
+    checkpoints. Ordinary checkpoints are dropped; frozen ones are kept and
+    re-snapshotted when the replay reaches their transaction.
+    """
+    db.flush()
+    checkpoints = db.query(LotCheckpoint).all()
+    frozen = [cp for cp in checkpoints if cp.frozen_year is not None]
+    stale = [cp for cp in checkpoints if cp.frozen_year is None]
+    _delete_checkpoints(db, [cp.id for cp in stale])
+    for cp in stale:
+        db.expunge(cp)
+    refreeze: Dict[int, List[LotCheckpoint]] = defaultdict(list)
+    for cp in frozen:
+        cp.entries = []
+        refreeze[cp.as_of_txn_id].append(cp)
+    db.flush()
+
+    db.query(LotDisposal).delete()
+    db.query(BitcoinLot).delete()
+    db.flush()
+    mark_summary_stale(db)
+
+    all_txs = (
+        db.query(Transaction)
+        .order_by(Transaction.timestamp.asc(), Transaction.id.asc())
+        .all()
+    )
+    all_txs.sort(key=_replay_order)
+    next_lot_id = (db.query(func.max(BitcoinLot.id)).scalar() or 0) + 1
+    writer = _ReplayWriter(next_lot_id)
+    replay_transactions(db, all_txs, LotBook(), writer, close_after=close_after, refreeze=refreeze)
+    writer.flush(db)
+
+    # Relationship collections loaded before the bulk insert are stale now.
+    for tx in all_txs:
+        db.expire(tx, ["bitcoin_lots_created", "lot_disposals"])
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, (BitcoinLot, LotDisposal)):
+            db.expire(obj)
+
+    logger.info(
+        f"[Replay] Re-lotted {len(all_txs)} transactions: {len(writer.lot_rows)} lots, "
+        f"{len(writer.disposal_rows)} disposals."
+    )
+
+
+def replay_transactions_since(db: Session, since: datetime):
+    """
+    Re-lot every transaction from `since` onward, starting from the newest
+    checkpoint taken strictly before `since`. Checkpoints at or after it are
+    discarded (they describe a history that no longer exists). Without a
+    usable checkpoint this is a full replay.
+    """
+    since = _as_utc(since)
+    db.flush()
+
+    checkpoints = db.query(LotCheckpoint).order_by(LotCheckpoint.tx_count.asc()).all()
+    usable = [cp for cp in checkpoints if _as_utc(cp.as_of_timestamp) < since]
+    if not usable:
+        replay_all_transactions(db)
+        return
+    replay_from_checkpoint(db, usable[-1])
+
+
+def replay_from_checkpoint(db: Session, base: LotCheckpoint,
+                           close_after: Optional[Tuple[int, int]] = None):
+    """
+    Restore the lot balances saved in `base` and re-lot every transaction
+    after it. Later checkpoints are discarded, except frozen ones.
+
+    Falls back to replay_from_scratch when a lot the checkpoint names no
+    longer exists: its entries no longer describe the lot table.
+    """
+    db.flush()
+    entry_count = (
+        db.query(func.count(LotCheckpointEntry.id))
+        .filter(LotCheckpointEntry.checkpoint_id == base.id)
+        .scalar()
+    )
+    live_count = (
+        db.query(func.count(LotCheckpointEntry.id))
+        .join(BitcoinLot, BitcoinLot.id == LotCheckpointEntry.lot_id)
+        .filter(LotCheckpointEntry.checkpoint_id == base.id)
+        .scalar()
+    )
+    if live_count != entry_count:
+        logger.warning(
+            f"[Replay] Checkpoint {base.id} names {entry_count - live_count} missing lot(s); "
+            f"replaying from scratch."
+        )
+        replay_from_scratch(db, close_after)
+        return
+
+    stale = (
+        db.query(LotCheckpoint)
+        .filter(LotCheckpoint.tx_count > base.tx_count, LotCheckpoint.frozen_year.is_(None))
+        .all()
+    )
+    _delete_checkpoints(db, [cp.id for cp in stale])
+    for cp in stale:
+        db.expunge(cp)
+
+    # Everything replayed sorts after the checkpoint's last transaction.
+    boundary = (_as_utc(base.as_of_timestamp), base.as_of_txn_id)
+    candidates = (
+        db.query(Transaction)
+        .filter(_not_before(Transaction.timestamp, boundary[0]))
+        .all()
+    )
+    txs = sorted((tx for tx in candidates if _replay_order(tx) > boundary), key=_replay_order)
+    tx_ids = [tx.id for tx in txs]
+
+    for chunk in _chunks(tx_ids):
+        db.query(LotDisposal).filter(LotDisposal.transaction_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(BitcoinLot).filter(BitcoinLot.created_txn_id.in_(chunk)).delete(synchronize_session=False)
+    db.flush()
+    mark_summary_stale(db, boundary[0])
+
+    # Lots created before the checkpoint keep their rows; only remaining_btc
+    # is rewound. Lots missing from the checkpoint were already used up then,
+    # and nothing later can raise their balance, so they stay at zero.
+    book = LotBook()
+    next_lot_id = (db.query(func.max(BitcoinLot.id)).scalar() or 0) + 1
+    writer = _ReplayWriter(next_lot_id)
+    restored = (
+        db.query(LotCheckpointEntry, BitcoinLot)
+        .join(BitcoinLot, BitcoinLot.id == LotCheckpointEntry.lot_id)
+        .filter(LotCheckpointEntry.checkpoint_id == base.id)
+        .all()
+    )
+    for entry, lot in restored:
+        replay_lot = LotRecord.from_row(lot)
+        replay_lot.acquired_date = _as_utc(lot.acquired_date)
+        replay_lot.remaining_sats = to_sats(entry.remaining_btc)
+        book.add(replay_lot)
+        writer.restored_lots.append(replay_lot)
+
+    replay_transactions(db, txs, book, writer, tx_count=base.tx_count, close_after=close_after)
+    writer.flush(db)
+
+    for tx in txs:
+        db.expire(tx, ["bitcoin_lots_created", "lot_disposals"])
+    # Lot rows were rewritten behind the session's back.
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, (BitcoinLot, LotDisposal)):
+            db.expire(obj)
+
+    logger.info(
+        f"[Replay] Resumed from checkpoint {base.id} (after {base.tx_count} transactions): "
+        f"re-lotted {len(txs)} transactions, {len(writer.lot_rows)} lots, "
+        f"{len(writer.disposal_rows)} disposals."
+    )
+
+
+def record_checkpoint_if_due(db: Session, latest_tx: Transaction):
+    """
+    Appending a transaction (the common case) never replays, so no
+    checkpoint would ever be written by the replay itself. Snapshot the
+    live lot table once CHECKPOINT_INTERVAL transactions have accumulated
+    since the last checkpoint. `latest_tx` must sort last in the ledger.
+    """
+    last = db.query(func.max(LotCheckpoint.tx_count)).scalar() or 0
+    tx_count = db.query(func.count(Transaction.id)).scalar() or 0
+    if tx_count - last < CHECKPOINT_INTERVAL:
+        return
+    db.flush()
+    open_lots = (
+        db.query(BitcoinLot.id, BitcoinLot.remaining_btc)
+        .filter(BitcoinLot.remaining_btc > 0)
+        .all()
+    )
+    db.add(LotCheckpoint(
+        as_of_timestamp=_as_utc(latest_tx.timestamp),
+        as_of_txn_id=latest_tx.id,
+        tx_count=tx_count,
+        entries=[
+            LotCheckpointEntry(lot_id=lot_id, remaining_btc=remaining)
+            for lot_id, remaining in open_lots
+        ],
+    ))
+    db.flush()
+
+
+def newest_frozen_checkpoint(db: Session) -> Optional[LotCheckpoint]:
+    """
+    The frozen checkpoint of the latest closed tax year, if any.
+    """
+    return (
+        db.query(LotCheckpoint)
+        .filter(LotCheckpoint.frozen_year.isnot(None))
+        .order_by(LotCheckpoint.frozen_year.desc())
+        .first()
+    )
+
+
+def delete_all_checkpoints(db: Session):
+    """
+    Drop every saved checkpoint (full re-lot or wiping the ledger).
+    """
+    db.query(LotCheckpointEntry).delete()
+    db.query(LotCheckpoint).delete()
+
+
+def _delete_checkpoints(db: Session, checkpoint_ids: List[int]):
+    for chunk in _chunks(checkpoint_ids):
+        db.query(LotCheckpointEntry).filter(
+            LotCheckpointEntry.checkpoint_id.in_(chunk)
+        ).delete(synchronize_session=False)
+        db.query(LotCheckpoint).filter(LotCheckpoint.id.in_(chunk)).delete(synchronize_session=False)
+
+
+def _not_before(column, ts: datetime):
+    """
+    SQL pre-filter for `column >= ts` on UTCDateTime columns. Stored values
+    are ISO strings whose fractional-second part is optional, so a plain
+    string comparison can misorder values within the same second. Comparing
+    against the whole second before `ts` keeps every qualifying row; the
+    caller does the exact comparison in Python.
+    """
+    floor = _as_utc(ts).replace(microsecond=0) - timedelta(seconds=1)
+    return column > floor
+
+
+def _not_after(column, ts: datetime):
+    """
+    SQL pre-filter for `column <= ts`, widened by whole seconds like
+    _not_before; the caller does the exact comparison in Python.
+    """
+    ceiling = _as_utc(ts).replace(microsecond=0) + timedelta(seconds=2)
+    return column < ceiling
+
+
+def _surely_before(column, ts: datetime):
+    """
+    SQL filter for the rows _not_before(column, ts) leaves out: every one of
+    them is strictly before `ts`, so no Python check is needed.
+    """
+    floor = _as_utc(ts).replace(microsecond=0) - timedelta(seconds=1)
+    return column <= floor
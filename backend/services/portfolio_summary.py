@@ -0,0 +1,421 @@
+"""
+backend/services/portfolio_summary.py
+
+Keeps the materialized PortfolioSummary rows (backend/models/portfolio_summary.py)
+in step with the ledger, lots and disposals they summarize, so the
+/api/calculations/* endpoints read O(accounts x years) rows instead of
+aggregating every ledger line and disposal on each request.
+
+How the rows stay current (sessions from database.SessionLocal only; the
+listeners are bound to it, not to every Session in the process):
+ - ORM writes are noticed automatically: after every flush, the years of the
+   Transaction / LedgerEntry / LotDisposal rows it touched are recorded on
+   the session, and for BitcoinLot writes the acquisition years whose held
+   totals they change.
+ - Set-based writes that bypass the ORM (the lot replay's bulk INSERTs,
+   DELETE ... WHERE transaction_id IN (...)) call mark_summary_stale()
+   with the earliest timestamp they rewrote: a re-lot from there may change
+   the realized gains of every later year and any lot's remaining BTC.
+ - Right before the session commits, only the marked years are rebuilt
+   with grouped SQL aggregates restricted to those years (range tests on
+   the indexed timestamps), and the held BTC and cost basis only of the
+   marked acquisition years. An append therefore costs one year's rows,
+   however long the history after it. This happens inside the transaction
+   being committed; a rollback discards the marks with it.
+
+Every sum runs over integer cents / satoshis (lot_math.py), so totals read
+from the summary equal the ones computed from the raw rows.
+
+At startup (database.create_tables) the table is filled only when it is
+empty, e.g. for databases written before it existed.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+from itertools import chain
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import Integer, String, and_, case, cast, distinct, event, func, insert, inspect, literal, or_, true, update
+from sqlalchemy.orm import Session
+
+from backend.database import SessionLocal
+from backend.models.portfolio_summary import PortfolioSummary
+from backend.models.transaction import Transaction, LedgerEntry, LotDisposal, BitcoinLot
+from backend.services.lot_math import (
+    CENTS_PER_USD,
+    SATS_PER_BTC,
+    btc,
+    usd,
+    to_sats,
+    to_cents,
+    fraction_e8,
+    scale_cents_e8,
+)
+
+logger = logging.getLogger(__name__)
+
+_STALE = "btctx_portfolio_summary_stale"
+
+NO_HOLDING_PERIOD = "N/A"
+
+# Keeps "IN (...)" lists well below SQLite's bound-parameter limit.
+_IN_CHUNK = 500
+
+_DEPOSIT_SOURCES = {"income": "income", "interest": "interest", "reward": "rewards", "gift": "gifts"}
+
+_VALUE_COLUMNS = (
+    "balance", "held_btc", "held_cost_usd",
+    "realized_gains_usd", "realized_losses_usd",
+    "sells_proceeds_usd", "withdrawals_spent_usd",
+    "income_usd", "interest_usd", "rewards_usd", "gifts_usd",
+    "income_btc", "interest_btc", "rewards_btc", "gifts_btc",
+    "fees_usd", "fees_btc",
+)
+
+# (account_id, year, holding_period) => {column: Decimal}
+SummaryRows = Dict[Tuple[Optional[int], int, str], Dict[str, object]]
+
+
+def units(column, per_unit: int):
+    """
+    SQL expression: a Numeric column as an integer count of 1/per_unit units
+    (cents or satoshis), so sums are exact like the lot math.
+    """
+    return cast(func.round(column * per_unit), Integer)
+
+
+def year_of(column):
+    """SQL expression: UTC year of a UTCDateTime column (stored as ISO text)."""
+    return cast(func.substr(column, 1, 4), Integer)
+
+
+def _in_years(column, years: Optional[Iterable[int]]):
+    """
+    SQL: a UTCDateTime column (ISO text) falls in one of `years` (None: any
+    year). Written as ranges over the text ("2023" <= value < "2024"), so an
+    index on the column applies; consecutive years share one range.
+    """
+    if years is None:
+        return true()
+    ranges = []
+    for year in sorted(years):
+        if ranges and ranges[-1][1] == year:
+            ranges[-1][1] = year + 1
+        else:
+            ranges.append([year, year + 1])
+    return or_(*(
+        and_(column >= literal(f"{lo:04d}", String), column < literal(f"{hi:04d}", String))
+        for lo, hi in ranges
+    ))
+
+
+# ------------------------------------------------------------------------------
+# Change tracking
+# ------------------------------------------------------------------------------
+def _state(db: Session) -> dict:
+    return db.info.setdefault(_STALE, {
+        "all": False, "years": set(), "from_year": None, "tx_ids": set(),
+        "held_all": False, "held_years": set(),
+    })
+
+
+def mark_summary_stale(db: Session, since: Optional[datetime] = None):
+    """
+    Totals from `since`'s year onward (None: every year), and the held BTC
+    of every lot, are rebuilt when `db` commits. For writes the ORM does not
+    see (bulk INSERT / DELETE).
+    """
+    state = _state(db)
+    state["held_all"] = True
+    if since is None:
+        state["all"] = True
+    elif state["from_year"] is None or since.year < state["from_year"]:
+        state["from_year"] = since.year
+
+
+def _year_value(value) -> Optional[int]:
+    if isinstance(value, datetime):
+        return value.year
+    if isinstance(value, str) and value[:4].isdigit():
+        return int(value[:4])
+    return None
+
+
+def _history_years(obj, attr: str) -> Set[int]:
+    history = getattr(inspect(obj).attrs, attr).history
+    years = {_year_value(v) for v in chain(history.added, history.unchanged, history.deleted)}
+    years.discard(None)
+    return years
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_flush(session: Session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Transaction):
+            state = inspect(obj)
+            years = _history_years(obj, "timestamp")
+            if years:
+                _state(session)["years"].update(years)
+            elif obj in session.deleted or state.identity is None:
+                _state(session)["all"] = True
+            else:
+                _state(session)["tx_ids"].add(state.identity[0])
+        elif isinstance(obj, (LedgerEntry, LotDisposal)):
+            tx_id = inspect(obj).dict.get("transaction_id")
+            if tx_id is None:
+                _state(session)["all"] = True
+            else:
+                _state(session)["tx_ids"].add(tx_id)
+        elif isinstance(obj, BitcoinLot):
+            years = _history_years(obj, "acquired_date")
+            if years:
+                _state(session)["held_years"].update(years)
+            else:
+                _state(session)["held_all"] = True
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _refresh_before_commit(session: Session):
+    # Commit flushes after this hook; flush now so the pending writes are seen.
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    if _STALE not in session.info:
+        return
+    state = session.info.pop(_STALE)
+    if state["all"]:
+        refresh_portfolio_summary(session)
+        return
+    years = set(state["years"])
+    tx_ids = sorted(state["tx_ids"])
+    for start in range(0, len(tx_ids), _IN_CHUNK):
+        years.update(
+            year for (year,) in
+            session.query(distinct(year_of(Transaction.timestamp)))
+                   .filter(Transaction.id.in_(tx_ids[start:start + _IN_CHUNK]))
+        )
+    if state["from_year"] is not None:
+        years.update(range(state["from_year"], _last_year(session) + 1))
+    held_years = None if state["held_all"] else state["held_years"] | years
+    _rebuild_years(session, years, held_years)
+    session.info.pop(_STALE, None)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_after_rollback(session: Session):
+    session.info.pop(_STALE, None)
+
+
+# ------------------------------------------------------------------------------
+# Rebuild
+# ------------------------------------------------------------------------------
+def refresh_portfolio_summary(db: Session, from_year: Optional[int] = None):
+    """
+    Rebuild the totals of every year from `from_year` on (None: all years)
+    from the raw rows, plus the held BTC of every year. Does not commit.
+    """
+    if from_year is None:
+        db.query(PortfolioSummary).delete(synchronize_session=False)
+        _write_rows(db, _flow_totals(db, None), None)
+    else:
+        _rebuild_years(db, set(range(from_year, _last_year(db) + 1)), None)
+
+
+def _last_year(db: Session) -> int:
+    """Latest year with a transaction or a summary row (0 if neither)."""
+    newest = db.query(func.max(Transaction.timestamp)).scalar()
+    summary_year = db.query(func.max(PortfolioSummary.year)).scalar()
+    return max(newest.year if newest is not None else 0, summary_year or 0)
+
+
+def _rebuild_years(db: Session, years: Set[int], held_years: Optional[Set[int]]):
+    """
+    Replace the rows of `years` with totals rebuilt from the raw rows of
+    those years only, and reset the held totals of `held_years` (None:
+    every year; must include `years`).
+    """
+    if years:
+        db.query(PortfolioSummary).filter(PortfolioSummary.year.in_(sorted(years))).delete(
+            synchronize_session=False
+        )
+    _write_rows(db, _flow_totals(db, years) if years else {}, held_years)
+
+
+def _flow_totals(db: Session, years: Optional[Set[int]]) -> SummaryRows:
+    """Per (account, year, holding period) totals of the transactions of `years` (None: all)."""
+    rows: SummaryRows = defaultdict(dict)
+    tx_year = year_of(Transaction.timestamp)
+    since = _in_years(Transaction.timestamp, years)
+
+    # Net ledger amount per account
+    ledger = (
+        db.query(LedgerEntry.account_id, tx_year, func.sum(units(LedgerEntry.amount, SATS_PER_BTC)))
+          .join(Transaction, Transaction.id == LedgerEntry.transaction_id)
+          .filter(since)
+          .group_by(LedgerEntry.account_id, tx_year)
+          .all()
+    )
+    for account_id, year, sats in ledger:
+        rows[(account_id, year, NO_HOLDING_PERIOD)]["balance"] = btc(sats or 0)
+
+    # Realized gains by the disposed lot's account, holding period and sign
+    missing_period = or_(LotDisposal.holding_period.is_(None), LotDisposal.holding_period == "")
+    missing = (
+        db.query(LotDisposal.id)
+          .join(Transaction, Transaction.id == LotDisposal.transaction_id)
+          .filter(missing_period, since)
+          .all()
+    )
+    for (disposal_id,) in missing:
+        logger.warning(
+            f"LotDisposal ID={disposal_id} has no holding_period; defaulting to SHORT in aggregator."
+        )
+    is_short = or_(missing_period, func.upper(LotDisposal.holding_period) == "SHORT")
+    period = case((is_short, "SHORT"), else_="LONG")
+    is_gain = LotDisposal.realized_gain_usd > 0
+    gains = (
+        db.query(
+            BitcoinLot.account_id, tx_year, period, is_gain,
+            func.sum(units(LotDisposal.realized_gain_usd, CENTS_PER_USD)),
+        )
+        .select_from(LotDisposal)
+        .join(Transaction, Transaction.id == LotDisposal.transaction_id)
+        .outerjoin(BitcoinLot, BitcoinLot.id == LotDisposal.lot_id)
+        .filter(LotDisposal.realized_gain_usd != 0, since)
+        .group_by(BitcoinLot.account_id, tx_year, period, is_gain)
+        .all()
+    )
+    for account_id, year, holding_period, gain, cents in gains:
+        column = "realized_gains_usd" if gain else "realized_losses_usd"
+        rows[(account_id, year, holding_period)][column] = usd(abs(cents or 0))
+
+    # Sell proceeds and spent withdrawals, by the account they leave
+    tx_type = func.lower(Transaction.type)
+    proceeds_cents = units(Transaction.proceeds_usd, CENTS_PER_USD)
+    proceeds = (
+        db.query(
+            Transaction.from_account_id, tx_year,
+            func.sum(case((tx_type == "sell", proceeds_cents))),
+            func.sum(case((
+                and_(tx_type == "withdrawal", func.lower(Transaction.purpose) == "spent"),
+                proceeds_cents,
+            ))),
+        )
+        .filter(tx_type.in_(("sell", "withdrawal")), Transaction.proceeds_usd.isnot(None), since)
+        .group_by(Transaction.from_account_id, tx_year)
+        .all()
+    )
+    for account_id, year, sells_cents, spent_cents in proceeds:
+        row = rows[(account_id, year, NO_HOLDING_PERIOD)]
+        row["sells_proceeds_usd"] = usd(sells_cents or 0)
+        row["withdrawals_spent_usd"] = usd(spent_cents or 0)
+
+    # Deposits by source, by the account they arrive in
+    source = func.lower(Transaction.source)
+    deposits = (
+        db.query(
+            Transaction.to_account_id, tx_year, source,
+            func.sum(case((Transaction.cost_basis_usd > 0, units(Transaction.cost_basis_usd, CENTS_PER_USD)))),
+            func.sum(case((Transaction.amount > 0, units(Transaction.amount, SATS_PER_BTC)))),
+        )
+        .filter(
+            tx_type == "deposit",
+            source.in_(tuple(_DEPOSIT_SOURCES)),
+            Transaction.cost_basis_usd.isnot(None),
+            Transaction.amount.isnot(None),
+            since,
+        )
+        .group_by(Transaction.to_account_id, tx_year, source)
+        .all()
+    )
+    for account_id, year, src, cents, sats in deposits:
+        row = rows[(account_id, year, NO_HOLDING_PERIOD)]
+        row[f"{_DEPOSIT_SOURCES[src]}_usd"] = usd(cents or 0)
+        row[f"{_DEPOSIT_SOURCES[src]}_btc"] = btc(sats or 0)
+
+    # Fees by currency. fee_amount has 8 decimals for either currency; USD
+    # fees are kept at that scale and only rounded to cents when reported.
+    currency = func.lower(Transaction.fee_currency)
+    fee_account = func.coalesce(Transaction.from_account_id, Transaction.to_account_id)
+    fees = (
+        db.query(fee_account, tx_year, currency, func.sum(units(Transaction.fee_amount, SATS_PER_BTC)))
+          .filter(Transaction.fee_amount.isnot(None), currency.in_(("usd", "btc")), since)
+          .group_by(fee_account, tx_year, currency)
+          .all()
+    )
+    for account_id, year, fee_currency, fee_units in fees:
+        rows[(account_id, year, NO_HOLDING_PERIOD)][f"fees_{fee_currency}"] = btc(fee_units or 0)
+
+    return rows
+
+
+def _held_totals(db: Session, years: Optional[Set[int]]) -> Dict[Tuple[Optional[int], int], Tuple[int, int]]:
+    """
+    (account, acquisition year) => (satoshis, cost cents) still held in
+    open lots acquired in `years` (None: any year). Each lot's leftover cost
+    is its cost times the fraction still held, rounded like
+    get_average_cost_basis always has.
+    """
+    held: Dict[Tuple[Optional[int], int], Tuple[int, int]] = {}
+    lots = (
+        db.query(
+            BitcoinLot.account_id, BitcoinLot.acquired_date,
+            BitcoinLot.total_btc, BitcoinLot.remaining_btc, BitcoinLot.cost_basis_usd,
+        )
+        .filter(BitcoinLot.remaining_btc > 0, _in_years(BitcoinLot.acquired_date, years))
+        .all()
+    )
+    for account_id, acquired_date, total_btc, remaining_btc, cost_basis_usd in lots:
+        total_sats = to_sats(total_btc)
+        if total_sats <= 0:
+            continue
+        remaining_sats = to_sats(remaining_btc)
+        fraction_left = fraction_e8(remaining_sats, total_sats)
+        leftover_cents = scale_cents_e8(to_cents(cost_basis_usd), fraction_left)
+        key = (account_id, acquired_date.year)
+        sats, cents = held.get(key, (0, 0))
+        held[key] = (sats + remaining_sats, cents + leftover_cents)
+    return held
+
+
+def _write_rows(db: Session, rows: SummaryRows, held_years: Optional[Set[int]]):
+    """
+    Insert the rebuilt `rows` and set the held totals of `held_years`
+    (None: every year): rows kept from other years are updated in place,
+    missing ones inserted.
+    """
+    rows = defaultdict(dict, rows)
+    updates = []
+    if held_years is None or held_years:
+        kept = PortfolioSummary.holding_period == NO_HOLDING_PERIOD
+        if held_years is not None:
+            kept = and_(kept, PortfolioSummary.year.in_(sorted(held_years)))
+        db.query(PortfolioSummary).filter(kept).update(
+            {PortfolioSummary.held_btc: 0, PortfolioSummary.held_cost_usd: 0},
+            synchronize_session=False,
+        )
+        existing = {
+            (account_id, year): row_id
+            for row_id, account_id, year in (
+                db.query(PortfolioSummary.id, PortfolioSummary.account_id, PortfolioSummary.year)
+                  .filter(kept)
+                  .all()
+            )
+        }
+        for (account_id, year), (sats, cents) in _held_totals(db, held_years).items():
+            values = {"held_btc": btc(sats), "held_cost_usd": usd(cents)}
+            row_id = existing.get((account_id, year))
+            if row_id is not None:
+                updates.append({"id": row_id, **values})
+            else:
+                rows[(account_id, year, NO_HOLDING_PERIOD)].update(values)
+
+    if updates:
+        db.execute(update(PortfolioSummary), updates)
+    if rows:
+        zero = dict.fromkeys(_VALUE_COLUMNS, 0)
+        db.execute(insert(PortfolioSummary), [
+            {**zero, **values, "account_id": account_id, "year": year, "holding_period": holding_period}
+            for (account_id, year, holding_period), values in rows.items()
+        ])
+    db.flush()
@@ -0,0 +1,152 @@
+"""
+backend/services/portfolio_timeseries.py
+
+Daily BTC holdings, cost basis, market value and unrealized gain over time,
+for /api/calculations/portfolio/timeseries.
+
+One sweep: the lot history (lots appearing, and disposals and transfers
+taking from them) is read as a single time-ordered list of
+(time, lot, change in satoshis) events, and walked once alongside the
+daily price series (price_series.get_daily_series). Each day's point is the
+state after that day's last event, valued at that day's price.
+
+Held cost is each open lot's leftover share of its cost basis (lot_math,
+the same rounding as /average-cost-basis), kept as a running total that is
+adjusted only for the lot an event touches. A day therefore costs only its
+own events, and multi-year windows are a few thousand integer steps.
+Long windows are downsampled (LTTB on the market value).
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from backend.models.transaction import Transaction, BitcoinLot, LotDisposal
+from backend.services import price_series, price_store
+from backend.services.downsample import lttb
+from backend.services.lot_math import (
+    btc,
+    usd,
+    to_sats,
+    to_cents,
+    fraction_e8,
+    scale_cents_e8,
+    value_cents,
+)
+from backend.services.lot_replay import _not_after
+
+# (time, lot id, change in the lot's remaining satoshis)
+Event = Tuple[datetime, int, int]
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+
+
+def _lot_history(db: Session, until: datetime) -> Tuple[Dict[int, Tuple[int, int]], List[Event]]:
+    """
+    ({lot id: (total sats, cost basis cents)}, events oldest first) for the
+    lot history before `until`. A transfer shows as its child lot appearing
+    and the same amount leaving the lot it was split from.
+    """
+    lots: Dict[int, Tuple[int, int]] = {}
+    events: List[Event] = []
+    created = (
+        db.query(
+            BitcoinLot.id, BitcoinLot.parent_lot_id, BitcoinLot.total_btc,
+            BitcoinLot.cost_basis_usd, Transaction.timestamp,
+        )
+        .join(Transaction, Transaction.id == BitcoinLot.created_txn_id)
+        .filter(_not_after(Transaction.timestamp, until))
+    )
+    for lot_id, parent_id, total_btc, cost_basis_usd, ts in created:
+        total_sats = to_sats(total_btc)
+        lots[lot_id] = (total_sats, to_cents(cost_basis_usd))
+        events.append((ts, lot_id, total_sats))
+        if parent_id is not None:
+            events.append((ts, parent_id, -total_sats))
+
+    disposed = (
+        db.query(LotDisposal.lot_id, LotDisposal.disposed_btc, Transaction.timestamp)
+        .join(Transaction, Transaction.id == LotDisposal.transaction_id)
+        .filter(_not_after(Transaction.timestamp, until))
+    )
+    for lot_id, disposed_btc, ts in disposed:
+        events.append((ts, lot_id, -to_sats(disposed_btc)))
+
+    events.sort(key=lambda event: event[0])
+    return lots, events
+
+
+def _sweep(
+    lots: Dict[int, Tuple[int, int]],
+    events: List[Event],
+    prices: List[Tuple[date, float]],
+) -> List[Dict]:
+    """One pass over events and prices, both oldest first: a point per priced day."""
+    remaining: Dict[int, int] = {}
+    held_sats = held_cents = 0
+
+    def leftover_cents(lot_id: int) -> int:
+        total_sats, cost_cents = lots[lot_id]
+        rem = remaining.get(lot_id, 0)
+        if rem <= 0 or total_sats <= 0:
+            return 0
+        return scale_cents_e8(cost_cents, fraction_e8(rem, total_sats))
+
+    results = []
+    i = 0
+    for day, price in prices:
+        day_end = _day_start(day + timedelta(days=1))
+        while i < len(events) and events[i][0] < day_end:
+            _, lot_id, change = events[i]
+            held_cents -= leftover_cents(lot_id)
+            remaining[lot_id] = remaining.get(lot_id, 0) + change
+            held_sats += change
+            held_cents += leftover_cents(lot_id)
+            i += 1
+
+        market_cents = value_cents(Decimal(repr(price)), held_sats)
+        results.append({
+            "time": int(_day_start(day).timestamp() * 1000),
+            "price": price,
+            "holdings_btc": float(btc(held_sats)),
+            "cost_basis_usd": float(usd(held_cents)),
+            "value_usd": float(usd(market_cents)),
+            "unrealized_gain_usd": float(usd(market_cents - held_cents)),
+        })
+    return results
+
+
+async def get_portfolio_timeseries(
+    db: Session,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    points: Optional[int] = None,
+) -> List[Dict]:
+    """
+    Daily portfolio points for start..end (default: the first lot's day
+    through the last closed day), each:
+      { time (UTC midnight, ms), price, holdings_btc, cost_basis_usd,
+        value_usd, unrealized_gain_usd }
+    Days without a price are left out. With `points`, the series is
+    downsampled (LTTB on value_usd) to at most that many points.
+    """
+    end = end or price_store.last_closed_day()
+    lots, events = await run_in_threadpool(_lot_history, db, _day_start(end + timedelta(days=1)))
+    if start is None:
+        if not events:
+            return []
+        start = events[0][0].date()
+    if start > end:
+        return []
+
+    prices = await price_series.get_daily_series(start, end, db)
+    results = _sweep(lots, events, prices)
+    if points:
+        kept = {x for x, _ in lttb([(row["time"], row["value_usd"]) for row in results], points)}
+        results = [row for row in results if row["time"] in kept]
+    return results
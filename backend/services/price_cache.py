@@ -0,0 +1,116 @@
+"""
+backend/services/price_cache.py
+
+In-process cache for the live values the dashboard polls: the current BTC
+price (/api/bitcoin/price) and block height (/api/bitcoin/blockheight).
+
+Each LiveCache holds one value:
+ - younger than `ttl`: served as is, no upstream call,
+ - older, but within `ttl + max_stale`: served as is (stale) while a single
+   background refresh runs on the shared price client's loop,
+ - missing or older than that: the caller waits for the refresh. Concurrent
+   callers share that one refresh.
+
+A failed background refresh keeps the old value; a failed blocking one
+raises its error (HTTP 502) to every waiting caller.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from backend.services.price_client import get_price_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds a live price / block height is served without refreshing.
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "30"))
+BLOCKHEIGHT_CACHE_TTL = float(os.getenv("BLOCKHEIGHT_CACHE_TTL", "60"))
+# Seconds past the TTL a value may still be served while it refreshes.
+LIVE_CACHE_MAX_STALE = float(os.getenv("LIVE_CACHE_MAX_STALE", "600"))
+
+
+class LiveCache:
+    """
+    One cached value with TTL and stale-while-revalidate. `fetch` is an
+    async callable returning the fresh value.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[], Awaitable[Any]], ttl: float, max_stale: float = LIVE_CACHE_MAX_STALE):
+        self.name = name
+        self._fetch = fetch
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._value: Any = None
+        self._fetched_at: Optional[float] = None
+        self._refresh: Optional[concurrent.futures.Future] = None
+        self._lock = threading.Lock()
+
+    def age(self) -> Optional[float]:
+        """Seconds since the cached value was fetched, or None if empty."""
+        fetched_at = self._fetched_at
+        return None if fetched_at is None else time.monotonic() - fetched_at
+
+    async def get(self) -> Tuple[Any, float]:
+        """
+        (value, age in seconds). Only waits on the network when there is no
+        value young enough to serve.
+        """
+        with self._lock:
+            age = self.age()
+            if age is not None and age < self.ttl + self.max_stale:
+                if age >= self.ttl:
+                    self._start_refresh()
+                return self._value, age
+            refresh = self._start_refresh()
+        # shield: a caller that disconnects must not cancel the shared refresh
+        await asyncio.shield(asyncio.wrap_future(refresh))
+        return self._value, self.age()
+
+    def clear(self):
+        with self._lock:
+            self._value = None
+            self._fetched_at = None
+
+    def _start_refresh(self) -> concurrent.futures.Future:
+        """Start a refresh unless one is in flight (caller holds the lock)."""
+        if self._refresh is None or self._refresh.done():
+            self._refresh = get_price_client().submit(self._run_refresh())
+            self._refresh.add_done_callback(self._log_failure)
+        return self._refresh
+
+    async def _run_refresh(self):
+        value = await self._fetch()
+        with self._lock:
+            self._value = value
+            self._fetched_at = time.monotonic()
+        return value
+
+    def _log_failure(self, future: concurrent.futures.Future):
+        if not future.cancelled() and future.exception() is not None:
+            detail = getattr(future.exception(), "detail", future.exception())
+            logger.warning(f"[LiveCache] Refreshing {self.name} failed: {detail}")
+
+
+def _current_price():
+    from backend.services.bitcoin import get_current_price
+    return get_current_price()
+
+
+def _block_height():
+    from backend.services.bitcoin import get_block_height
+    return get_block_height()
+
+
+current_price_cache = LiveCache("price", _current_price, ttl=PRICE_CACHE_TTL)
+block_height_cache = LiveCache("blockheight", _block_height, ttl=BLOCKHEIGHT_CACHE_TTL)
+
+
+async def cached_response(cache: LiveCache) -> dict:
+    """The cached value as an API response, with its age."""
+    value, age = await cache.get()
+    return {**value, "cache_age_seconds": round(age, 1)}
@@ -0,0 +1,190 @@
+"""
+backend/services/price_client.py
+
+One long-lived HTTP client for every price / block-height API call.
+
+The client is an httpx.AsyncClient with a keep-alive connection pool, so
+repeated lookups reuse open TLS connections instead of handshaking each
+time. It lives on its own event loop in a dedicated thread, which makes it
+usable from everywhere the app needs a price:
+
+ - async code (route handlers in bitcoin.py) awaits PriceClient.call(),
+   which hands the request to the client's loop,
+ - sync code (get_btc_price inside sync SQLAlchemy handlers, the background
+   re-lot worker, reports) blocks on PriceClient.run(), a thread-safe
+   facade that needs no executor or event loop of its own.
+
+Lookups in bitcoin.py pass a key such as ("history", day), so concurrent
+callers needing the same value share one in-flight fetch.
+
+The app lifespan (backend/main.py) starts and closes it. Outside the app
+(tests, scripts) get_price_client() starts one on first use.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Per-request timeout for price APIs (seconds).
+PRICE_HTTP_TIMEOUT = float(os.getenv("PRICE_HTTP_TIMEOUT", "10"))
+# Pool size; idle connections are kept open for PRICE_HTTP_KEEPALIVE seconds.
+PRICE_HTTP_MAX_CONNECTIONS = int(os.getenv("PRICE_HTTP_MAX_CONNECTIONS", "10"))
+PRICE_HTTP_KEEPALIVE = float(os.getenv("PRICE_HTTP_KEEPALIVE", "60"))
+
+_client: Optional["PriceClient"] = None
+_client_lock = threading.Lock()
+
+
+class PriceClient:
+    """
+    Pooled httpx.AsyncClient bound to a private event loop thread.
+    """
+
+    def __init__(self, timeout: float = PRICE_HTTP_TIMEOUT, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._timeout = timeout
+        self._transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        # Single-flight: key => the fetch every concurrent caller awaits
+        self._inflight: Dict[Hashable, concurrent.futures.Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    # -- lifecycle -------------------------------------------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="price-client", daemon=True)
+        self._thread.start()
+        self._http = asyncio.run_coroutine_threadsafe(self._open(), self._loop).result()
+
+    async def _open(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=self._timeout,
+            limits=httpx.Limits(
+                max_connections=PRICE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=PRICE_HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=PRICE_HTTP_KEEPALIVE,
+            ),
+            transport=self._transport,
+        )
+
+    def stop(self, timeout: Optional[float] = 10):
+        """
+        Close pooled connections and stop the loop thread.
+        """
+        if self._thread is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._http.aclose(), self._loop).result(timeout)
+        except Exception:
+            logger.exception("[PriceClient] Error closing HTTP client")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop.close()
+        self._thread = None
+        self._loop = None
+        self._http = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """The pooled client. Only use it from coroutines running on this client's loop."""
+        return self._http
+
+    # -- callers ---------------------------------------------------------------
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, key: Optional[Hashable] = None) -> Any:
+        """
+        Await fn(http, *args) on the client's loop, from any event loop.
+
+        With a `key` (e.g. ("history", day)) the call is single-flight:
+        while one fetch for that key is in flight, every other caller, sync
+        or async, awaits the same result (or error) instead of starting its
+        own chain of provider requests.
+        """
+        if key is not None:
+            with self._inflight_lock:
+                future = self._inflight.get(key)
+                started = future is None
+                if started:
+                    future = self.submit(fn(self._http, *args))
+                    self._inflight[key] = future
+            if started:
+                # Outside the lock: runs at once if the fetch already finished
+                future.add_done_callback(lambda done: self._forget(key, done))
+            # shield: one cancelled caller must not cancel everyone's fetch
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        coro = fn(self._http, *args)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    def _forget(self, key: Hashable, future: concurrent.futures.Future):
+        with self._inflight_lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """
+        Schedule `coro` on the client's loop without waiting for it. The
+        work outlives the caller's request (and its event loop).
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        Synchronous facade: run `coro` on the client's loop and block this
+        thread until it finishes. Safe from any thread except the client's.
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("PriceClient.run() called from the price client's own loop")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+
+def start_price_client() -> PriceClient:
+    """
+    Start the shared client (app startup). Idempotent.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = PriceClient()
+            _client.start()
+            logger.info("[PriceClient] Started pooled price API client.")
+        return _client
+
+
+def stop_price_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.stop()
+
+
+def get_price_client() -> PriceClient:
+    """
+    The shared client, started on first use outside the app lifespan.
+    """
+    client = _client
+    if client is not None:
+        return client
+    return start_price_client()
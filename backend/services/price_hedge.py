@@ -0,0 +1,95 @@
+"""
+backend/services/price_hedge.py
+
+Hedged provider queries for the price / block-height lookups in bitcoin.py.
+
+Instead of trying providers strictly one after another (a slow primary
+costing a full timeout before the backup is even asked), hedged() starts
+the primary and launches the next provider when either:
+ - PRICE_HEDGE_DELAY seconds pass without an answer, or
+ - every provider started so far has failed.
+The first valid answer wins and the providers still running are cancelled,
+so a lookup takes about as long as the fastest healthy provider.
+
+Every attempt goes through services/provider_health.py: a provider whose
+circuit is open or whose request budget is spent is skipped at once, and
+each request's latency and outcome is recorded there.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from backend.services.provider_health import provider_health
+
+# Seconds to wait on a provider before also asking the next one.
+PRICE_HEDGE_DELAY = float(os.getenv("PRICE_HEDGE_DELAY", "0.5"))
+
+# (provider name, zero-argument coroutine factory). The coroutine returns the
+# answer, or None / raises when the provider has nothing usable.
+Attempt = Tuple[str, Callable[[], Awaitable[Optional[Any]]]]
+
+
+async def _attempt(name: str, start: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+    """
+    One provider request, unless its circuit is open or its budget spent
+    (then None at once, without a request). The outcome and latency go to
+    provider_health.
+    """
+    if not provider_health.acquire(name):
+        return None
+    began = time.perf_counter()
+    try:
+        result = await start()
+    except asyncio.CancelledError:
+        provider_health.record_cancelled(name)
+        raise
+    except Exception as e:
+        provider_health.record(name, time.perf_counter() - began, ok=False, error=e)
+        return None
+    provider_health.record(name, time.perf_counter() - began, ok=result is not None)
+    return result
+
+
+async def failover(attempts: Sequence[Attempt]) -> Optional[Any]:
+    """
+    Plain sequential failover through the same breaker and budget: the
+    next provider is asked only when the previous one failed or was
+    skipped. For large responses (ranges) where hedging would double load.
+    """
+    for name, start in attempts:
+        result = await _attempt(name, start)
+        if result is not None:
+            return result
+    return None
+
+
+async def hedged(attempts: Sequence[Attempt], delay: Optional[float] = None) -> Optional[Any]:
+    """
+    Run `attempts` in order, hedged: the next one starts after `delay`
+    seconds (default PRICE_HEDGE_DELAY) without an answer, or at once when
+    all running attempts have failed. Returns the first non-None result
+    (the earliest provider's when several finish together) and cancels the
+    rest, or None when every attempt fails.
+    """
+    delay = PRICE_HEDGE_DELAY if delay is None else delay
+    waiting = list(enumerate(attempts))
+    running: Dict[asyncio.Task, int] = {}
+    try:
+        while waiting or running:
+            if waiting:
+                order, (name, start) = waiting.pop(0)
+                running[asyncio.ensure_future(_attempt(name, start))] = order
+            done, _ = await asyncio.wait(
+                running, timeout=delay if waiting else None, return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in sorted(done, key=running.get):
+                del running[task]
+                result = task.result()
+                if result is not None:
+                    return result
+        return None
+    finally:
+        for task in running:
+            task.cancel()
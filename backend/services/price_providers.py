@@ -0,0 +1,277 @@
+"""
+backend/services/price_providers.py
+
+BTC price providers behind the lookups in bitcoin.py.
+
+Each provider answers three questions, returning None (or raising) when it
+has nothing usable, so bitcoin.py can fail over / hedge between them:
+ - current_price(client)              live USD price
+ - historical_price(client, day)      one day's USD price
+ - price_range(client, start, end)    {day: USD price} for start..end
+
+Implementations:
+ - CoinGeckoProvider, KrakenProvider, CoinDeskProvider: the public APIs,
+   called through the shared pooled client (price_client.py).
+ - LocalPriceProvider: daily prices from a CSV/JSON price file (same
+   layouts as price_store.parse_price_file) or a SQLite database with a
+   btc_daily_prices table (e.g. a copy of the app's own database). No
+   network; its "current" price is the newest day it holds.
+
+PRICE_PROVIDERS picks the providers and their order (default
+"coingecko,kraken,coindesk"). PRICE_PROVIDERS=local with
+PRICE_FIXTURE_FILE=<file> makes every price lookup deterministic and
+offline, for benchmarking re-lots and reports or running tests.
+"""
+
+import bisect
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from backend.services.provider_health import provider_health
+
+PRICE_PROVIDERS = os.getenv("PRICE_PROVIDERS", "coingecko,kraken,coindesk")
+PRICE_FIXTURE_FILE = os.getenv("PRICE_FIXTURE_FILE")
+
+# Range responses are large; allow more than the client's default timeout.
+RANGE_TIMEOUT = 30.0
+
+
+def _day_bounds(start: date, end: date):
+    dt_start = datetime.combine(start, datetime.min.time()).replace(tzinfo=timezone.utc)
+    dt_end = datetime.combine(end + timedelta(days=1), datetime.min.time()).replace(tzinfo=timezone.utc)
+    return dt_start, dt_end
+
+
+class PriceProvider:
+    """
+    Base class: every question is unsupported until a subclass answers it.
+    """
+
+    name = "provider"
+
+    async def current_price(self, client: httpx.AsyncClient) -> Optional[float]:
+        return None
+
+    async def historical_price(self, client: httpx.AsyncClient, day: date) -> Optional[float]:
+        return None
+
+    async def price_range(self, client: httpx.AsyncClient, start: date, end: date) -> Optional[Dict[date, float]]:
+        return None
+
+
+class CoinGeckoProvider(PriceProvider):
+    name = "coingecko"
+
+    PRICE_URL = "https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies=usd"
+    # Single-date historical (DD-MM-YYYY format)
+    HISTORY_URL = "https://api.coingecko.com/api/v3/coins/bitcoin/history?date={date}"
+    RANGE_URL = (
+        "https://api.coingecko.com/api/v3/coins/bitcoin/market_chart/range"
+        "?vs_currency=usd&from={start}&to={end}"
+    )
+
+    async def current_price(self, client):
+        resp = await client.get(self.PRICE_URL)
+        resp.raise_for_status()
+        # CoinGecko simple price returns {"bitcoin": {"usd": <price>}}
+        return resp.json()["bitcoin"]["usd"]
+
+    async def historical_price(self, client, day):
+        resp = await client.get(self.HISTORY_URL.format(date=day.strftime("%d-%m-%Y")))
+        resp.raise_for_status()
+        # CoinGecko returns price under data["market_data"]["current_price"]["usd"]
+        market_data = resp.json().get("market_data") or {}
+        return (market_data.get("current_price") or {}).get("usd")
+
+    async def price_range(self, client, start, end):
+        # Hourly points for short ranges, daily beyond 90 days; first point of each day
+        dt_start, dt_end = _day_bounds(start, end)
+        resp = await client.get(self.RANGE_URL.format(
+            start=int(dt_start.timestamp()), end=int(dt_end.timestamp())
+        ), timeout=RANGE_TIMEOUT)
+        resp.raise_for_status()
+        prices: Dict[date, float] = {}
+        for ts_ms, price in sorted(resp.json().get("prices", [])):
+            day = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).date()
+            if start <= day <= end and day not in prices:
+                prices[day] = float(price)
+        return prices or None
+
+
+class KrakenProvider(PriceProvider):
+    name = "kraken"
+
+    TICKER_URL = "https://api.kraken.com/0/public/Ticker?pair=XBTUSD"
+    OHLC_URL = "https://api.kraken.com/0/public/OHLC?pair=XBTUSD&interval=1440&since={since}"
+
+    async def current_price(self, client):
+        resp = await client.get(self.TICKER_URL)
+        resp.raise_for_status()
+        data = resp.json()
+        # Kraken returns an 'error' list; must be empty for success
+        if data.get("error") != [] or not data.get("result"):
+            return None
+        # The BTC/USD pair key is e.g. "XXBTZUSD" => look at "c" for last trade
+        pair = next(iter(data["result"]))
+        return float(data["result"][pair]["c"][0])
+
+    async def historical_price(self, client, day):
+        # Daily OHLC from 00:00:00 UTC of the day
+        timestamp = int(_day_bounds(day, day)[0].timestamp())
+        resp = await client.get(self.OHLC_URL.format(since=timestamp))
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("error") != [] or not data.get("result"):
+            return None
+        pair = next(iter(data["result"]))  # e.g., "XXBTZUSD"
+        ohlc_data = data["result"].get(pair, [])
+        # Each OHLC entry => [time, open, high, low, close, vwap, volume, count]
+        for entry in ohlc_data:
+            if len(entry) >= 5 and int(entry[0]) == timestamp:
+                # Use the open price at 00:00 UTC of that day
+                return float(entry[1])
+        # If exact timestamp not found, fallback to the first entry's open
+        if ohlc_data:
+            return float(ohlc_data[0][1])
+        return None
+
+    async def price_range(self, client, start, end):
+        # Daily OHLC (open); returns at most the last 720 days
+        dt_start, _ = _day_bounds(start, end)
+        resp = await client.get(self.OHLC_URL.format(since=int(dt_start.timestamp())), timeout=RANGE_TIMEOUT)
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("error") != [] or not data.get("result"):
+            return None
+        pair = next(k for k in data["result"] if k != "last")
+        prices = {}
+        for row in data["result"][pair]:
+            day = datetime.fromtimestamp(int(row[0]), tz=timezone.utc).date()
+            if start <= day <= end:
+                prices[day] = float(row[1])
+        return prices or None
+
+
+class CoinDeskProvider(PriceProvider):
+    name = "coindesk"
+
+    CURRENT_URL = "https://api.coindesk.com/v1/bpi/currentprice/USD.json"
+    # Daily close for start..end (YYYY-MM-DD)
+    RANGE_URL = "https://api.coindesk.com/v1/bpi/historical/close.json?start={start}&end={end}"
+
+    async def current_price(self, client):
+        resp = await client.get(self.CURRENT_URL)
+        resp.raise_for_status()
+        # CoinDesk current price is at data["bpi"]["USD"]["rate_float"]
+        return resp.json()["bpi"]["USD"]["rate_float"]
+
+    async def historical_price(self, client, day):
+        prices = await self._close(client, day, day)
+        return prices.get(day.strftime("%Y-%m-%d"))
+
+    async def price_range(self, client, start, end):
+        prices = {
+            datetime.strptime(day, "%Y-%m-%d").date(): float(price)
+            for day, price in (await self._close(client, start, end, RANGE_TIMEOUT)).items()
+        }
+        return prices or None
+
+    async def _close(self, client, start, end, timeout=httpx.USE_CLIENT_DEFAULT):
+        resp = await client.get(self.RANGE_URL.format(
+            start=start.strftime("%Y-%m-%d"), end=end.strftime("%Y-%m-%d")
+        ), timeout=timeout)
+        resp.raise_for_status()
+        # data["bpi"] is a dict { "YYYY-MM-DD": <price> }
+        return resp.json().get("bpi", {})
+
+
+class LocalPriceProvider(PriceProvider):
+    """
+    Daily prices from a local CSV/JSON file or SQLite database, loaded on
+    first use. Exempt from the circuit breaker and request budget.
+    """
+
+    name = "local"
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._days: Optional[List[date]] = None
+        self._prices: Dict[date, float] = {}
+        provider_health.exempt(self.name)
+
+    def _load(self) -> List[date]:
+        with self._lock:
+            if self._days is None:
+                self._prices = self._read() if self.path else {}
+                self._days = sorted(self._prices)
+            return self._days
+
+    def _read(self) -> Dict[date, float]:
+        if self.path.lower().endswith((".db", ".sqlite", ".sqlite3")):
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                rows = conn.execute("SELECT day, price_usd FROM btc_daily_prices").fetchall()
+            finally:
+                conn.close()
+            return {date.fromisoformat(str(day)[:10]): float(price) for day, price in rows}
+
+        from backend.services.price_store import parse_price_file
+
+        with open(self.path, "rb") as fh:
+            content = fh.read()
+        return {day: float(price) for day, price in parse_price_file(content, self.path).items()}
+
+    async def current_price(self, client):
+        days = self._load()
+        return self._prices[days[-1]] if days else None
+
+    async def historical_price(self, client, day):
+        self._load()
+        return self._prices.get(day)
+
+    async def price_range(self, client, start, end):
+        days = self._load()
+        lo, hi = bisect.bisect_left(days, start), bisect.bisect_right(days, end)
+        return {day: self._prices[day] for day in days[lo:hi]} or None
+
+
+_REMOTE = {cls.name: cls for cls in (CoinGeckoProvider, KrakenProvider, CoinDeskProvider)}
+
+_providers: Optional[List[PriceProvider]] = None
+
+
+def build_providers(names: str, fixture_file: Optional[str] = None) -> List[PriceProvider]:
+    """Providers for a comma-separated list of names, in that order."""
+    providers: List[PriceProvider] = []
+    for name in (n.strip().lower() for n in names.split(",")):
+        if not name:
+            continue
+        if name == LocalPriceProvider.name:
+            providers.append(LocalPriceProvider(fixture_file))
+        elif name in _REMOTE:
+            providers.append(_REMOTE[name]())
+        else:
+            raise ValueError(f"Unknown price provider {name!r} in PRICE_PROVIDERS")
+    if not providers:
+        raise ValueError("PRICE_PROVIDERS names no provider")
+    return providers
+
+
+def get_providers() -> List[PriceProvider]:
+    """The configured providers (PRICE_PROVIDERS / PRICE_FIXTURE_FILE)."""
+    global _providers
+    if _providers is None:
+        _providers = build_providers(PRICE_PROVIDERS, PRICE_FIXTURE_FILE)
+    return _providers
+
+
+def set_providers(providers: Optional[List[PriceProvider]]):
+    """Replace the configured providers (None: back to the configuration)."""
+    global _providers
+    _providers = providers
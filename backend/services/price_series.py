@@ -0,0 +1,125 @@
+"""
+backend/services/price_series.py
+
+Daily BTC price series for charts, served from memory.
+
+The series is the local price store (services/price_store.py) loaded once
+into sorted lists. A chart request for any window:
+ - reads the window from memory,
+ - re-reads the store only for days memory lacks (another writer may have
+   stored them since),
+ - fetches only the days still missing (normally just the ones since the
+   last refresh) with range requests (price_store.backfill_prices), which
+   persists them,
+so repeated chart loads make no upstream requests and multi-year windows
+cost one range request per year the first time.
+
+Days no provider could price (e.g. before the providers' history starts)
+are not asked for again until FETCH_RETRY_SECONDS have passed.
+"""
+
+import bisect
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from backend.models.btc_price import BtcDailyPrice
+from backend.services import price_store
+
+# Seconds before a day no provider had is requested again.
+FETCH_RETRY_SECONDS = 600
+
+
+class DailySeries:
+    """
+    Sorted in-memory copy of the stored daily prices. Thread-safe: chart
+    requests and store writers may touch it concurrently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days: List[date] = []
+        self._prices: List[float] = []
+        self._loaded = False
+        self._unavailable: Dict[date, float] = {}
+
+    def load(self, db: Session):
+        """Read the whole store once (a few thousand rows at most)."""
+        if self._loaded:
+            return
+        rows = db.query(BtcDailyPrice.day, BtcDailyPrice.price_usd).order_by(BtcDailyPrice.day).all()
+        with self._lock:
+            if not self._loaded:
+                self._days = [day for day, _ in rows]
+                self._prices = [float(price) for _, price in rows]
+                self._loaded = True
+
+    def reload(self, db: Session, start: date, end: date):
+        """Merge the stored days in start..end into memory."""
+        self.merge(price_store.get_stored_prices(db, start, end))
+
+    def merge(self, prices: Dict[date, float]):
+        with self._lock:
+            for day, price in sorted(prices.items()):
+                i = bisect.bisect_left(self._days, day)
+                if i < len(self._days) and self._days[i] == day:
+                    self._prices[i] = float(price)
+                else:
+                    self._days.insert(i, day)
+                    self._prices.insert(i, float(price))
+
+    def window(self, start: date, end: date) -> List[Tuple[date, float]]:
+        with self._lock:
+            lo = bisect.bisect_left(self._days, start)
+            hi = bisect.bisect_right(self._days, end)
+            return list(zip(self._days[lo:hi], self._prices[lo:hi]))
+
+    def missing(self, start: date, end: date) -> List[date]:
+        """Days in start..end not in memory and not recently found unavailable."""
+        have = {day for day, _ in self.window(start, end)}
+        now = time.monotonic()
+        with self._lock:
+            return [
+                day for day in price_store.days_between(start, end)
+                if day not in have and self._unavailable.get(day, 0) <= now
+            ]
+
+    def mark_unavailable(self, days: List[date]):
+        retry_at = time.monotonic() + FETCH_RETRY_SECONDS
+        with self._lock:
+            for day in days:
+                self._unavailable[day] = retry_at
+
+    def clear(self):
+        """Forget everything; the next request reloads from the store."""
+        with self._lock:
+            self._days, self._prices = [], []
+            self._loaded = False
+            self._unavailable.clear()
+
+
+daily_series = DailySeries()
+
+
+async def get_daily_series(start: date, end: date, db: Optional[Session] = None) -> List[Tuple[date, float]]:
+    """
+    (day, USD price) for every day in start..end that can be priced,
+    oldest first. Fetches and stores only the days neither memory nor the
+    store has; store I/O runs in a worker thread.
+    """
+    series = daily_series
+    with price_store.session_scope(db) as session:
+        await run_in_threadpool(series.load, session)
+        missing = series.missing(start, end)
+        if missing:
+            await run_in_threadpool(series.reload, session, missing[0], missing[-1])
+            missing = series.missing(start, end)
+        if missing:
+            await price_store.backfill_prices(session, missing[0], missing[-1])
+            await run_in_threadpool(series.reload, session, missing[0], missing[-1])
+            series.mark_unavailable(series.missing(missing[0], missing[-1]))
+    return series.window(start, end)
@@ -0,0 +1,351 @@
+"""
+backend/services/price_store.py
+
+Local daily BTC price store (backend/models/btc_price.py).
+
+Every historical price lookup reads the btc_daily_prices table first:
+get_historical_price in bitcoin.py (API route, River FMV autofill) and
+get_btc_price in transaction.py (transfer-fee valuation during a re-lot,
+report valuations). Only a missing day goes to the price APIs, and the
+answer is stored, so each day is fetched at most once.
+
+The table can be filled ahead of time, after which re-lots and reports run
+without any network access:
+ - bulk-load a CSV or JSON file (POST /api/bitcoin/price/history/import, or
+   BTC_PRICE_FILE, loaded at startup),
+ - backfill the days the ledger needs from provider range endpoints
+   (POST /api/bitcoin/price/history/backfill).
+
+Only days that have ended (UTC) are stored: today's price is still moving.
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from backend.database import SessionLocal
+from backend.models.btc_price import BtcDailyPrice
+from backend.models.transaction import Transaction
+
+logger = logging.getLogger(__name__)
+
+# Optional CSV/JSON file of daily prices merged into the store at startup.
+BTC_PRICE_FILE = os.getenv("BTC_PRICE_FILE")
+
+# Days per provider range request (CoinGecko's public range limit).
+BACKFILL_WINDOW_DAYS = 365
+
+_PRICE_QUANTUM = Decimal("0.00000001")
+_INSERT_CHUNK = 200
+
+# Column names accepted in price files, in order of preference.
+_DATE_COLUMNS = ("date", "day", "snapped_at", "timestamp", "time")
+_PRICE_COLUMNS = ("price_usd", "price", "close", "usd")
+
+
+@contextmanager
+def session_scope(db: Optional[Session] = None):
+    """
+    Use `db` if given, else a short-lived session of our own.
+    """
+    if db is not None:
+        yield db
+        return
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def last_closed_day() -> date:
+    """The most recent UTC day whose price is final."""
+    return datetime.now(timezone.utc).date() - timedelta(days=1)
+
+
+# ---------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------
+def get_stored_price(db: Session, day: date) -> Optional[Decimal]:
+    return db.query(BtcDailyPrice.price_usd).filter(BtcDailyPrice.day == day).scalar()
+
+
+def get_stored_prices(db: Session, start: date, end: date) -> Dict[date, Decimal]:
+    rows = (
+        db.query(BtcDailyPrice.day, BtcDailyPrice.price_usd)
+        .filter(BtcDailyPrice.day >= start, BtcDailyPrice.day <= end)
+        .all()
+    )
+    return {day: price for day, price in rows}
+
+
+def days_between(start: date, end: date) -> List[date]:
+    """Every day in start..end (inclusive)."""
+    return [start + timedelta(days=i) for i in range(max((end - start).days + 1, 0))]
+
+
+def missing_days(db: Session, start: date, end: date) -> List[date]:
+    """Days in start..end (inclusive) without a stored price."""
+    have = set(get_stored_prices(db, start, end))
+    return [d for d in days_between(start, end) if d not in have]
+
+
+def range_windows(days: List[date]) -> List[Tuple[date, date]]:
+    """
+    Cover sorted `days` with as few provider range requests as possible:
+    each window starts at a day still uncovered and spans at most
+    BACKFILL_WINDOW_DAYS, ending at the last wanted day inside it.
+    """
+    windows: List[Tuple[date, date]] = []
+    for day in days:
+        if windows and day <= windows[-1][1]:
+            continue
+        if windows and (day - windows[-1][0]).days < BACKFILL_WINDOW_DAYS:
+            windows[-1] = (windows[-1][0], day)
+        else:
+            windows.append((day, day))
+    return windows
+
+
+def ledger_start(db: Session) -> Optional[date]:
+    """UTC day of the first transaction, or None for an empty ledger."""
+    first = db.query(func.min(Transaction.timestamp)).scalar()
+    if first is None:
+        return None
+    if first.tzinfo is not None:
+        first = first.astimezone(timezone.utc)
+    return first.date()
+
+
+def coverage(db: Session) -> dict:
+    """
+    What the store holds, and how many days the ledger still needs from the
+    network (first transaction through yesterday).
+    """
+    count, first, last = db.query(
+        func.count(BtcDailyPrice.day), func.min(BtcDailyPrice.day), func.max(BtcDailyPrice.day)
+    ).one()
+    start = ledger_start(db)
+    missing = len(missing_days(db, start, last_closed_day())) if start else 0
+    return {
+        "days": count,
+        "first_day": first,
+        "last_day": last,
+        "ledger_start": start,
+        "missing_for_ledger": missing,
+    }
+
+
+# ---------------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------------
+def store_prices(db: Session, prices: Dict[date, object], source: str, overwrite: bool = False) -> int:
+    """
+    Insert daily prices (not committed). Days that have not ended yet are
+    skipped. Existing rows are kept unless `overwrite`. Returns the number
+    of rows written.
+    """
+    cutoff = last_closed_day()
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "day": day,
+            "price_usd": Decimal(str(price)).quantize(_PRICE_QUANTUM),
+            "source": source,
+            "fetched_at": now,
+        }
+        for day, price in sorted(prices.items())
+        if day <= cutoff and price is not None
+    ]
+    written = 0
+    for start in range(0, len(rows), _INSERT_CHUNK):
+        stmt = sqlite_insert(BtcDailyPrice).values(rows[start:start + _INSERT_CHUNK])
+        if overwrite:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["day"],
+                set_={
+                    "price_usd": stmt.excluded.price_usd,
+                    "source": stmt.excluded.source,
+                    "fetched_at": stmt.excluded.fetched_at,
+                },
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=["day"])
+        written += db.execute(stmt).rowcount
+    return written
+
+
+def save_prices(db: Session, prices: Dict[date, object], source: str = "api") -> int:
+    """
+    store_prices and commit. Async callers run this (and the store reads)
+    in a worker thread so SQLite I/O never blocks the event loop.
+    """
+    written = store_prices(db, prices, source=source)
+    if written:
+        db.commit()
+    return written
+
+
+def parse_price_file(content: bytes, filename: str = "") -> Dict[date, Decimal]:
+    """
+    Daily prices from a CSV or JSON file.
+
+    CSV: a header row with a date column (date, day, snapped_at, timestamp
+    or time) and a price column (price_usd, price, close or usd), e.g. a
+    CoinGecko export. JSON: {"YYYY-MM-DD": price}, a list of
+    {"date": ..., "price": ...} objects or [date, price] pairs, or
+    {"prices": [[unix_ms, price], ...]} (CoinGecko market_chart).
+    Dates may be ISO strings or Unix seconds/milliseconds.
+
+    Raises HTTP 400 naming the first bad row.
+    """
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Price file must be UTF-8 text.")
+
+    if filename.lower().endswith(".json") or text.lstrip()[:1] in ("{", "["):
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON price file: {e}")
+        if isinstance(data, dict) and "prices" in data:
+            data = data["prices"]
+        if isinstance(data, dict):
+            pairs = list(data.items())
+        elif isinstance(data, list):
+            pairs = [_json_pair(item, n) for n, item in enumerate(data, start=1)]
+        else:
+            raise HTTPException(status_code=400, detail="Unrecognized JSON price file layout.")
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        fields = {name.strip().lower(): name for name in (reader.fieldnames or [])}
+        date_col = next((fields[c] for c in _DATE_COLUMNS if c in fields), None)
+        price_col = next((fields[c] for c in _PRICE_COLUMNS if c in fields), None)
+        if date_col is None or price_col is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Price CSV needs a date column (date/day/timestamp) and a price column (price/close).",
+            )
+        pairs = [(row[date_col], row[price_col]) for row in reader]
+
+    prices: Dict[date, Decimal] = {}
+    for n, (raw_day, raw_price) in enumerate(pairs, start=1):
+        try:
+            day = _parse_day(raw_day)
+            price = Decimal(str(raw_price).strip())
+        except (ValueError, TypeError, InvalidOperation):
+            raise HTTPException(status_code=400, detail=f"Price file row {n}: cannot read {raw_day!r}, {raw_price!r}.")
+        if not price.is_finite() or price <= 0:
+            raise HTTPException(status_code=400, detail=f"Price file row {n}: price must be positive.")
+        prices.setdefault(day, price)
+    return prices
+
+
+def _json_pair(item, n: int):
+    if isinstance(item, dict):
+        lowered = {str(k).lower(): v for k, v in item.items()}
+        day = next((lowered[c] for c in _DATE_COLUMNS if c in lowered), None)
+        price = next((lowered[c] for c in _PRICE_COLUMNS if c in lowered), None)
+        return day, price
+    if isinstance(item, (list, tuple)) and len(item) >= 2:
+        return item[0], item[1]
+    raise HTTPException(status_code=400, detail=f"Price file row {n}: expected an object or [date, price].")
+
+
+def _parse_day(value) -> date:
+    """ISO date/datetime string or Unix seconds/milliseconds => UTC day."""
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.replace(".", "", 1).isdigit():
+            return date.fromisoformat(value[:10])
+    seconds = float(value)
+    if seconds > 1e11:  # milliseconds
+        seconds /= 1000
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).date()
+
+
+def load_price_file(db: Session, content: bytes, filename: str = "", overwrite: bool = True) -> int:
+    """
+    Parse a price file and store it (committed). Returns rows written.
+    """
+    prices = parse_price_file(content, filename)
+    from backend.services.price_series import daily_series
+
+    written = store_prices(db, prices, source="file", overwrite=overwrite)
+    db.commit()
+    daily_series.clear()  # overwritten days
+    logger.info(f"[Prices] Loaded {written} of {len(prices)} daily prices from {filename or 'file'}.")
+    return written
+
+
+def load_bundled_prices() -> int:
+    """
+    Startup: merge BTC_PRICE_FILE into the store, keeping rows already
+    there. A missing or unreadable file is logged, not fatal.
+    """
+    if not BTC_PRICE_FILE:
+        return 0
+    if not os.path.exists(BTC_PRICE_FILE):
+        logger.warning(f"[Prices] BTC_PRICE_FILE {BTC_PRICE_FILE} does not exist; skipped.")
+        return 0
+    with open(BTC_PRICE_FILE, "rb") as fh:
+        content = fh.read()
+    with session_scope() as db:
+        try:
+            return load_price_file(db, content, os.path.basename(BTC_PRICE_FILE), overwrite=False)
+        except HTTPException as e:
+            db.rollback()
+            logger.warning(f"[Prices] Could not load {BTC_PRICE_FILE}: {e.detail}")
+            return 0
+
+
+async def backfill_prices(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> dict:
+    """
+    Fetch every missing day in start..end from provider range endpoints
+    (BACKFILL_WINDOW_DAYS per request) and store it. Defaults to the
+    ledger's first day through yesterday. A window whose providers all
+    fail is skipped and counted in "still_missing". Only the provider
+    requests are awaited on the loop; store reads and writes run in a
+    worker thread.
+    """
+    from backend.services.bitcoin import get_price_range
+
+    start = start or await run_in_threadpool(ledger_start, db)
+    end = min(end or last_closed_day(), last_closed_day())
+    if start is None or start > end:
+        return {"start": start, "end": end, "missing": 0, "stored": 0, "still_missing": 0}
+
+    missing = await run_in_threadpool(missing_days, db, start, end)
+    wanted = set(missing)
+    stored = 0
+    for window_start, window_end in range_windows(missing):
+        try:
+            prices = await get_price_range(window_start, window_end)
+        except HTTPException as e:
+            logger.warning(f"[Prices] Backfill {window_start}..{window_end} failed: {e.detail}")
+            continue
+        stored += await run_in_threadpool(
+            save_prices, db, {d: p for d, p in prices.items() if d in wanted}
+        )
+
+    logger.info(f"[Prices] Backfilled {stored} of {len(missing)} missing days ({start}..{end}).")
+    return {
+        "start": start,
+        "end": end,
+        "missing": len(missing),
+        "stored": stored,
+        "still_missing": len(missing) - stored,
+    }
@@ -0,0 +1,211 @@
+"""
+backend/services/provider_health.py
+
+Per-provider health for the price / block-height APIs used by bitcoin.py:
+call statistics, a circuit breaker and a request budget.
+
+ - Circuit breaker: PROVIDER_FAILURE_THRESHOLD consecutive failures, or a
+   single HTTP 429, open the provider's circuit for PROVIDER_COOLDOWN
+   seconds (a 429's Retry-After, when longer). While open the provider is
+   skipped without a request. After the cool-down one trial request is
+   let through (half-open); its outcome closes or re-opens the circuit.
+ - Token bucket: each provider may be asked at most its budget of requests
+   per minute (PRICE_PROVIDER_RATE_LIMITS, e.g. "coingecko=25,kraken=60";
+   others get PROVIDER_DEFAULT_RATE). An empty bucket skips the provider
+   instead of earning a 429.
+
+A skipped provider costs nothing: the lookup moves on to the next one at
+once. Local providers (price_providers.LocalPriceProvider) are exempt: they
+are never skipped, only counted. GET /api/bitcoin/providers reports every provider's state.
+
+State is written from the price client's loop and read from request
+threads, so every access holds the registry lock.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import httpx
+
+PROVIDER_FAILURE_THRESHOLD = int(os.getenv("PROVIDER_FAILURE_THRESHOLD", "3"))
+PROVIDER_COOLDOWN = float(os.getenv("PROVIDER_COOLDOWN", "60"))
+PROVIDER_DEFAULT_RATE = float(os.getenv("PROVIDER_DEFAULT_RATE", "60"))
+
+# Budgets (requests per minute) for providers with tighter public limits.
+_RATE_DEFAULTS = {"coingecko": 25.0}
+
+# Outcomes kept for the reported error rate.
+_RECENT = 50
+
+# Weight of the newest sample in the moving-average latency.
+_EWMA_WEIGHT = 0.2
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def _rate_limits() -> Dict[str, float]:
+    limits = dict(_RATE_DEFAULTS)
+    for item in os.getenv("PRICE_PROVIDER_RATE_LIMITS", "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            limits[name.strip()] = float(rate)
+    return limits
+
+
+class _Provider:
+    def __init__(self, rate_per_min: float, now: float):
+        self.rate = rate_per_min / 60.0
+        self.capacity = max(rate_per_min, 1.0)  # a burst of up to one minute's budget
+        self.tokens = self.capacity
+        self.refilled = now
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.trial_running = False
+        self.consecutive_failures = 0
+        self.recent = deque(maxlen=_RECENT)
+        self.stats = {
+            "calls": 0, "ok": 0, "failed": 0, "rate_limited": 0, "cancelled": 0,
+            "skipped_open": 0, "skipped_budget": 0,
+            "last_latency_ms": None, "avg_latency_ms": None,
+        }
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def trip(self, now: float, cooldown: float):
+        self.state = OPEN
+        self.open_until = now + cooldown
+        self.trial_running = False
+
+
+class ProviderHealth:
+    """
+    Registry of per-provider breaker, budget and statistics.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._providers: Dict[str, _Provider] = {}
+        self._limits = _rate_limits()
+        self._exempt = set()
+
+    def exempt(self, name: str):
+        """Never skip `name` (a local, offline provider); stats only."""
+        with self._lock:
+            self._exempt.add(name)
+
+    def _get(self, name: str) -> _Provider:
+        provider = self._providers.get(name)
+        if provider is None:
+            rate = self._limits.get(name, PROVIDER_DEFAULT_RATE)
+            provider = self._providers[name] = _Provider(rate, self._clock())
+        return provider
+
+    def acquire(self, name: str) -> bool:
+        """
+        May `name` be asked now? Takes a token when it may; counts the skip
+        when its circuit is open or its budget is spent.
+        """
+        with self._lock:
+            if name in self._exempt:
+                return True
+            provider = self._get(name)
+            now = self._clock()
+            if provider.state == OPEN:
+                if now < provider.open_until:
+                    provider.stats["skipped_open"] += 1
+                    return False
+                provider.state = HALF_OPEN
+            if provider.state == HALF_OPEN:
+                if provider.trial_running:
+                    provider.stats["skipped_open"] += 1
+                    return False
+            provider.refill(now)
+            if provider.tokens < 1:
+                provider.stats["skipped_budget"] += 1
+                return False
+            provider.tokens -= 1
+            if provider.state == HALF_OPEN:
+                provider.trial_running = True
+            return True
+
+    def record(self, name: str, seconds: float, ok: bool, error: Optional[BaseException] = None):
+        """Outcome of a request let through by acquire()."""
+        ms = round(seconds * 1000, 1)
+        with self._lock:
+            provider = self._get(name)
+            now = self._clock()
+            stats = provider.stats
+            stats["calls"] += 1
+            stats["ok" if ok else "failed"] += 1
+            stats["last_latency_ms"] = ms
+            avg = stats["avg_latency_ms"]
+            stats["avg_latency_ms"] = ms if avg is None else round(avg + _EWMA_WEIGHT * (ms - avg), 1)
+            provider.recent.append(ok)
+
+            if ok or name in self._exempt:
+                provider.state = CLOSED
+                provider.trial_running = False
+                provider.consecutive_failures = 0
+                return
+            provider.consecutive_failures += 1
+            retry_after = _retry_after(error)
+            if retry_after is not None:
+                stats["rate_limited"] += 1
+                provider.tokens = 0
+                provider.trip(now, max(PROVIDER_COOLDOWN, retry_after))
+            elif provider.state == HALF_OPEN or provider.consecutive_failures >= PROVIDER_FAILURE_THRESHOLD:
+                provider.trip(now, PROVIDER_COOLDOWN)
+
+    def record_cancelled(self, name: str):
+        """A hedged request that lost the race: neither success nor failure."""
+        with self._lock:
+            provider = self._get(name)
+            provider.stats["calls"] += 1
+            provider.stats["cancelled"] += 1
+            if provider.state == HALF_OPEN:
+                provider.trial_running = False
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            now = self._clock()
+            report = {}
+            for name, provider in sorted(self._providers.items()):
+                provider.refill(now)
+                recent = provider.recent
+                state = provider.state
+                if state == OPEN and now >= provider.open_until:
+                    state = HALF_OPEN
+                report[name] = {
+                    **provider.stats,
+                    "state": state,
+                    "open_for_seconds": round(max(provider.open_until - now, 0), 1) if state == OPEN else 0,
+                    "consecutive_failures": provider.consecutive_failures,
+                    "error_rate": round(recent.count(False) / len(recent), 3) if recent else None,
+                    "budget_per_min": None if name in self._exempt else round(provider.rate * 60, 1),
+                    "tokens": None if name in self._exempt else round(provider.tokens, 1),
+                }
+            return report
+
+    def clear(self):
+        with self._lock:
+            self._providers.clear()
+            self._limits = _rate_limits()
+
+
+def _retry_after(error: Optional[BaseException]) -> Optional[float]:
+    """Seconds to back off if `error` is an HTTP 429, else None."""
+    if not isinstance(error, httpx.HTTPStatusError) or error.response.status_code != 429:
+        return None
+    try:
+        return float(error.response.headers.get("Retry-After", 0))
+    except ValueError:
+        return 0.0
+
+
+provider_health = ProviderHealth()
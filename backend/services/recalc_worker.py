@@ -0,0 +1,257 @@
+"""
+backend/services/recalc_worker.py
+
+Opt-in background re-lot for transaction edits.
+
+By default PUT/DELETE (and backdated POST) on /api/transactions re-lot
+inside the request, so the caller waits for the whole replay. With
+ASYNC_RECALC=true the request commits the transaction row and its ledger
+lines and hands the re-lot to a single worker thread instead:
+
+ - Edits that arrive while a replay is queued or running are coalesced:
+   the next replay starts from the earliest timestamp any of them touched.
+ - Every queued edit bumps ledger_version; recalculated_version is the
+   version the last finished replay covers. /api/recalc/status reports
+   both, plus queued / running / done / failed and the last duration.
+ - Calculation and report endpoints wait (up to RECALC_WAIT_SECONDS) for
+   the worker to catch up and flag their response if it did not.
+
+A failed replay (e.g. "Not enough BTC") is rolled back and reported; its
+start point is folded into the next queued replay.
+
+relot_lock serializes re-lots, so a synchronous one (CSV import, report
+generation) never interleaves with the worker's.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+
+from backend.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ASYNC_RECALC = os.getenv("ASYNC_RECALC", "false").lower() == "true"
+# How long calculation/report endpoints wait for a pending re-lot.
+RECALC_WAIT_SECONDS = float(os.getenv("RECALC_WAIT_SECONDS", "30"))
+# Quiet period before a queued re-lot starts, so bursts of edits share it.
+RECALC_DEBOUNCE_SECONDS = float(os.getenv("RECALC_DEBOUNCE_SECONDS", "0.2"))
+
+# Held for the duration of every re-lot, sync or background.
+relot_lock = threading.RLock()
+
+_worker: Optional["RecalcWorker"] = None
+
+
+def _min_since(a: Optional[datetime], b: Optional[datetime]) -> Optional[datetime]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+class RecalcWorker:
+    """
+    Single background thread running recalculate_transactions_since for
+    queued edits, one replay at a time.
+    """
+
+    def __init__(self, session_factory=SessionLocal, debounce: float = RECALC_DEBOUNCE_SECONDS):
+        self._session_factory = session_factory
+        self._debounce = debounce
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self._pending_since: Optional[datetime] = None
+        self._failed_since: Optional[datetime] = None
+        self._running = False
+
+        self.ledger_version = 0
+        self.recalculated_version = 0
+        self.state = "idle"
+        self.coalesced_edits = 0
+        self.last_error: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.last_started_at: Optional[datetime] = None
+        self.last_finished_at: Optional[datetime] = None
+
+    # -- lifecycle -------------------------------------------------------------
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="recalc-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Finish the queued replay (if any), then stop the thread.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            self._thread = None
+
+    # -- producer side ---------------------------------------------------------
+    def enqueue(self, since: datetime) -> int:
+        """
+        Queue a re-lot from `since` (call after the edit is committed).
+        Returns the ledger version the edit produced.
+        """
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        with self._cond:
+            if self._pending_since is not None:
+                self.coalesced_edits += 1
+            self._pending_since = _min_since(self._pending_since, since)
+            self.ledger_version += 1
+            if not self._running:
+                self.state = "queued"
+            self._cond.notify_all()
+            return self.ledger_version
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until nothing is queued or running. True if the lots reflect
+        every queued edit (the last replay did not fail).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending_since is not None or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return self.recalculated_version == self.ledger_version
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "mode": "async",
+                "state": self.state,
+                "ledger_version": self.ledger_version,
+                "recalculated_version": self.recalculated_version,
+                "pending_since": _min_since(self._pending_since, self._failed_since),
+                "coalesced_edits": self.coalesced_edits,
+                "last_duration_seconds": self.last_duration,
+                "last_started_at": self.last_started_at,
+                "last_finished_at": self.last_finished_at,
+                "last_error": self.last_error,
+            }
+
+    # -- worker side -----------------------------------------------------------
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending_since is None and not self._stopping:
+                    self._cond.wait()
+                if self._pending_since is None:
+                    return
+            if self._debounce:
+                time.sleep(self._debounce)
+            with self._cond:
+                since = _min_since(self._pending_since, self._failed_since)
+                version = self.ledger_version
+                self._pending_since = None
+                self._running = True
+                self.state = "running"
+                self.last_started_at = datetime.now(timezone.utc)
+            self._run_job(since, version)
+
+    def _run_job(self, since: datetime, version: int):
+        from backend.services import transaction as tx_service
+
+        started = time.perf_counter()
+        error = None
+        db = self._session_factory()
+        try:
+            with relot_lock:
+                tx_service.recalculate_transactions_since(db, since)
+                db.commit()
+        except HTTPException as e:
+            db.rollback()
+            error = str(e.detail)
+        except Exception as e:  # keep the worker alive; report instead
+            db.rollback()
+            logger.exception("[Recalc] Background re-lot failed")
+            error = str(e)
+        finally:
+            db.close()
+
+        with self._cond:
+            self._running = False
+            self.last_duration = time.perf_counter() - started
+            self.last_finished_at = datetime.now(timezone.utc)
+            self.last_error = error
+            if error is None:
+                self._failed_since = None
+                self.recalculated_version = version
+                self.state = "done"
+            else:
+                self._failed_since = since
+                self.state = "failed"
+            if self._pending_since is not None:
+                self.state = "queued"
+            self._cond.notify_all()
+        logger.info(
+            f"[Recalc] Re-lot from {since} for ledger version {version} "
+            f"{'failed: ' + error if error else 'done'} in {self.last_duration:.3f}s"
+        )
+
+
+def start_recalc_worker() -> Optional[RecalcWorker]:
+    """
+    Start the background worker if ASYNC_RECALC is enabled (app startup).
+    """
+    global _worker
+    if not ASYNC_RECALC:
+        return None
+    if _worker is None:
+        _worker = RecalcWorker()
+        _worker.start()
+        logger.info("[Recalc] Background re-lot worker started.")
+    return _worker
+
+
+def stop_recalc_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
+
+
+def get_recalc_worker() -> Optional[RecalcWorker]:
+    """
+    The running worker, or None when re-lots happen in the request.
+    """
+    return _worker
+
+
+def recalc_status() -> dict:
+    worker = get_recalc_worker()
+    if worker is None:
+        return {
+            "mode": "sync",
+            "state": "idle",
+            "ledger_version": None,
+            "recalculated_version": None,
+            "pending_since": None,
+            "coalesced_edits": 0,
+            "last_duration_seconds": None,
+            "last_started_at": None,
+            "last_finished_at": None,
+            "last_error": None,
+        }
+    return worker.status()
@@ -18,10 +18,10 @@ from backend.models.account import Account
 # Services
 from backend.services.transaction import (
     recalculate_all_transactions,
-    recalculate_subsequent_transactions,  # default partial-lot approach (>=)
     get_all_transactions,
     get_btc_price,                        # for fetching historical BTC price
 )
+from backend.services.calculation import get_held_lots_as_of
 
 logger = logging.getLogger(__name__)
 
@@ -32,9 +32,9 @@ def generate_report_data(db: Session, year: int) -> Dict[str, Any]:
     This data can be passed to PDF generators or any other reporting interface.
 
     Pipeline:
-      1) Temporarily build "start_of_year_balances" by a partial-lot re-lot up to Jan 1,
-         leaving behind leftover BTC from any prior-year transactions.
-      2) Re-run a "scorched earth" re-lot for the entire year (Jan 1 through Dec 31).
+      1) Build "start_of_year_balances" from the lots held as of Jan 1 (read from
+         the lot and disposal history; nothing is re-lotted).
+      2) Re-lot the ledger so the year's lots and disposals are current.
       3) Gather transactions for that year, build capital gains, income, leftover lots, etc.
       4) Return a single dictionary with all sections.
 
@@ -49,7 +49,7 @@ def generate_report_data(db: Session, year: int) -> Dict[str, Any]:
     start_of_year_data = _build_start_of_year_balances(db, year)
 
     # ---------------------------------------------------------
-    # 2) "Scorched earth" re-lot for the entire year
+    # 2) Re-lot for the entire year (resumes from the latest valid checkpoint)
     # ---------------------------------------------------------
     recalculate_all_transactions(db)
 
@@ -111,59 +111,47 @@ def _build_start_of_year_balances(db: Session, year: int) -> List[Dict[str, Any]
     Build a list of leftover BTC lots as of just before Jan 1 of `year`.
 
     Steps:
-      1) Run `_partial_relot_strictly_after(...)`, removing usage only for
-         transactions strictly after Jan 1.
-      2) Recreate any old "Buy" or "Deposit" lots (if they were previously deleted
-         by a prior scorched-earth), so the leftover from prior years is restored.
-      3) Query the leftover open lots (acquired before Jan 1).
-      4) Fetch the BTC price for Jan 1 using `get_btc_price(...)` and value them.
-
-    We'll revert to normal for the rest of the year by calling
-    `recalculate_all_transactions(...)` after this function.
+      1) Ask the lot and disposal history which lots were held at Jan 1 and how
+         much of each was left (calculation.get_held_lots_as_of; no lot is
+         touched).
+      2) Keep those acquired before Jan 1.
+      3) Fetch the BTC price for Jan 1 using `get_btc_price(...)` and value them.
     """
     logger.info(f"Calculating start-of-year balances for {year}")
 
-    # 1) Remove usage for any transaction with timestamp strictly after Jan 1
+    # 1) + 2) Leftover BTC as of Jan 1 that was actually acquired before it
     from_dt = datetime(year, 1, 1, tzinfo=timezone.utc)
-    _partial_relot_strictly_after(db, from_dt)
-
-    # 2) Recreate any "Buy"/"Deposit" lots from prior to Jan 1 if a previous year’s
-    #    scorched-earth had deleted them. Otherwise, they'd never get re-lotted here.
-    _restore_buy_deposit_lots_before(db, from_dt)
-
-    # 3) Now query leftover BTC that was actually acquired before Jan 1
-    open_lots = (
-        db.query(BitcoinLot)
-        .filter(
-            BitcoinLot.remaining_btc > 0,
-            BitcoinLot.acquired_date < from_dt
-        )
-        .all()
-    )
+    open_lots = [
+        lot for lot in get_held_lots_as_of(db, from_dt)
+        if lot["acquired_date"] < from_dt
+    ]
 
-    # 4) Fetch historical BTC price for Jan 1
+    # 3) Fetch historical BTC price for Jan 1
     january1_price = get_btc_price(from_dt, db)
 
     results = []
     for lot in open_lots:
+        remaining_btc = lot["remaining_btc"]
+        total_btc = lot["total_btc"]
+
         # fraction leftover in the partial-lot
         fraction = Decimal("1.0")
-        if lot.total_btc and lot.total_btc > 0:
-            fraction = lot.remaining_btc / lot.total_btc
+        if total_btc and total_btc > 0:
+            fraction = remaining_btc / total_btc
 
         # cost basis leftover for that fraction
-        partial_cost = (lot.cost_basis_usd * fraction).quantize(Decimal("0.01"), ROUND_HALF_DOWN)
+        partial_cost = (lot["cost_basis_usd"] * fraction).quantize(Decimal("0.01"), ROUND_HALF_DOWN)
 
-        if lot.remaining_btc > 0:
-            avg_basis = partial_cost / lot.remaining_btc
+        if remaining_btc > 0:
+            avg_basis = partial_cost / remaining_btc
         else:
             avg_basis = Decimal("0.0")
 
         # market value as of Jan 1
-        cur_value = (lot.remaining_btc * january1_price).quantize(Decimal("0.01"), ROUND_HALF_DOWN)
+        cur_value = (remaining_btc * january1_price).quantize(Decimal("0.01"), ROUND_HALF_DOWN)
 
         results.append({
-            "quantity": float(lot.remaining_btc),
+            "quantity": float(remaining_btc),
             "avg_cost_basis": float(avg_basis),
             "value": float(cur_value),
         })
@@ -172,202 +160,6 @@ def _build_start_of_year_balances(db: Session, year: int) -> List[Dict[str, Any]
     return results
 
 
-def _partial_relot_strictly_after(db: Session, boundary_dt: datetime):
-    """
-    Helper function to remove ledger usage & lots ONLY for transactions
-    whose timestamp is strictly > boundary_dt. We then rebuild just those
-    transactions so they don't affect the leftover snapshot at boundary_dt.
-
-    If you prefer to include boundary_dt as part of the old year,
-    replace '>' with '>=' below.
-    """
-    logger.info(f"[Strict Partial Re-Lot] Excluding transactions after {boundary_dt.isoformat()}")
-
-    from backend.models.transaction import LedgerEntry, BitcoinLot, LotDisposal
-    from backend.services.transaction import (
-        build_ledger_entries_for_transaction,
-        maybe_create_bitcoin_lot,
-        maybe_dispose_lots_fifo,
-        compute_sell_summary_from_disposals,
-        maybe_transfer_bitcoin_lot,
-        _maybe_verify_balance_for_internal,
-    )
-
-    # 1) Find all transactions strictly after boundary_dt
-    affected_txs = (
-        db.query(Transaction)
-        .filter(Transaction.timestamp > boundary_dt)
-        .order_by(Transaction.timestamp.asc(), Transaction.id.asc())
-        .all()
-    )
-    if not affected_txs:
-        logger.info("[Strict Partial Re-Lot] No transactions found after boundary_dt.")
-        return
-
-    # 2) Delete ledger entries, disposals, and newly created lots for these TXs
-    tx_ids = [tx.id for tx in affected_txs]
-    db.query(LedgerEntry).filter(LedgerEntry.transaction_id.in_(tx_ids)).delete(synchronize_session=False)
-
-    # Before deleting disposals, restore remaining_btc to the source lots
-    # This ensures pre-boundary lots have correct balances for rebuilding
-    disposals_to_restore = (
-        db.query(LotDisposal)
-        .filter(LotDisposal.transaction_id.in_(tx_ids))
-        .all()
-    )
-    for disp in disposals_to_restore:
-        if disp.lot and disp.disposed_btc:
-            disp.lot.remaining_btc += disp.disposed_btc
-            db.add(disp.lot)
-    db.flush()
-
-    # For Transfer transactions, the destination lots need to be deleted
-    # and their amounts restored to source lots. Track what needs restoring.
-    transfer_lots_to_restore = (
-        db.query(BitcoinLot)
-        .join(Transaction, Transaction.id == BitcoinLot.created_txn_id)
-        .filter(
-            BitcoinLot.created_txn_id.in_(tx_ids),
-            Transaction.type == "Transfer"
-        )
-        .all()
-    )
-
-    # Find the source lots for each transfer and restore their remaining_btc
-    for dest_lot in transfer_lots_to_restore:
-        transfer_tx = dest_lot.created_transaction
-        if not transfer_tx:
-            continue
-        # The transfer moved BTC from from_account to to_account
-        # Find pre-boundary lots in the source account (from_account)
-        # and restore the transferred amount to them (LIFO to undo FIFO consumption)
-        amount_to_restore = dest_lot.total_btc + (transfer_tx.fee_amount or Decimal("0"))
-        source_lots = (
-            db.query(BitcoinLot)
-            .join(Transaction, Transaction.id == BitcoinLot.created_txn_id)
-            .filter(
-                Transaction.to_account_id == transfer_tx.from_account_id,
-                Transaction.timestamp <= boundary_dt,
-                BitcoinLot.created_txn_id.notin_(tx_ids)  # Pre-boundary lots only
-            )
-            .order_by(BitcoinLot.acquired_date.desc())  # LIFO to undo FIFO
-            .all()
-        )
-        for src_lot in source_lots:
-            if amount_to_restore <= 0:
-                break
-            # Restore up to the lot's original total
-            can_restore = src_lot.total_btc - src_lot.remaining_btc
-            restore_amt = min(can_restore, amount_to_restore)
-            if restore_amt > 0:
-                src_lot.remaining_btc += restore_amt
-                db.add(src_lot)
-                amount_to_restore -= restore_amt
-    db.flush()
-
-    db.query(LotDisposal).filter(LotDisposal.transaction_id.in_(tx_ids)).delete(synchronize_session=False)
-    db.query(BitcoinLot).filter(BitcoinLot.created_txn_id.in_(tx_ids)).delete(synchronize_session=False)
-    db.flush()
-
-    # 3) Rebuild each of those transactions from scratch in chronological order
-    for rec_tx in affected_txs:
-        # Reconstruct single-entry data
-        sub_tx_data = {
-            "from_account_id": rec_tx.from_account_id,
-            "to_account_id":   rec_tx.to_account_id,
-            "type":            rec_tx.type,
-            "amount":          rec_tx.amount,
-            "fee_amount":      rec_tx.fee_amount,
-            "fee_currency":    rec_tx.fee_currency,
-            "cost_basis_usd":  rec_tx.cost_basis_usd,
-            "proceeds_usd":    rec_tx.proceeds_usd,
-            "timestamp":       rec_tx.timestamp,
-            "source":          rec_tx.source,
-            "purpose":         rec_tx.purpose,
-        }
-
-        # Rebuild ledger lines
-        build_ledger_entries_for_transaction(rec_tx, sub_tx_data, db)
-        _maybe_verify_balance_for_internal(rec_tx, db)
-
-        # Partial-lot logic
-        if rec_tx.type in ("Deposit", "Buy"):
-            maybe_create_bitcoin_lot(rec_tx, sub_tx_data, db)
-        elif rec_tx.type in ("Sell", "Withdrawal"):
-            maybe_dispose_lots_fifo(rec_tx, sub_tx_data, db)
-            compute_sell_summary_from_disposals(rec_tx, db)
-        elif rec_tx.type == "Transfer":
-            maybe_transfer_bitcoin_lot(rec_tx, sub_tx_data, db)
-
-    db.flush()
-    logger.info("[Strict Partial Re-Lot] Completed re-lot for TXs after boundary_dt.")
-
-
-def _restore_buy_deposit_lots_before(db: Session, boundary_dt: datetime):
-    """
-    After removing usage for TXs after 'boundary_dt', older "Buy" or "Deposit"
-    transactions might still have their lots missing if they'd been deleted by
-    a previous scorched-earth run. This function re-creates those lots if needed,
-    so your partial-lot snapshot for 'boundary_dt' is correct.
-
-    Only re-lots for "Buy"/"Deposit" with timestamp <= boundary_dt.
-    We skip sells, withdrawals, etc. because we only need the leftover acquisitions.
-    """
-    logger.info(f"[Restore Pre-Boundary Lots] Checking for buys/deposits <= {boundary_dt.isoformat()}")
-
-    from backend.services.transaction import maybe_create_bitcoin_lot
-
-    # 1) Find all Buys or Deposits on or before 'boundary_dt'
-    pre_lot_txs = (
-        db.query(Transaction)
-        .filter(
-            Transaction.timestamp <= boundary_dt,
-            Transaction.type.in_(["Buy", "Deposit"])
-        )
-        .order_by(Transaction.timestamp.asc(), Transaction.id.asc())
-        .all()
-    )
-
-    if not pre_lot_txs:
-        logger.info("[Restore Pre-Boundary Lots] No pre-boundary buys/deposits found.")
-        return
-
-    # 2) For each, re-run maybe_create_bitcoin_lot
-    #    This won't duplicate an existing lot if there's already one in place,
-    #    but if the lot was deleted, it will be re-created.
-    count_restored = 0
-    for rec_tx in pre_lot_txs:
-        # Build a minimal sub_tx_data for the lot function
-        sub_tx_data = {
-            "from_account_id": rec_tx.from_account_id,
-            "to_account_id":   rec_tx.to_account_id,
-            "type":            rec_tx.type,
-            "amount":          rec_tx.amount,
-            "fee_amount":      rec_tx.fee_amount,
-            "fee_currency":    rec_tx.fee_currency,
-            "cost_basis_usd":  rec_tx.cost_basis_usd,
-            "proceeds_usd":    rec_tx.proceeds_usd,
-            "timestamp":       rec_tx.timestamp,
-            "source":          rec_tx.source,
-            "purpose":         rec_tx.purpose,
-        }
-
-        existing_lots = rec_tx.bitcoin_lots_created
-        lot_count_before = len(existing_lots)
-
-        maybe_create_bitcoin_lot(rec_tx, sub_tx_data, db)
-
-        # If a new lot was created, we can detect it by comparing list lengths
-        new_count = len(rec_tx.bitcoin_lots_created)
-        if new_count > lot_count_before:
-            count_restored += (new_count - lot_count_before)
-
-    if count_restored > 0:
-        logger.info(f"[Restore Pre-Boundary Lots] Recreated {count_restored} older lot(s).")
-    else:
-        logger.info("[Restore Pre-Boundary Lots] No older lots needed restoring.")
-
-
 def _build_capital_gains_summary(txns: List[Transaction]) -> Dict[str, Any]:
     """
     Summarizes short-term vs. long-term gains across all Sell/Withdrawal transactions
@@ -0,0 +1,174 @@
+"""
+backend/services/tax_year.py
+
+Closing a tax year.
+
+close_tax_year(year) locks every transaction up to Dec 31 of that year (UTC,
+like the reports) and writes a frozen lot checkpoint right after the year's
+last transaction: the open lots and their remaining BTC as they stood when
+the year ended. From then on:
+
+ - transactions can no longer be created in, or moved into, a closed year
+   (the locked ones already could not be edited or deleted),
+ - every re-lot, including a full one, restores the newest frozen
+   checkpoint and replays only the open years after it.
+
+Closing a year also closes every earlier one. reopen_tax_year(year) undoes
+the close for that year and all later ones: it unlocks the transactions
+those closes locked (Transaction.locked_by_year; rows locked by hand stay
+locked) and turns their frozen checkpoints back into ordinary ones, which a
+later edit can discard.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from backend.models.transaction import Transaction, LotCheckpoint, LotCheckpointEntry
+from backend.services.lot_replay import (
+    _IN_CHUNK,
+    newest_frozen_checkpoint,
+    replay_all_transactions,
+    replay_from_checkpoint,
+)
+from backend.services.recalc_worker import RECALC_WAIT_SECONDS, get_recalc_worker, relot_lock
+from backend.services.transaction import _as_utc
+
+logger = logging.getLogger(__name__)
+
+
+def _year_end(year: int) -> datetime:
+    """First instant after `year` (UTC)."""
+    return datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+
+
+def closed_through(db: Session) -> Optional[int]:
+    """
+    The latest closed tax year, or None. Every year up to it is closed.
+    """
+    return db.query(func.max(LotCheckpoint.frozen_year)).scalar()
+
+
+def list_closed_years(db: Session) -> List[dict]:
+    """
+    One entry per frozen checkpoint: the year, its last transaction and how
+    many lots were still open when it ended.
+    """
+    rows = (
+        db.query(LotCheckpoint, func.count(LotCheckpointEntry.id))
+        .outerjoin(LotCheckpointEntry, LotCheckpointEntry.checkpoint_id == LotCheckpoint.id)
+        .filter(LotCheckpoint.frozen_year.isnot(None))
+        .group_by(LotCheckpoint.id)
+        .order_by(LotCheckpoint.frozen_year.asc())
+        .all()
+    )
+    return [_describe(cp, open_lots) for cp, open_lots in rows]
+
+
+def _describe(cp: LotCheckpoint, open_lots: int) -> dict:
+    return {
+        "year": cp.frozen_year,
+        "as_of_timestamp": cp.as_of_timestamp,
+        "as_of_txn_id": cp.as_of_txn_id,
+        "transactions": cp.tx_count,
+        "open_lots": open_lots,
+    }
+
+
+def _transactions_before(db: Session, end: datetime) -> List[tuple]:
+    """
+    (id, timestamp, is_locked) of every transaction before `end`.
+    Compared in Python: stored timestamps are ISO strings with optional
+    fractional seconds.
+    """
+    rows = (
+        db.query(Transaction.id, Transaction.timestamp, Transaction.is_locked)
+        .filter(Transaction.timestamp < end + timedelta(seconds=1))
+        .all()
+    )
+    return [row for row in rows if _as_utc(row.timestamp) < end]
+
+
+def close_tax_year(db: Session, year: int) -> dict:
+    """
+    Lock every transaction through Dec 31 of `year` and freeze the lot state
+    at that point. Re-lots the open years once to produce the baseline.
+    """
+    end = _year_end(year)
+    if end > datetime.now(timezone.utc):
+        raise HTTPException(400, f"Tax year {year} has not ended yet.")
+    closed = closed_through(db)
+    if closed is not None and year <= closed:
+        raise HTTPException(400, f"Tax year {year} is already closed.")
+
+    worker = get_recalc_worker()
+    if worker is not None and not worker.wait(RECALC_WAIT_SECONDS):
+        raise HTTPException(409, "A background re-lot is still pending or failed; see /api/recalc/status.")
+
+    with relot_lock:
+        in_year = _transactions_before(db, end)
+        if not in_year:
+            raise HTTPException(400, f"No transactions on or before Dec 31, {year}.")
+        last_id = max(in_year, key=lambda row: (_as_utc(row.timestamp), row.id)).id
+
+        previous = newest_frozen_checkpoint(db)
+        if previous is not None and previous.as_of_txn_id == last_id:
+            # Nothing happened since the previous close: same lot state.
+            db.add(LotCheckpoint(
+                as_of_timestamp=previous.as_of_timestamp,
+                as_of_txn_id=previous.as_of_txn_id,
+                tx_count=previous.tx_count,
+                frozen_year=year,
+                entries=[
+                    LotCheckpointEntry(lot_id=e.lot_id, remaining_btc=e.remaining_btc)
+                    for e in previous.entries
+                ],
+            ))
+        elif previous is not None:
+            replay_from_checkpoint(db, previous, close_after=(last_id, year))
+        else:
+            replay_all_transactions(db, close_after=(last_id, year))
+
+        to_lock = [row.id for row in in_year if not row.is_locked]
+        for start in range(0, len(to_lock), _IN_CHUNK):
+            db.query(Transaction).filter(
+                Transaction.id.in_(to_lock[start:start + _IN_CHUNK])
+            ).update({"is_locked": True, "locked_by_year": year}, synchronize_session=False)
+        db.commit()
+
+    db.expire_all()
+    frozen = db.query(LotCheckpoint).filter(LotCheckpoint.frozen_year == year).one()
+    logger.info(
+        f"[TaxYear] Closed {year}: locked {len(to_lock)} transactions, "
+        f"baseline after tx {frozen.as_of_txn_id} with {len(frozen.entries)} open lots."
+    )
+    return _describe(frozen, len(frozen.entries))
+
+
+def reopen_tax_year(db: Session, year: int) -> int:
+    """
+    Reopen `year` and every later closed year: unlock the transactions their
+    closes locked and drop the frozen flag from their checkpoints. Returns
+    how many transactions were unlocked.
+    """
+    closed = closed_through(db)
+    if closed is None or year > closed:
+        raise HTTPException(400, f"Tax year {year} is not closed.")
+
+    with relot_lock:
+        unlocked = (
+            db.query(Transaction)
+            .filter(Transaction.locked_by_year >= year)
+            .update({"is_locked": False, "locked_by_year": None}, synchronize_session=False)
+        )
+        db.query(LotCheckpoint).filter(LotCheckpoint.frozen_year >= year).update(
+            {"frozen_year": None}, synchronize_session=False
+        )
+        db.commit()
+    db.expire_all()
+    logger.info(f"[TaxYear] Reopened {year}..{closed}: unlocked {unlocked} transactions.")
+    return unlocked
@@ -9,26 +9,34 @@ Core logic for BitcoinTX with a hybrid double-entry system:
  - Transfer logic that handles partial-lot fee disposal
 
 Implementation Notes:
- - "Scorched Earth": after editing or deleting a transaction, we remove
-   all ledger entries and re-lot everything in strict chronological order.
-   This is acceptable for a single-user system with a relatively small dataset.
- - If we backdate (change the timestamp to earlier), we run a partial re-lot
-   from that timestamp forward, then also do the "scorched earth" re-lot to
-   ensure consistency.
+ - "Scorched Earth": recalculate_all_transactions removes all lots and
+   disposals and re-lots everything in strict chronological order.
+ - Ledger lines depend only on their own transaction, so they are written
+   when it is created or edited and the re-lot never touches them.
+ - Editing, deleting or backdating a transaction re-lots only from the
+   earliest affected timestamp forward: the replay restores the newest saved
+   lot checkpoint before that point (see backend/services/lot_replay.py) and
+   falls back to scorched earth when there is none.
+ - Changes that only involve USD accounts skip the re-lot altogether.
 
 No references to Ghostscript remain. This file remains compatible
 with your new pdftk-based system for filling/flattening IRS forms.
 """
 
 import logging
-from datetime import datetime, timezone
-from decimal import Decimal, ROUND_HALF_DOWN, InvalidOperation
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional
+from decimal import Decimal, InvalidOperation
 from collections import defaultdict
 
 from fastapi import HTTPException
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
 
-from backend.models.transaction import (Transaction, LedgerEntry, BitcoinLot, LotDisposal)
+from backend.models.transaction import (
+    Transaction, LedgerEntry, BitcoinLot, LotDisposal, LotCheckpoint,
+)
 from backend.models.account import Account
 from backend.constants import (
     ACCOUNT_BANK,
@@ -36,9 +44,25 @@ from backend.constants import (
     ACCOUNT_EXCHANGE_BTC,
     ACCOUNT_EXTERNAL,
 )
+from backend.services.recalc_worker import get_recalc_worker, relot_lock
+from backend.services.portfolio_summary import mark_summary_stale
+from backend.services.lot_math import (
+    LotRecord,
+    btc,
+    usd,
+    to_sats,
+    to_cents,
+    prorate_cost,
+    prorate_proceeds,
+    prorate_proceeds_net_of_fee,
+    value_cents,
+)
 
 logger = logging.getLogger(__name__)
 
+# Session.info key set while inside deferred_recalculation().
+_DEFERRED_RECALC = "btctx_deferred_recalc"
+
 
 # ------------------------------------------------------------------------------
 # Public Functions (CRUD + retrieval)
@@ -76,17 +100,26 @@ def create_transaction_record(tx_data: dict, db: Session, auto_commit: bool = Tr
       8) If Withdrawal/Sell => do FIFO disposal if from_acct=BTC
       9) If disposal => compute realized gains summary
 
+    Inside deferred_recalculation(db), steps 7-9 are skipped: the lot work
+    for every inserted row is done by one re-lot when the batch closes.
+    Rows that cannot touch a lot (see _touches_btc_lots) do not widen it.
+
+    A backdated row only triggers a re-lot if it moves BTC. With
+    ASYNC_RECALC on (see recalc_worker.py), steps 7-9 are queued on the
+    background worker once the row is committed.
+
     Args:
         tx_data: Transaction data dictionary
         db: Database session
         auto_commit: If True (default), commits after creating. Set to False for bulk operations.
     """
-    # 1) Ensure BTC Fees account
-    ensure_fee_account_exists(db)
+    # 1) Ensure BTC Fees account (flushed only, when the caller commits)
+    ensure_fee_account_exists(db, commit=auto_commit)
 
     # 2 & 3) Validate transaction type and fee rules
     _enforce_transaction_type_rules(tx_data, db)
     _enforce_fee_rules(tx_data, db)
+    _enforce_open_tax_year(tx_data.get("timestamp"), db)
 
     # 4) Insert Transaction
     now_utc = datetime.now(timezone.utc)
@@ -112,6 +145,19 @@ def create_transaction_record(tx_data: dict, db: Session, auto_commit: bool = Tr
     db.add(new_tx)
     db.flush()  # new_tx.id is now available
 
+    batch = db.info.get(_DEFERRED_RECALC)
+    if batch is not None:
+        build_ledger_entries_for_transaction(new_tx, tx_data, db)
+        _maybe_verify_balance_for_internal(new_tx, db)
+        if new_tx.type == "Transfer":
+            _default_btc_transfer_fee(new_tx, db)
+        if _touches_btc_lots(db, new_tx.from_account_id, new_tx.to_account_id):
+            _widen_batch(batch, new_tx.timestamp)
+        if auto_commit:
+            db.commit()
+            db.refresh(new_tx)
+        return new_tx
+
     # 5) Build ledger lines
     remove_ledger_entries_for_tx(new_tx, db)
     build_ledger_entries_for_transaction(new_tx, tx_data, db)
@@ -119,6 +165,16 @@ def create_transaction_record(tx_data: dict, db: Session, auto_commit: bool = Tr
     # 6) Possibly skip net-zero if cross-currency
     _maybe_verify_balance_for_internal(new_tx, db)
 
+    # With the background re-lot worker running, it owns every lot write.
+    worker = get_recalc_worker() if auto_commit else None
+    if worker is not None and _touches_btc_lots(db, new_tx.from_account_id, new_tx.to_account_id):
+        if new_tx.type == "Transfer":
+            _default_btc_transfer_fee(new_tx, db)
+        db.commit()
+        worker.enqueue(new_tx.timestamp)
+        db.refresh(new_tx)
+        return new_tx
+
     # 7-9) Partial-lot logic
     if new_tx.type in ("Deposit", "Buy"):
         maybe_create_bitcoin_lot(new_tx, tx_data, db)
@@ -126,14 +182,7 @@ def create_transaction_record(tx_data: dict, db: Session, auto_commit: bool = Tr
         maybe_dispose_lots_fifo(new_tx, tx_data, db)
         compute_sell_summary_from_disposals(new_tx, db)
     elif new_tx.type == "Transfer":
-        from_acct = db.get(Account, new_tx.from_account_id)
-        # If from_acct is BTC, ensure fee_amount/currency are set
-        if from_acct and from_acct.currency == "BTC":
-            if new_tx.fee_amount is None or new_tx.fee_amount <= 0:
-                logger.warning(f"Transfer {new_tx.id} missing fee_amount; defaulting to 0")
-                new_tx.fee_amount = Decimal("0")
-            if not new_tx.fee_currency:
-                new_tx.fee_currency = "BTC"
+        _default_btc_transfer_fee(new_tx, db)
         maybe_transfer_bitcoin_lot(new_tx, tx_data, db)
 
     # If disposal => finalize realized gain summary
@@ -148,12 +197,20 @@ def create_transaction_record(tx_data: dict, db: Session, auto_commit: bool = Tr
         .order_by(Transaction.timestamp.desc())
         .first()
     )
-    if latest_other_tx and new_tx.timestamp < latest_other_tx.timestamp:
+    backdated = latest_other_tx is not None and new_tx.timestamp < latest_other_tx.timestamp
+    if backdated and _touches_btc_lots(db, new_tx.from_account_id, new_tx.to_account_id):
         logger.info(
             f"[Backdated Create] New tx {new_tx.id} at {new_tx.timestamp} is earlier than "
             f"existing tx {latest_other_tx.id} at {latest_other_tx.timestamp}. Triggering recalculation."
         )
-        recalculate_all_transactions(db)
+        recalculate_transactions_since(db, new_tx.timestamp)
+    elif not backdated:
+        # A checkpoint is dated at its last transaction: only a row that
+        # sorts last may date one (a backdated USD row would pair an early
+        # date with lot balances that include later disposals).
+        from backend.services.lot_replay import record_checkpoint_if_due
+
+        record_checkpoint_if_due(db, new_tx)
 
     if auto_commit:
         db.commit()
@@ -169,21 +226,27 @@ def update_transaction_record(transaction_id: int, tx_data: dict, db: Session):
       1) If locked => return None
       2) Re-validate usage & fee rules if relevant fields changed
       3) Overwrite transaction fields
-      4) Rebuild ledger lines & partial-lot usage
-      5) Possibly do partial-lot re-lot if backdated
-      6) Finally do "scorched earth" re-lot of everything
+      4) Rebuild this transaction's ledger lines
+      5) Re-lot from min(old timestamp, new timestamp) forward, unless
+         neither the old nor the new version touches a BTC account
     """
     tx = get_transaction_by_id(db, transaction_id)
     if not tx or tx.is_locked:
         return None
 
     old_timestamp = tx.timestamp
+    touched_lots = _touches_btc_lots(db, tx.from_account_id, tx.to_account_id)
 
     # Step 2) Re-validate usage & fee rules if certain fields changed
     if any(k in tx_data for k in ("type", "from_account_id", "to_account_id")):
         _enforce_transaction_type_rules(tx_data, db)
     if any(k in tx_data for k in ("fee_amount", "fee_currency", "type")):
         _enforce_fee_rules(tx_data, db)
+    if "timestamp" in tx_data:
+        _enforce_open_tax_year(tx_data["timestamp"], db)
+
+    # Read before the overwrite: it depends on the stored fee.
+    entered_proceeds = None if "proceeds_usd" in tx_data else _entered_sell_proceeds(tx)
 
     # Step 3) Overwrite relevant fields
     if "from_account_id" in tx_data:
@@ -219,19 +282,31 @@ def update_transaction_record(transaction_id: int, tx_data: dict, db: Session):
     # Flush the transaction field changes first
     db.flush()
 
-    # Do a single "Scorched Earth" re-lot to rebuild everything correctly.
-    # This handles all cases (backdating, forward-dating, same timestamp) uniformly.
-    # The partial recalculate_subsequent_transactions was causing issues when
-    # lots from before the new timestamp still had reduced remaining_btc from
-    # the original transaction's consumption.
+    # Ledger lines depend only on this transaction, never on FIFO order,
+    # so they are rebuilt here and the re-lot below leaves them alone.
+    line_data = _tx_data_from_record(tx)
+    if entered_proceeds is not None:
+        line_data["proceeds_usd"] = entered_proceeds
+    remove_ledger_entries_for_tx(tx, db)
+    build_ledger_entries_for_transaction(tx, line_data, db)
+    _maybe_verify_balance_for_internal(tx, db)
+
+    if not touched_lots and not _touches_btc_lots(db, tx.from_account_id, tx.to_account_id):
+        logger.info(f"[Update] Tx {tx.id} is USD-only; skipping the re-lot.")
+        _finish_write(db, None)
+        db.refresh(tx)
+        return tx
+
+    # Re-lot from whichever position comes first. Restoring a lot checkpoint
+    # taken before that point also rewinds remaining_btc on older lots that
+    # the original version of this transaction consumed.
     new_timestamp = tx.timestamp
+    since = min(_as_utc(old_timestamp), _as_utc(new_timestamp))
     logger.info(
         f"[Update] Tx {tx.id} timestamp {old_timestamp} => {new_timestamp}. "
-        f"Running scorched earth re-lot."
+        f"Re-lotting from {since}."
     )
-    recalculate_all_transactions(db)
-
-    db.commit()
+    _finish_write(db, since)
     db.refresh(tx)
     return tx
 
@@ -239,33 +314,166 @@ def update_transaction_record(transaction_id: int, tx_data: dict, db: Session):
 def delete_transaction_record(transaction_id: int, db: Session):
     """
     Delete a transaction if not locked.
-    Removes ledger entries, partial-lot usage, and re-lots everything.
+    Removes ledger entries, partial-lot usage, and re-lots everything
+    from its timestamp forward (skipped for USD-only transactions, whose
+    ledger lines go with the row).
     """
     tx = get_transaction_by_id(db, transaction_id)
     if not tx or tx.is_locked:
         return False
 
+    since = tx.timestamp
+    touched_lots = _touches_btc_lots(db, tx.from_account_id, tx.to_account_id)
     db.delete(tx)
-    db.commit()
+    db.flush()
 
-    recalculate_all_transactions(db)
+    _finish_write(db, since if touched_lots else None)
     return True
 
 
+@contextmanager
+def deferred_recalculation(db: Session):
+    """
+    Batch mode for bulk inserts (CSV / River import).
+
+    While the block runs, create_transaction_record only inserts Transaction
+    rows and their ledger lines: no lot work and no per-row backdating re-lot.
+    update_transaction_record and delete_transaction_record neither commit
+    nor re-lot. On a clean exit, a single re-lot runs from the earliest
+    timestamp any of them touched, before the caller commits. Errors raised
+    by that re-lot (e.g. "Not enough BTC") propagate like they would for a
+    single row.
+    Nested use joins the outer batch.
+    """
+    if db.info.get(_DEFERRED_RECALC) is not None:
+        yield
+        return
+
+    batch = {"since": None}
+    db.info[_DEFERRED_RECALC] = batch
+    try:
+        yield
+    finally:
+        db.info.pop(_DEFERRED_RECALC, None)
+
+    if batch["since"] is not None:
+        logger.info(f"[Batch] Re-lotting once from {batch['since']}")
+        recalculate_transactions_since(db, batch["since"])
+
+
 # ------------------------------------------------------------------------------
 # Internal Helpers
 # ------------------------------------------------------------------------------
-def ensure_fee_account_exists(db: Session):
+def _finish_write(db: Session, since: Optional[datetime]):
+    """
+    Commit an update/delete and re-lot from `since` (None: no lot can have
+    changed). Inside deferred_recalculation nothing is committed and the
+    batch's re-lot is widened instead. With the background worker running
+    (ASYNC_RECALC), the edit is committed first and the re-lot queued.
+    """
+    batch = db.info.get(_DEFERRED_RECALC)
+    if batch is not None:
+        if since is not None:
+            _widen_batch(batch, since)
+        return
+    if since is None:
+        db.commit()
+        return
+    worker = get_recalc_worker()
+    if worker is None:
+        recalculate_transactions_since(db, since)
+        db.commit()
+        return
+    db.commit()
+    worker.enqueue(since)
+
+
+def _widen_batch(batch: dict, since: datetime):
+    since = _as_utc(since)
+    if batch["since"] is None or since < batch["since"]:
+        batch["since"] = since
+
+
+def _default_btc_transfer_fee(tx: Transaction, db: Session):
+    """
+    If the Transfer leaves a BTC account, ensure fee_amount/currency are set.
+    """
+    from_acct = db.get(Account, tx.from_account_id)
+    if from_acct and from_acct.currency == "BTC":
+        if tx.fee_amount is None or tx.fee_amount <= 0:
+            logger.warning(f"Transfer {tx.id} missing fee_amount; defaulting to 0")
+            tx.fee_amount = Decimal("0")
+        if not tx.fee_currency:
+            tx.fee_currency = "BTC"
+
+
+def _touches_btc_lots(db: Session, from_account_id, to_account_id) -> bool:
+    """
+    Whether a transaction between these accounts can create, consume or
+    split a BitcoinLot. Only BTC accounts hold lots, so anything that stays
+    between USD accounts (Bank -> Exchange USD, a Withdrawal from Bank)
+    leaves every lot queue, and every later disposal, as it was.
+    """
+    for account_id in (from_account_id, to_account_id):
+        acct = db.get(Account, account_id) if account_id is not None else None
+        if acct is not None and acct.currency == "BTC":
+            return True
+    return False
+
+
+def _tx_data_from_record(tx: Transaction) -> dict:
+    """
+    Rebuild the single-entry dict the ledger/lot helpers expect from a stored row.
+    """
+    return {
+        "from_account_id": tx.from_account_id,
+        "to_account_id": tx.to_account_id,
+        "type": tx.type,
+        "amount": tx.amount,
+        "fee_amount": tx.fee_amount,
+        "fee_currency": tx.fee_currency,
+        "cost_basis_usd": tx.cost_basis_usd,
+        "proceeds_usd": tx.proceeds_usd,
+        "timestamp": tx.timestamp,
+        "source": tx.source,
+        "purpose": tx.purpose,
+        "gross_proceeds_usd": tx.gross_proceeds_usd,
+        "fmv_usd": tx.fmv_usd,
+    }
+
+
+def _entered_sell_proceeds(tx: Transaction) -> Optional[Decimal]:
+    """
+    A Sell entered without a gross stores proceeds_usd net of its USD fee,
+    and rebuilding its ledger lines deducts the fee from proceeds_usd. For
+    an edit that leaves proceeds_usd alone, return the amount as entered
+    (net + the stored fee) so the fee is deducted once; None otherwise.
+    """
+    if tx.type != "Sell" or tx.proceeds_usd is None:
+        return None
+    if tx.gross_proceeds_usd is not None and tx.gross_proceeds_usd > 0:
+        return None
+    if (tx.fee_currency or "").upper() != "USD":
+        return None
+    return tx.proceeds_usd + (tx.fee_amount or Decimal("0"))
+
+
+def ensure_fee_account_exists(db: Session, commit: bool = True):
     """
     If 'BTC Fees' doesn't exist, create it.
     This prevents referencing a non-existent account in fee lines.
+    With commit=False the new account is only flushed, so it is rolled back
+    with the caller's transaction (batches, imports).
     """
     fee_acct = db.query(Account).filter_by(name="BTC Fees").first()
     if not fee_acct:
         fee_acct = Account(user_id=1, name="BTC Fees", currency="BTC")
         db.add(fee_acct)
-        db.commit()
-        db.refresh(fee_acct)
+        if commit:
+            db.commit()
+            db.refresh(fee_acct)
+        else:
+            db.flush()
     return fee_acct
 
 
@@ -278,25 +486,41 @@ def remove_ledger_entries_for_tx(tx: Transaction, db: Session):
     db.flush()
 
 
-def remove_lot_usage_for_tx(tx: Transaction, db: Session):
+def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Session):
     """
-    Remove partial-lot disposals & newly created lots for the transaction.
+    Convert single-entry data => multi-line ledger.
+    Handles cross-currency Buy/Sell logic, Transfer fees, etc.
 
-    Note: This function is currently unused - update_transaction_record and
-    delete_transaction_record both use scorched earth (recalculate_all_transactions)
-    instead. Kept for potential future use.
+    The line layout itself lives in _ledger_lines_for_transaction so the
+    in-memory replay (backend/services/lot_replay.py) builds identical lines.
     """
-    for disp in list(tx.lot_disposals):
-        db.delete(disp)
-    for lot in list(tx.bitcoin_lots_created):
-        db.delete(lot)
+    lines = _ledger_lines_for_transaction(tx, tx_data, _load_accounts(db))
+    for line in lines:
+        db.add(LedgerEntry(transaction_id=tx.id, timestamp=tx.timestamp, **line))
     db.flush()
 
 
-def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Session):
+def _load_accounts(db: Session) -> dict:
     """
-    Convert single-entry data => multi-line ledger.
-    Handles cross-currency Buy/Sell logic, Transfer fees, etc.
+    Return every Account keyed by id (a handful of rows, one query).
+    """
+    return {acct.id: acct for acct in db.query(Account).all()}
+
+
+def _account_named(accounts: dict, name: str):
+    """
+    Look up an account by its unique name in an _load_accounts() mapping.
+    """
+    for acct in accounts.values():
+        if acct.name == name:
+            return acct
+    return None
+
+
+def _ledger_lines_for_transaction(tx: Transaction, tx_data: dict, accounts: dict) -> list:
+    """
+    Build the ledger lines for one transaction as plain dicts
+    (account_id, amount, currency, entry_type) without touching the session.
 
     CHANGES FOR GROSS_PROCEEDS_USD:
     For Sells, we now read 'gross_proceeds_usd' and subtract fees
@@ -315,8 +539,9 @@ def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Ses
     proceeds_raw = tx_data.get("proceeds_usd") or "0"
     proceeds_usd = Decimal(proceeds_raw)
 
-    from_acct = db.get(Account, from_acct_id) if from_acct_id else None
-    to_acct = db.get(Account, to_acct_id) if to_acct_id else None
+    from_acct = accounts.get(from_acct_id) if from_acct_id else None
+    to_acct = accounts.get(to_acct_id) if to_acct_id else None
+    lines = []
 
     # -------------------------------------------------------------------------
     # 1) Transfer with BTC fee
@@ -328,8 +553,7 @@ def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Ses
         and fee_amount > 0
     ):
         # Debit from_acct
-        db.add(LedgerEntry(
-            transaction_id=tx.id,
+        lines.append(dict(
             account_id=from_acct.id,
             amount=-amount,
             currency=from_acct.currency,
@@ -338,24 +562,21 @@ def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Ses
         # Credit to_acct minus fee
         if to_acct and amount > 0:
             net_in = amount - fee_amount
-            db.add(LedgerEntry(
-                transaction_id=tx.id,
+            lines.append(dict(
                 account_id=to_acct.id,
                 amount=net_in if net_in > 0 else Decimal("0"),
                 currency=to_acct.currency,
                 entry_type="MAIN_IN"
             ))
-        fee_acct = db.query(Account).filter_by(name="BTC Fees").first()
+        fee_acct = _account_named(accounts, "BTC Fees")
         if fee_acct:
-            db.add(LedgerEntry(
-                transaction_id=tx.id,
+            lines.append(dict(
                 account_id=fee_acct.id,
                 amount=fee_amount,
                 currency="BTC",
                 entry_type="FEE"
             ))
-        db.flush()
-        return
+        return lines
 
     # -------------------------------------------------------------------------
     # 2) Sell => from BTC => to USD
@@ -367,8 +588,7 @@ def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Ses
     ):
         # Subtract BTC out of from_acct
         if amount > 0:
-            db.add(LedgerEntry(
-                transaction_id=tx.id,
+            lines.append(dict(
                 account_id=from_acct.id,
                 amount=-amount,
                 currency="BTC",
@@ -377,25 +597,8 @@ def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Ses
 
         # NEW OR MODIFIED FOR GROSS_PROCEEDS_USD:
         # Check if user typed 'gross_proceeds_usd'; if present, derive net from that.
-        gross_raw = tx_data.get("gross_proceeds_usd") or "0"
-        gross_usd = Decimal(gross_raw)
-
-        if gross_usd > 0:
-            # If fee is in USD, net = (gross - fee)
-            if fee_currency == "USD":
-                net_usd_in = gross_usd - fee_amount
-                if net_usd_in < 0:
-                    net_usd_in = Decimal("0")
-            else:
-                # If fee is BTC, we do not reduce the gross USD
-                net_usd_in = gross_usd
-
-            # Overwrite proceeds_usd so aggregator & partial-lot disposal see net
-            tx_data["proceeds_usd"] = str(net_usd_in)
-            tx.proceeds_usd = net_usd_in
-            # Also store the user's typed gross in DB
-            tx.gross_proceeds_usd = gross_usd
-        else:
+        net_usd_in = _apply_gross_sell_proceeds(tx, tx_data)
+        if net_usd_in is None:
             # If user did NOT provide 'gross_proceeds_usd',
             # fallback to old logic using 'proceeds_usd'
             net_usd_in = proceeds_usd
@@ -408,8 +611,7 @@ def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Ses
 
         # Credit net to the to_acct
         if net_usd_in > 0:
-            db.add(LedgerEntry(
-                transaction_id=tx.id,
+            lines.append(dict(
                 account_id=to_acct.id,
                 amount=net_usd_in,
                 currency="USD",
@@ -417,18 +619,16 @@ def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Ses
             ))
         # Fee line if fee is USD
         if fee_amount > 0 and fee_currency == "USD":
-            fee_acct = db.query(Account).filter_by(name="USD Fees").first()
+            fee_acct = _account_named(accounts, "USD Fees")
             if fee_acct:
-                db.add(LedgerEntry(
-                    transaction_id=tx.id,
+                lines.append(dict(
                     account_id=fee_acct.id,
                     amount=fee_amount,
                     currency="USD",
                     entry_type="FEE"
                 ))
 
-        db.flush()
-        return
+        return lines
 
     # -------------------------------------------------------------------------
     # 3) Buy => from USD => to BTC
@@ -443,49 +643,43 @@ def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Ses
         cost_basis_usd = Decimal(tx_data.get("cost_basis_usd") or 0)
 
         total_usd_out = cost_basis_usd + fee_amt
-        db.add(LedgerEntry(
-            transaction_id=tx.id,
+        lines.append(dict(
             account_id=from_acct.id,
             amount=-total_usd_out,
             currency="USD",
             entry_type="MAIN_OUT"
         ))
         if amount_btc > 0:
-            db.add(LedgerEntry(
-                transaction_id=tx.id,
+            lines.append(dict(
                 account_id=to_acct.id,
                 amount=amount_btc,
                 currency="BTC",
                 entry_type="MAIN_IN"
             ))
         if fee_amt > 0 and fee_currency == "USD":
-            fee_acct = db.query(Account).filter_by(name="USD Fees").first()
+            fee_acct = _account_named(accounts, "USD Fees")
             if fee_acct:
-                db.add(LedgerEntry(
-                    transaction_id=tx.id,
+                lines.append(dict(
                     account_id=fee_acct.id,
                     amount=fee_amt,
                     currency="USD",
                     entry_type="FEE"
                 ))
-        db.flush()
-        return
+        return lines
 
     # -------------------------------------------------------------------------
     # 4) Fallback: Deposits, Withdrawals, or other
     # -------------------------------------------------------------------------
     if from_acct and amount > 0:
         main_out_amt = -(amount + fee_amount)
-        db.add(LedgerEntry(
-            transaction_id=tx.id,
+        lines.append(dict(
             account_id=from_acct.id,
             amount=main_out_amt,
             currency=from_acct.currency,
             entry_type="MAIN_OUT"
         ))
     if to_acct and amount > 0:
-        db.add(LedgerEntry(
-            transaction_id=tx.id,
+        lines.append(dict(
             account_id=to_acct.id,
             amount=amount,
             currency=to_acct.currency,
@@ -494,18 +688,50 @@ def build_ledger_entries_for_transaction(tx: Transaction, tx_data: dict, db: Ses
     if fee_amount > 0:
         # Fee to either BTC Fees or USD Fees
         if fee_currency == "BTC":
-            fee_acct = db.query(Account).filter_by(name="BTC Fees").first()
+            fee_acct = _account_named(accounts, "BTC Fees")
         else:
-            fee_acct = db.query(Account).filter_by(name="USD Fees").first()
+            fee_acct = _account_named(accounts, "USD Fees")
         if fee_acct:
-            db.add(LedgerEntry(
-                transaction_id=tx.id,
+            lines.append(dict(
                 account_id=fee_acct.id,
                 amount=fee_amount,
                 currency=fee_currency,
                 entry_type="FEE"
             ))
-    db.flush()
+    return lines
+
+
+def _apply_gross_sell_proceeds(tx: Transaction, tx_data: dict):
+    """
+    For a Sell entered with 'gross_proceeds_usd', derive the net proceeds
+    (gross minus a USD fee) and store it on tx.proceeds_usd / tx_data, where
+    partial-lot disposal and the aggregator read it. Returns the net, or
+    None if no gross was typed.
+
+    Idempotent, so the lot replay re-applies it without rebuilding the
+    ledger lines.
+    """
+    gross_usd = Decimal(tx_data.get("gross_proceeds_usd") or "0")
+    if gross_usd <= 0:
+        return None
+
+    fee_amount = Decimal(tx_data.get("fee_amount") or "0.0")
+    fee_currency = (tx_data.get("fee_currency") or "BTC").upper()
+    # If fee is in USD, net = (gross - fee)
+    if fee_currency == "USD":
+        net_usd_in = gross_usd - fee_amount
+        if net_usd_in < 0:
+            net_usd_in = Decimal("0")
+    else:
+        # If fee is BTC, we do not reduce the gross USD
+        net_usd_in = gross_usd
+
+    # Overwrite proceeds_usd so aggregator & partial-lot disposal see net
+    tx_data["proceeds_usd"] = str(net_usd_in)
+    tx.proceeds_usd = net_usd_in
+    # Also store the user's typed gross in DB
+    tx.gross_proceeds_usd = gross_usd
+    return net_usd_in
 
 
 def maybe_create_bitcoin_lot(tx: Transaction, tx_data: dict, db: Session):
@@ -517,29 +743,73 @@ def maybe_create_bitcoin_lot(tx: Transaction, tx_data: dict, db: Session):
     if not to_acct or to_acct.currency != "BTC":
         return
 
-    btc_amount = tx.amount or Decimal("0")
-    if btc_amount <= 0:
+    acquisition = _acquired_lot_values(tx, tx_data)
+    if acquisition is None:
         return
-
-    cost_basis = Decimal(tx_data.get("cost_basis_usd") or 0)
-    fee_cur = (tx_data.get("fee_currency") or "").upper()
-    fee_amt = Decimal(tx_data.get("fee_amount") or "0.0")
-
-    # If it's a Buy w/ USD fee, add that fee to cost basis
-    if tx.type == "Buy" and fee_cur == "USD":
-        cost_basis += fee_amt
+    sats, cost_cents = acquisition
 
     new_lot = BitcoinLot(
         created_txn_id=tx.id,
+        account_id=to_acct.id,
         acquired_date=tx.timestamp,
-        total_btc=btc_amount,
-        remaining_btc=btc_amount,
-        cost_basis_usd=cost_basis,
+        total_btc=btc(sats),
+        remaining_btc=btc(sats),
+        cost_basis_usd=usd(cost_cents),
     )
     db.add(new_lot)
     db.flush()
 
 
+def _acquired_lot_values(tx: Transaction, tx_data: dict):
+    """
+    Return (sats, cost_cents) for the lot a Deposit/Buy into a BTC account
+    creates, or None when no lot is needed.
+    """
+    sats = to_sats(tx.amount)
+    if sats <= 0:
+        return None
+
+    cost_cents = to_cents(tx_data.get("cost_basis_usd"))
+    fee_cur = (tx_data.get("fee_currency") or "").upper()
+
+    # If it's a Buy w/ USD fee, add that fee to cost basis
+    if tx.type == "Buy" and fee_cur == "USD":
+        cost_cents += to_cents(tx_data.get("fee_amount"))
+    return sats, cost_cents
+
+
+def _open_lots_for_account(db: Session, account_id: int):
+    """
+    Lots still holding BTC in the given account, oldest acquisition first.
+    A range scan over the ix_bitcoin_lots_open_fifo partial index.
+    """
+    return (
+        db.query(BitcoinLot)
+        .filter(
+            BitcoinLot.account_id == account_id,
+            BitcoinLot.remaining_btc > 0,
+        )
+        .order_by(BitcoinLot.acquired_date.asc(), BitcoinLot.id.asc())
+        .all()
+    )
+
+
+def _as_utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+
+def _holding_period(acquired_date: datetime, disposed_at: datetime) -> str:
+    """
+    'LONG' if held at least 365 days, else 'SHORT'.
+    """
+    if acquired_date.tzinfo is None:
+        acquired_date = acquired_date.replace(tzinfo=timezone.utc)
+    if disposed_at.tzinfo is None:
+        disposed_at = disposed_at.replace(tzinfo=timezone.utc)
+    days_held = (disposed_at - acquired_date).days
+    return "LONG" if days_held >= 365 else "SHORT"
+
+
 def maybe_dispose_lots_fifo(tx: Transaction, tx_data: dict, db: Session):
     """
     For a Sell/Withdrawal from a BTC account, do FIFO disposal of partial lots.
@@ -551,113 +821,132 @@ def maybe_dispose_lots_fifo(tx: Transaction, tx_data: dict, db: Session):
     if not from_acct or from_acct.currency != "BTC":
         return
 
-    btc_outflow = Decimal(tx.amount or 0)
-    if (tx.fee_currency or "").upper() == "BTC":
-        btc_outflow += Decimal(tx.fee_amount or 0)
-    if btc_outflow <= 0:
+    outflow_sats = _disposal_outflow(tx)
+    if outflow_sats <= 0:
         return
 
+    # Only consume lots from the account we're selling/withdrawing from
+    rows = _open_lots_for_account(db, tx.from_account_id)
+    records = [LotRecord.from_row(row) for row in rows]
+    disposals = _dispose_lots_fifo(tx, tx_data, records, outflow_sats)
+    _write_back_remaining(rows, records)
+    for disp in disposals:
+        db.add(LotDisposal(lot_id=disp["lot"].id, transaction_id=tx.id, **_disposal_columns(disp)))
+
+    db.flush()
+
+
+def _write_back_remaining(rows, records):
+    """
+    Copy remaining_sats from LotRecords back onto the BitcoinLot rows they
+    were built from (same order), touching only the lots that changed.
+    """
+    for row, record in zip(rows, records):
+        remaining = btc(record.remaining_sats)
+        if row.remaining_btc != remaining:
+            row.remaining_btc = remaining
+
+
+def _disposal_columns(disp: dict) -> dict:
+    """
+    LotDisposal column values for a disposal dict from _dispose_lots_fifo or
+    _split_lots_for_transfer.
+    """
+    return {
+        "disposed_btc": btc(disp["sats"]),
+        "disposal_basis_usd": usd(disp["basis_cents"]),
+        "proceeds_usd_for_that_portion": usd(disp["proceeds_cents"]),
+        "realized_gain_usd": usd(disp["gain_cents"]),
+        "holding_period": disp["holding_period"],
+    }
+
+
+def _disposal_outflow(tx: Transaction) -> int:
+    """
+    Satoshis leaving the account on a Sell/Withdrawal: amount plus any BTC fee.
+    """
+    outflow_sats = to_sats(tx.amount)
+    if (tx.fee_currency or "").upper() == "BTC":
+        outflow_sats += to_sats(tx.fee_amount)
+    return outflow_sats
+
+
+def _dispose_lots_fifo(tx: Transaction, tx_data: dict, lots, outflow_sats: int) -> list:
+    """
+    Consume `lots` (LotRecords, oldest first) for a Sell/Withdrawal of
+    `outflow_sats`.
+
+    Decrements lot.remaining_sats in place and returns one dict per touched
+    lot: its "lot" plus sats / basis_cents / proceeds_cents / gain_cents and
+    holding_period (see _disposal_columns).
+    """
     # 1) Safely parse proceeds. Default to 0 if None/invalid
     # IMPORTANT: Use tx.proceeds_usd as the authoritative value if available,
     # since build_ledger_entries_for_transaction already calculated it correctly
     # from gross_proceeds_usd. This prevents degradation during recalculation.
     if tx.proceeds_usd is not None:
-        total_proceeds = Decimal(tx.proceeds_usd)
+        proceeds_cents = to_cents(tx.proceeds_usd)
     else:
         raw_proceeds = tx_data.get("proceeds_usd")
-        if raw_proceeds is None:
-            total_proceeds = Decimal("0")
-        else:
-            try:
-                total_proceeds = Decimal(str(raw_proceeds))
-            except (ValueError, TypeError, InvalidOperation):
-                total_proceeds = Decimal("0")
+        try:
+            proceeds_cents = to_cents(raw_proceeds)
+        except (ValueError, TypeError, InvalidOperation):
+            proceeds_cents = 0
 
     # 2) Check purpose for forced 0 or "Spent" logic
     purpose_lower = (tx.purpose or "").lower()
+    fee_sats = 0
     if tx.type == "Withdrawal" and purpose_lower in ("gift", "donation", "lost"):
-        total_proceeds = Decimal("0")
+        proceeds_cents = 0
     elif tx.type == "Withdrawal" and purpose_lower == "spent":
-        fee_btc = Decimal(tx.fee_amount or 0)
-        fee_cur = (tx.fee_currency or "").upper()
-        if fee_btc > 0 and fee_cur == "BTC" and btc_outflow > 0 and total_proceeds > 0:
-            implied_price = total_proceeds / btc_outflow
-            fee_in_usd = fee_btc * implied_price
-            net_proceeds = total_proceeds - fee_in_usd
-            if net_proceeds < 0:
-                net_proceeds = Decimal("0")
-            total_proceeds = net_proceeds
+        # The BTC fee is valued at the implied price (proceeds / outflow)
+        # and taken off the proceeds; see prorate_proceeds_net_of_fee.
+        if (tx.fee_currency or "").upper() == "BTC" and outflow_sats > 0 and proceeds_cents > 0:
+            fee_sats = max(to_sats(tx.fee_amount), 0)
 
     # 3) FIFO disposal across lots (account-specific)
-    # Only consume lots from the account we're selling/withdrawing from
-    lots = (
-        db.query(BitcoinLot)
-        .join(Transaction, Transaction.id == BitcoinLot.created_txn_id)
-        .filter(
-            BitcoinLot.remaining_btc > 0,
-            Transaction.to_account_id == tx.from_account_id
-        )
-        .order_by(BitcoinLot.acquired_date.asc())
-        .all()
-    )
-    remaining_outflow = btc_outflow
-    total_outflow = btc_outflow
+    remaining_outflow = outflow_sats
+    disposals = []
 
     for lot in lots:
         if remaining_outflow <= 0:
             break
-        if lot.remaining_btc <= 0:
+        if lot.remaining_sats <= 0:
             continue
 
-        can_use = min(lot.remaining_btc, remaining_outflow)
-        cost_per_btc = (
-            lot.cost_basis_usd / lot.total_btc
-            if lot.total_btc
-            else Decimal("0")
-        )
-        disposal_basis = (cost_per_btc * can_use).quantize(Decimal("0.01"), rounding=ROUND_HALF_DOWN)
-
-        partial_proceeds = Decimal("0")
-        if total_outflow > 0:
-            ratio = can_use / total_outflow
-            partial_proceeds = (ratio * total_proceeds).quantize(Decimal("0.01"), rounding=ROUND_HALF_DOWN)
+        can_use = min(lot.remaining_sats, remaining_outflow)
+        basis_cents = prorate_cost(lot.cost_cents, can_use, lot.total_sats)
+        if fee_sats:
+            proceeds_part = prorate_proceeds_net_of_fee(proceeds_cents, can_use, outflow_sats, fee_sats)
+        else:
+            proceeds_part = prorate_proceeds(proceeds_cents, can_use, outflow_sats)
 
-        disposal_gain = partial_proceeds - disposal_basis
+        gain_cents = proceeds_part - basis_cents
         # If Gift/Donation => override gain to 0 (no taxable event for giver)
         # Note: "Lost" is NOT included here - lost BTC results in a capital loss
         # (proceeds=0, gain = 0 - cost_basis = negative loss, which is deductible)
         if tx.type == "Withdrawal" and purpose_lower in ("gift", "donation"):
-            disposal_gain = Decimal("0.0")
-
-        # Determine holding period
-        acquired_date = lot.acquired_date
-        if acquired_date.tzinfo is None:
-            acquired_date = acquired_date.replace(tzinfo=timezone.utc)
-        days_held = (tx.timestamp - acquired_date).days
-        hp = "LONG" if days_held >= 365 else "SHORT"
-
-        disp = LotDisposal(
-            lot_id=lot.id,
-            transaction_id=tx.id,
-            disposed_btc=can_use,
-            disposal_basis_usd=disposal_basis,
-            proceeds_usd_for_that_portion=partial_proceeds,
-            realized_gain_usd=disposal_gain,
-            holding_period=hp
-        )
-        db.add(disp)
-
-        lot.remaining_btc -= can_use
+            gain_cents = 0
+
+        disposals.append({
+            "lot": lot,
+            "sats": can_use,
+            "basis_cents": basis_cents,
+            "proceeds_cents": proceeds_part,
+            "gain_cents": gain_cents,
+            "holding_period": _holding_period(lot.acquired_date, tx.timestamp),
+        })
+
+        lot.remaining_sats -= can_use
         remaining_outflow -= can_use
 
     # Validate that we had enough BTC to complete the disposal
-    if remaining_outflow > Decimal("0.00000001"):  # 1 satoshi tolerance for rounding
+    if remaining_outflow > 1:  # 1 satoshi tolerance for rounding
         raise HTTPException(
             status_code=400,
-            detail=f"Not enough BTC to {tx.type.lower()} {btc_outflow:.8f} BTC"
+            detail=f"Not enough BTC to {tx.type.lower()} {btc(outflow_sats):.8f} BTC"
         )
-
-    db.flush()
+    return disposals
 
 
 def compute_sell_summary_from_disposals(tx: Transaction, db: Session):
@@ -675,82 +964,85 @@ def compute_sell_summary_from_disposals(tx: Transaction, db: Session):
     if not disposals:
         return
 
-    total_basis = Decimal("0.0")
-    total_gain = Decimal("0.0")
-    total_proceeds = Decimal("0.0")
+    _apply_sell_summary(tx, [
+        (to_cents(disp.disposal_basis_usd), to_cents(disp.realized_gain_usd),
+         to_cents(disp.proceeds_usd_for_that_portion),
+         disp.lot.acquired_date if disp.lot else None)  # Eager loaded, no additional query
+        for disp in disposals
+    ])
+    db.flush()
+
+
+def _apply_sell_summary(tx: Transaction, parts: list):
+    """
+    Write the transaction-level gain summary from its disposal parts, given as
+    (basis_cents, gain_cents, proceeds_cents, lot_acquired_date) tuples.
+    """
+    total_basis = 0
+    total_gain = 0
+    total_proceeds = 0
     earliest_date = None
 
-    for disp in disposals:
-        total_basis += (disp.disposal_basis_usd or Decimal("0"))
-        total_gain += (disp.realized_gain_usd or Decimal("0"))
-        total_proceeds += (disp.proceeds_usd_for_that_portion or Decimal("0"))
+    for basis, gain, proceeds, acquired_date in parts:
+        total_basis += basis
+        total_gain += gain
+        total_proceeds += proceeds
 
-        lot = disp.lot  # Eager loaded, no additional query
-        if lot and (earliest_date is None or lot.acquired_date < earliest_date):
-            earliest_date = lot.acquired_date
+        if acquired_date and (earliest_date is None or acquired_date < earliest_date):
+            earliest_date = acquired_date
 
-    tx.cost_basis_usd = total_basis
-    tx.realized_gain_usd = total_gain
+    tx.cost_basis_usd = usd(total_basis)
+    tx.realized_gain_usd = usd(total_gain)
 
     if total_proceeds > 0:
-        tx.proceeds_usd = total_proceeds
+        tx.proceeds_usd = usd(total_proceeds)
 
     if earliest_date:
-        if earliest_date.tzinfo is None:
-            earliest_date = earliest_date.replace(tzinfo=timezone.utc)
-        days_held = (tx.timestamp - earliest_date).days
-        tx.holding_period = "LONG" if days_held >= 365 else "SHORT"
+        tx.holding_period = _holding_period(earliest_date, tx.timestamp)
     else:
         tx.holding_period = None
 
-    db.flush()
-
 
 def get_btc_price(timestamp: datetime, db: Session) -> Decimal:
     """
     Fetch the historical BTC price in USD at the given timestamp.
-    Uses the bitcoin service directly (no HTTP calls to self).
+    With an intraday series configured (intraday_prices.py), the bar
+    nearest the timestamp wins. Otherwise reads the local daily price
+    store (see price_store.py); only a missing day goes to the bitcoin
+    service (no HTTP calls to self), and the answer is stored in this
+    session.
     If historical fails, fallback to live price.
     """
-    import asyncio
-    import concurrent.futures
-    from backend.services.bitcoin import get_historical_price, get_current_price
-
-    timestamp_str = timestamp.strftime("%Y-%m-%d")
-
-    def _fetch_historical():
-        """Run async price fetch in a new thread with its own event loop."""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(get_historical_price(timestamp_str))
-        finally:
-            loop.close()
-
-    def _fetch_current():
-        """Run async price fetch in a new thread with its own event loop."""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(get_current_price())
-        finally:
-            loop.close()
-
+    from backend.services import price_store
+    from backend.services.bitcoin import fetch_historical_price, get_current_price
+    from backend.services.intraday_prices import get_intraday_series
+    from backend.services.price_client import get_price_client
+
+    intraday = get_intraday_series()
+    if intraday is not None:
+        price = intraday.nearest(timestamp)
+        if price is not None:
+            return price
+
+    day = timestamp.date()
+    stored = price_store.get_stored_price(db, day)
+    if stored is not None:
+        return stored
+
+    # Blocks on the shared pooled client's loop; no executor or event loop here.
+    client = get_price_client()
     try:
-        # Run in a thread pool to avoid event loop conflicts
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(_fetch_historical)
-            price_data = future.result(timeout=30)
-            if "USD" in price_data:
-                return Decimal(str(price_data["USD"]))
+        price_data = client.run(fetch_historical_price(day), timeout=30)
+        if "USD" in price_data:
+            price = Decimal(str(price_data["USD"]))
+            price_store.store_prices(db, {day: price}, source="api")
+            return price
     except Exception as e:
         # Fallback to live price
         try:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(_fetch_current)
-                live_price_data = future.result(timeout=30)
-                if "USD" in live_price_data:
-                    return Decimal(str(live_price_data["USD"]))
+            live_price_data = client.run(get_current_price(), timeout=30)
+            if "USD" in live_price_data:
+                return Decimal(str(live_price_data["USD"]))
         except Exception:
             raise HTTPException(
                 status_code=500,
@@ -763,6 +1055,41 @@ def get_btc_price(timestamp: datetime, db: Session) -> Decimal:
     )
 
 
+def get_btc_prices(days: Iterable[date], db: Session) -> Dict[date, Decimal]:
+    """
+    get_btc_price for many days at once, e.g. every transfer-fee day of a
+    re-lot. The local price store answers what it has; the rest is fetched
+    in one concurrent batch of range requests (fetch_historical_prices) and
+    stored in this session. Days the batch could not price go through
+    get_btc_price, with its live-price fallback.
+    """
+    from backend.services import price_store
+    from backend.services.bitcoin import fetch_historical_prices
+    from backend.services.price_client import get_price_client
+
+    wanted = sorted(set(days))
+    if not wanted:
+        return {}
+    stored = price_store.get_stored_prices(db, wanted[0], wanted[-1])
+    prices = {day: stored[day] for day in wanted if day in stored}
+
+    missing = [day for day in wanted if day not in prices]
+    if missing:
+        try:
+            fetched = get_price_client().run(fetch_historical_prices(missing), timeout=120)
+        except Exception as e:
+            logger.warning(f"[Prices] Batch fetch of {len(missing)} day(s) failed: {e}")
+            fetched = {}
+        fetched = {day: Decimal(str(price)) for day, price in fetched.items()}
+        price_store.store_prices(db, fetched, source="api")
+        prices.update(fetched)
+
+    for day in wanted:
+        if day not in prices:
+            prices[day] = get_btc_price(datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc), db)
+    return prices
+
+
 def maybe_transfer_bitcoin_lot(tx: Transaction, tx_data: dict, db: Session):
     """
     Splits source lots for an internal BTC transfer from one BTC account to another,
@@ -775,75 +1102,87 @@ def maybe_transfer_bitcoin_lot(tx: Transaction, tx_data: dict, db: Session):
     if from_acct.currency != "BTC" or to_acct.currency != "BTC":
         return
 
+    # Gather lots from 'from_acct' in FIFO
+    rows = _open_lots_for_account(db, tx.from_account_id)
+    records = [LotRecord.from_row(row) for row in rows]
+    split = _split_lots_for_transfer(tx, records, lambda ts: get_btc_price(ts, db))
+    if split is None:
+        return
+    fee_disposals, dest_lots = split
+    _write_back_remaining(rows, records)
+
+    for disp in fee_disposals:
+        db.add(LotDisposal(lot_id=disp["lot"].id, transaction_id=tx.id, **_disposal_columns(disp)))
+
+    # Create partial-lot(s) in the destination
+    for dest in dest_lots:
+        db.add(BitcoinLot(
+            created_txn_id=tx.id,
+            account_id=to_acct.id,
+            parent_lot_id=dest["parent"].id,
+            acquired_date=dest["acquired_date"],
+            total_btc=btc(dest["sats"]),
+            remaining_btc=btc(dest["sats"]),
+            cost_basis_usd=usd(dest["cost_cents"]),
+        ))
+
+    db.flush()
+
+
+def _split_lots_for_transfer(tx: Transaction, lots, price_for):
+    """
+    Consume `lots` (oldest first) for a BTC Transfer, fee portion first.
+
+    Returns (fee_disposals, dest_lots), or None if nothing moves. Fee
+    disposals have the _dispose_lots_fifo shape; destination lots are
+    {"parent", "acquired_date", "sats", "cost_cents"}. `price_for(timestamp)`
+    values the BTC fee for its disposal. Decrements lot.remaining_sats in
+    place, like _dispose_lots_fifo.
+    """
     btc_outflow = Decimal(tx.amount or 0)
     fee_btc = Decimal(tx.fee_amount or 0) if (tx.fee_currency or "").upper() == "BTC" else Decimal("0")
-    total_outflow = btc_outflow + fee_btc
+    amount_sats = to_sats(btc_outflow)
+    fee_sats = to_sats(fee_btc)
+    total_outflow = amount_sats + fee_sats
     if total_outflow <= 0:
-        return
-
-    # Gather lots from 'from_acct' in FIFO
-    lots = (
-        db.query(BitcoinLot)
-        .join(Transaction, Transaction.id == BitcoinLot.created_txn_id)
-        .filter(
-            BitcoinLot.remaining_btc > 0,
-            Transaction.to_account_id == tx.from_account_id
-        )
-        .order_by(BitcoinLot.acquired_date.asc())
-        .all()
-    )
+        return None
 
     remaining_outflow = total_outflow
-    remaining_fee = fee_btc
+    remaining_fee = fee_sats
+    fee_disposals = []
     transfers_for_destination = []
 
     for lot in lots:
         if remaining_outflow <= 0:
             break
-        if lot.remaining_btc <= 0:
+        if lot.remaining_sats <= 0:
             continue
 
-        btc_to_use = min(lot.remaining_btc, remaining_outflow)
-        cost_per_btc = (
-            lot.cost_basis_usd / lot.total_btc if lot.total_btc > 0 else Decimal("0")
-        )
-        cost_portion = (cost_per_btc * btc_to_use).quantize(Decimal("0.01"), rounding=ROUND_HALF_DOWN)
-
-        lot.remaining_btc -= btc_to_use
-        db.add(lot)
-        remaining_outflow -= btc_to_use
+        sats_to_use = min(lot.remaining_sats, remaining_outflow)
+        lot.remaining_sats -= sats_to_use
+        remaining_outflow -= sats_to_use
 
-        portion_for_fee = min(btc_to_use, remaining_fee)
-        portion_for_dest = btc_to_use - portion_for_fee
+        portion_for_fee = min(sats_to_use, remaining_fee)
+        portion_for_dest = sats_to_use - portion_for_fee
 
         # Fee disposal
         if portion_for_fee > 0:
-            disposal_basis = (cost_per_btc * portion_for_fee).quantize(Decimal("0.01"), rounding=ROUND_HALF_DOWN)
-            btc_unit_price = get_btc_price(tx.timestamp, db)
-            proceeds_for_fee = (btc_unit_price * portion_for_fee).quantize(Decimal("0.01"), rounding=ROUND_HALF_DOWN)
-            realized_gain = proceeds_for_fee - disposal_basis
-
-            acquired_date = lot.acquired_date
-            if acquired_date.tzinfo is None:
-                acquired_date = acquired_date.replace(tzinfo=timezone.utc)
-            days_held = (tx.timestamp - acquired_date).days
-            hp = "LONG" if days_held >= 365 else "SHORT"
-
-            disp = LotDisposal(
-                lot_id=lot.id,
-                transaction_id=tx.id,
-                disposed_btc=portion_for_fee,
-                disposal_basis_usd=disposal_basis,
-                proceeds_usd_for_that_portion=proceeds_for_fee,
-                realized_gain_usd=realized_gain,
-                holding_period=hp
-            )
-            db.add(disp)
+            basis_cents = prorate_cost(lot.cost_cents, portion_for_fee, lot.total_sats)
+            proceeds_cents = value_cents(price_for(tx.timestamp), portion_for_fee)
+
+            fee_disposals.append({
+                "lot": lot,
+                "sats": portion_for_fee,
+                "basis_cents": basis_cents,
+                "proceeds_cents": proceeds_cents,
+                "gain_cents": proceeds_cents - basis_cents,
+                "holding_period": _holding_period(lot.acquired_date, tx.timestamp),
+            })
             remaining_fee -= portion_for_fee
 
         # Destination partial-lot
         if portion_for_dest > 0:
-            transfers_for_destination.append((lot, portion_for_dest, cost_per_btc, lot.acquired_date))
+            transfers_for_destination.append((lot, portion_for_dest))
 
     if remaining_fee > 0:
         raise HTTPException(
@@ -856,118 +1195,48 @@ def maybe_transfer_bitcoin_lot(tx: Transaction, tx_data: dict, db: Session):
             detail=f"Not enough BTC to transfer {btc_outflow} + fee {fee_btc}"
         )
 
-    # Create partial-lot(s) in the destination
-    for (orig_lot, amt_btc, cost_per_btc, acquired_date) in transfers_for_destination:
-        if acquired_date.tzinfo is None:
-            acquired_date = acquired_date.replace(tzinfo=timezone.utc)
-        cost_portion = (cost_per_btc * amt_btc).quantize(Decimal("0.01"), rounding=ROUND_HALF_DOWN)
-        new_lot = BitcoinLot(
-            created_txn_id=tx.id,
-            acquired_date=acquired_date,
-            total_btc=amt_btc,
-            remaining_btc=amt_btc,
-            cost_basis_usd=cost_portion
-        )
-        db.add(new_lot)
-
-    db.flush()
+    dest_lots = []
+    for orig_lot, sats in transfers_for_destination:
+        dest_lots.append({
+            "parent": orig_lot,
+            "acquired_date": _as_utc(orig_lot.acquired_date),
+            "sats": sats,
+            "cost_cents": prorate_cost(orig_lot.cost_cents, sats, orig_lot.total_sats),
+        })
+    return fee_disposals, dest_lots
 
 
-def recalculate_all_transactions(db: Session):
+def recalculate_all_transactions(db: Session, from_scratch: bool = False):
     """
-    "Scorched Earth": remove all ledger lines, partial-lot disposals,
-    and BitcoinLots. Then re-lot everything in chronological order.
+    "Scorched Earth": remove all partial-lot disposals and BitcoinLots.
+    Then re-lot everything in chronological order. Ledger lines are left
+    as they are; they do not depend on FIFO order.
+
+    The replay runs in memory (backend/services/lot_replay.py) and writes
+    the rebuilt rows back with bulk inserts in a single flush. Once a tax
+    year is closed it starts from the frozen baseline, unless
+    `from_scratch` (lot rows were rebuilt outside the replay, so no saved
+    checkpoint matches them).
     """
-    db.query(LedgerEntry).delete()
-    db.query(LotDisposal).delete()
-    db.query(BitcoinLot).delete()
-    db.flush()
-
-    all_txs = (
-        db.query(Transaction)
-        .order_by(Transaction.timestamp.asc(), Transaction.id.asc())
-        .all()
-    )
-    for rec_tx in all_txs:
-        sub_tx_data = {
-            "from_account_id": rec_tx.from_account_id,
-            "to_account_id": rec_tx.to_account_id,
-            "type": rec_tx.type,
-            "amount": rec_tx.amount,
-            "fee_amount": rec_tx.fee_amount,
-            "fee_currency": rec_tx.fee_currency,
-            "cost_basis_usd": rec_tx.cost_basis_usd,
-            "proceeds_usd": rec_tx.proceeds_usd,
-            "timestamp": rec_tx.timestamp,
-            "source": rec_tx.source,
-            "purpose": rec_tx.purpose,
-            "gross_proceeds_usd": rec_tx.gross_proceeds_usd,
-            "fmv_usd": rec_tx.fmv_usd,
-        }
-        build_ledger_entries_for_transaction(rec_tx, sub_tx_data, db)
-        _maybe_verify_balance_for_internal(rec_tx, db)
-
-        if rec_tx.type in ("Deposit", "Buy"):
-            maybe_create_bitcoin_lot(rec_tx, sub_tx_data, db)
-        elif rec_tx.type in ("Sell", "Withdrawal"):
-            maybe_dispose_lots_fifo(rec_tx, sub_tx_data, db)
-            compute_sell_summary_from_disposals(rec_tx, db)
-        elif rec_tx.type == "Transfer":
-            maybe_transfer_bitcoin_lot(rec_tx, sub_tx_data, db)
+    from backend.services.lot_replay import replay_all_transactions, replay_from_scratch
 
-    db.flush()
+    with relot_lock:
+        if from_scratch:
+            replay_from_scratch(db)
+        else:
+            replay_all_transactions(db)
 
 
-def recalculate_subsequent_transactions(db: Session, from_timestamp: datetime):
+def recalculate_transactions_since(db: Session, since: datetime):
     """
-    Partial-lot re-lot for transactions >= from_timestamp, more efficient
-    than "scorched earth" for large datasets.
+    Re-lot every transaction at or after `since`, resuming from the newest
+    lot checkpoint taken before it. Without one, same as
+    recalculate_all_transactions.
     """
-    logger.info(f"[Partial Re-Lot] Starting from {from_timestamp.isoformat()}")
+    from backend.services.lot_replay import replay_transactions_since
 
-    affected_txs = (
-        db.query(Transaction)
-        .filter(Transaction.timestamp >= from_timestamp)
-        .order_by(Transaction.timestamp.asc(), Transaction.id.asc())
-        .all()
-    )
-    tx_ids = [t.id for t in affected_txs]
-
-    db.query(LedgerEntry).filter(LedgerEntry.transaction_id.in_(tx_ids)).delete(synchronize_session=False)
-    db.query(LotDisposal).filter(LotDisposal.transaction_id.in_(tx_ids)).delete(synchronize_session=False)
-    db.query(BitcoinLot).filter(BitcoinLot.created_txn_id.in_(tx_ids)).delete(synchronize_session=False)
-    db.flush()
-
-    for rec_tx in affected_txs:
-        sub_tx_data = {
-            "from_account_id": rec_tx.from_account_id,
-            "to_account_id": rec_tx.to_account_id,
-            "type": rec_tx.type,
-            "amount": rec_tx.amount,
-            "fee_amount": rec_tx.fee_amount,
-            "fee_currency": rec_tx.fee_currency,
-            "cost_basis_usd": rec_tx.cost_basis_usd,
-            "proceeds_usd": rec_tx.proceeds_usd,
-            "timestamp": rec_tx.timestamp,
-            "source": rec_tx.source,
-            "purpose": rec_tx.purpose,
-            # If present, re-inject gross_proceeds_usd
-            "gross_proceeds_usd": rec_tx.gross_proceeds_usd,
-            "fmv_usd": rec_tx.fmv_usd,
-        }
-        build_ledger_entries_for_transaction(rec_tx, sub_tx_data, db)
-        _maybe_verify_balance_for_internal(rec_tx, db)
-
-        if rec_tx.type in ("Deposit", "Buy"):
-            maybe_create_bitcoin_lot(rec_tx, sub_tx_data, db)
-        elif rec_tx.type in ("Sell", "Withdrawal"):
-            maybe_dispose_lots_fifo(rec_tx, sub_tx_data, db)
-            compute_sell_summary_from_disposals(rec_tx, db)
-        elif rec_tx.type == "Transfer":
-            maybe_transfer_bitcoin_lot(rec_tx, sub_tx_data, db)
-
-    db.flush()
-    logger.info("[Partial Re-Lot] Completed partial-lot recalculation.")
+    with relot_lock:
+        replay_transactions_since(db, since)
 
 
 # --------------------------------------------------------------------------------
@@ -992,10 +1261,24 @@ def _verify_double_entry_balance_for_internal(tx: Transaction, db: Session):
         return
 
     entries = db.query(LedgerEntry).filter(LedgerEntry.transaction_id == tx.id).all()
+    _check_ledger_lines_balanced(tx, [
+        {"account_id": e.account_id, "currency": e.currency, "amount": e.amount}
+        for e in entries
+    ])
+
+
+def _check_ledger_lines_balanced(tx: Transaction, lines: list):
+    """
+    Same check as _verify_double_entry_balance_for_internal, on line dicts
+    that have not been written yet.
+    """
+    if tx.from_account_id == ACCOUNT_EXTERNAL or tx.to_account_id == ACCOUNT_EXTERNAL:
+        return
+
     sums_by_currency = defaultdict(Decimal)
-    for entry in entries:
-        if entry.account_id != ACCOUNT_EXTERNAL:
-            sums_by_currency[entry.currency] += entry.amount
+    for line in lines:
+        if line["account_id"] != ACCOUNT_EXTERNAL:
+            sums_by_currency[line["currency"]] += line["amount"]
 
     for currency, total in sums_by_currency.items():
         if total != Decimal("0"):
@@ -1096,14 +1379,212 @@ def _enforce_transaction_type_rules(tx_data: dict, db: Session):
         raise HTTPException(400, f"Unknown transaction type: {tx_type}")
 
 
+def _enforce_open_tax_year(timestamp: Optional[datetime], db: Session):
+    """
+    Reject a transaction dated inside a closed tax year (see
+    backend/services/tax_year.py): the year's frozen lot baseline would no
+    longer match its transactions.
+    """
+    if timestamp is None:
+        return
+    closed_through = db.query(func.max(LotCheckpoint.frozen_year)).scalar()
+    year = _as_utc(timestamp).year
+    if closed_through is not None and year <= closed_through:
+        raise HTTPException(400, f"Tax year {year} is closed.")
+
+
 def delete_all_transactions(db: Session) -> int:
     """
-    Bulk cleanup: remove all transactions (and references).
-    Return how many were deleted.
+    Bulk cleanup: remove all transactions (and references), locked ones
+    included. Return how many were deleted.
     """
-    all_txs = db.query(Transaction).all()
-    count = len(all_txs)
-    for tx in all_txs:
-        db.delete(tx)
-    db.commit()
-    return count
+    return delete_transactions_matching(db, include_locked=True)
+
+
+def delete_transactions_matching(
+    db: Session,
+    ids: Optional[List[int]] = None,
+    type: Optional[str] = None,
+    account_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_locked: bool = False,
+) -> int:
+    """
+    Delete every transaction matching the filter (all given criteria must
+    hold; account_id matches either side, start/end are inclusive) with
+    set-based DELETEs instead of one ORM delete per row.
+
+    Locked rows are skipped unless include_locked. If any deleted row moved
+    BTC, lots are re-lotted once from the earliest of them. Commits like
+    delete_transaction_record; inside deferred_recalculation it neither
+    commits nor re-lots. Returns the number of deleted transactions.
+    """
+    from backend.services.lot_replay import (
+        _IN_CHUNK, _chunks, _not_after, _not_before, delete_all_checkpoints,
+    )
+
+    # Everything but the exact timestamp bounds is decided in SQL.
+    query = db.query(
+        Transaction.id, Transaction.timestamp, Transaction.from_account_id,
+        Transaction.to_account_id,
+    )
+    if not include_locked:
+        query = query.filter(Transaction.is_locked.is_(False))
+    if type is not None:
+        query = query.filter(Transaction.type == type)
+    if account_id is not None:
+        query = query.filter(
+            (Transaction.from_account_id == account_id) | (Transaction.to_account_id == account_id)
+        )
+    if start is not None:
+        query = query.filter(_not_before(Transaction.timestamp, start))
+    if end is not None:
+        query = query.filter(_not_after(Transaction.timestamp, end))
+    if ids is None:
+        rows = query.all()
+    else:
+        rows = [
+            row
+            for chunk in _chunks(sorted(set(ids)))
+            for row in query.filter(Transaction.id.in_(chunk)).all()
+        ]
+
+    doomed = []
+    since = None
+    earliest = None
+    for row in rows:
+        ts = _as_utc(row.timestamp)
+        if (start is not None and ts < _as_utc(start)) or (end is not None and ts > _as_utc(end)):
+            continue
+        doomed.append(row.id)
+        earliest = ts if earliest is None or ts < earliest else earliest
+        if _touches_btc_lots(db, row.from_account_id, row.to_account_id):
+            since = ts if since is None or ts < since else since
+
+    db.flush()
+    if earliest is not None:
+        mark_summary_stale(db, earliest)
+    for start_at in range(0, len(doomed), _IN_CHUNK):
+        chunk = doomed[start_at:start_at + _IN_CHUNK]
+        db.query(LedgerEntry).filter(LedgerEntry.transaction_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(LotDisposal).filter(LotDisposal.transaction_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(BitcoinLot).filter(BitcoinLot.created_txn_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(Transaction).filter(Transaction.id.in_(chunk)).delete(synchronize_session=False)
+
+    # Drop the deleted rows (and anything hanging off them) from the session.
+    gone = set(doomed)
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Transaction):
+            tx_id = obj.id
+        elif isinstance(obj, (LedgerEntry, LotDisposal)):
+            tx_id = obj.transaction_id
+        elif isinstance(obj, BitcoinLot):
+            tx_id = obj.created_txn_id
+        else:
+            continue
+        if tx_id in gone:
+            db.expunge(obj)
+
+    if doomed and db.query(Transaction.id).first() is None:
+        # Nothing left to re-lot; saved checkpoints describe a wiped ledger.
+        delete_all_checkpoints(db)
+        since = None
+
+    logger.info(f"[Delete] Bulk-deleted {len(doomed)} transactions; re-lot from {since}.")
+    _finish_write(db, since)
+    return len(doomed)
+
+
+def apply_transaction_batch(operations: List[dict], db: Session) -> List[dict]:
+    """
+    Apply a list of create/update/delete/delete_matching operations
+    atomically, with a single re-lot at the end.
+
+    Each operation is a dict with "op" plus:
+      - create: "data" (TransactionCreate fields)
+      - update: "id" and "data" (TransactionUpdate fields, only those set)
+      - delete: "id"
+      - delete_matching: "filter" (see delete_transactions_matching)
+
+    Every item is validated first (type/fee rules, existence, lock), so
+    one request reports all bad items. If any item is invalid, or applying
+    the batch fails for any reason (e.g. the final re-lot runs out of BTC,
+    or a database constraint rejects a row), the session is rolled back,
+    nothing is committed and an HTTPException(400) carries the per-item
+    results.
+
+    Returns one result per item: {"index", "op", "status", "id", ...}.
+    """
+    results = [{"index": i, "op": op["op"], "status": "ok", "id": op.get("id")}
+               for i, op in enumerate(operations)]
+
+    def _fail(message: str):
+        for result in results:
+            if result["status"] == "ok":
+                result["status"] = "rolled_back"
+        raise HTTPException(status_code=400, detail={"message": message, "results": results})
+
+    def _detail(e: Exception):
+        return e.detail if isinstance(e, HTTPException) else f"{type(e).__name__}: {e}"
+
+    # 1) Validate everything before touching the session.
+    for op, result in zip(operations, results):
+        try:
+            _validate_batch_operation(op, db)
+        except Exception as e:
+            result["status"] = "error"
+            result["detail"] = _detail(e)
+    if any(r["status"] == "error" for r in results):
+        db.rollback()
+        _fail("Batch rejected; no operation was applied.")
+
+    # 2) Apply in order; one re-lot when the batch closes, one commit.
+    current = None
+    try:
+        with deferred_recalculation(db):
+            for current, (op, result) in enumerate(zip(operations, results)):
+                kind = op["op"]
+                if kind == "create":
+                    result["id"] = create_transaction_record(op["data"], db, auto_commit=False).id
+                elif kind == "update":
+                    if update_transaction_record(op["id"], op["data"], db) is None:
+                        raise HTTPException(404, "Transaction not found or is locked.")
+                elif kind == "delete":
+                    if not delete_transaction_record(op["id"], db):
+                        raise HTTPException(404, "Transaction not found or cannot be deleted.")
+                else:
+                    result["deleted"] = delete_transactions_matching(db, **(op.get("filter") or {}))
+            current = None
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        if current is not None:
+            results[current]["status"] = "error"
+            results[current]["detail"] = _detail(e)
+        if not isinstance(e, HTTPException):
+            logger.exception("[Batch] Applying the batch failed; rolled back.")
+        _fail(str(_detail(e)))
+    return results
+
+
+def _validate_batch_operation(op: dict, db: Session):
+    kind = op.get("op")
+    if kind == "create":
+        _enforce_transaction_type_rules(op["data"], db)
+        _enforce_fee_rules(op["data"], db)
+        _enforce_open_tax_year(op["data"].get("timestamp"), db)
+    elif kind in ("update", "delete"):
+        tx = get_transaction_by_id(db, op.get("id")) if op.get("id") is not None else None
+        if not tx or tx.is_locked:
+            raise HTTPException(404, "Transaction not found or is locked.")
+        if kind == "update":
+            data = op.get("data") or {}
+            if any(k in data for k in ("type", "from_account_id", "to_account_id")):
+                _enforce_transaction_type_rules(data, db)
+            if any(k in data for k in ("fee_amount", "fee_currency", "type")):
+                _enforce_fee_rules(data, db)
+            if "timestamp" in data:
+                _enforce_open_tax_year(data["timestamp"], db)
+    elif kind != "delete_matching":
+        raise HTTPException(400, f"Unknown batch operation: {kind}")
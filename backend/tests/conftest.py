@@ -13,15 +13,17 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 
-from backend.database import Base, get_db
+from backend.database import Base, SessionLocal, get_db
 from backend.main import app
 
 # Import all models so Base.metadata knows about them
 from backend.models.user import User          # noqa: F401
 from backend.models.account import Account    # noqa: F401
 from backend.models.transaction import (      # noqa: F401
-    Transaction, LedgerEntry, BitcoinLot, LotDisposal,
+    Transaction, LedgerEntry, BitcoinLot, LotDisposal, LotCheckpoint, LotCheckpointEntry,
 )
+from backend.models.btc_price import BtcDailyPrice  # noqa: F401
+from backend.models.portfolio_summary import PortfolioSummary  # noqa: F401
 
 LOGIN_CREDS = {"username": "admin", "password": "password"}
 
@@ -81,10 +83,9 @@ def test_engine():
 @pytest.fixture(scope="session")
 def auth_client(test_engine):
     """Authenticated TestClient using an isolated test database."""
-    TestSessionLocal = sessionmaker(bind=test_engine)
-
     def override_get_db():
-        db = TestSessionLocal()
+        # The app's session class (its listeners keep derived tables current).
+        db = SessionLocal(bind=test_engine)
         try:
             yield db
         finally:
@@ -101,7 +102,6 @@ def auth_client(test_engine):
 @pytest.fixture(scope="session")
 def test_db(test_engine):
     """Direct SQLAlchemy session for tests that need DB access."""
-    TestSessionLocal = sessionmaker(bind=test_engine)
-    db = TestSessionLocal()
+    db = SessionLocal(bind=test_engine)
     yield db
     db.close()
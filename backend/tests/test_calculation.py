@@ -0,0 +1,332 @@
+"""
+backend/tests/test_calculation.py
+
+Tests for the portfolio numbers behind /api/calculations/*
+(backend/services/calculation.py and the tables it reads).
+
+Each test builds a small ledger through the API (the mixed ledger of
+test_lot_replay.py, plus what the test needs) and checks the calculations
+against totals computed straight from the raw ledger, lot and disposal rows,
+or against each other (as-of figures, the daily portfolio time series).
+"""
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_DOWN
+from functools import partial
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.models.portfolio_summary import PortfolioSummary
+from backend.models.transaction import Transaction, LedgerEntry, BitcoinLot, LotDisposal
+from backend.services.calculation import get_gains_and_losses, get_held_lots_as_of
+from backend.services.portfolio_summary import refresh_portfolio_summary
+from backend.tests.test_lot_replay import (
+    BANK, EXCHANGE_BTC, EXCHANGE_USD, EXTERNAL, WALLET, _MIXED_LEDGER, _snapshot, _ts,
+)
+
+# Authenticated TestClient (set by autouse fixture from conftest.py)
+CLIENT: TestClient = None
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _set_client(auth_client):
+    global CLIENT
+    CLIENT = auth_client
+
+
+@pytest.fixture(autouse=True)
+def _no_network(monkeypatch):
+    """Transfer-fee disposals are valued at a fixed stub price."""
+    monkeypatch.setattr(
+        "backend.services.transaction.get_btc_price",
+        lambda timestamp, db: Decimal("50000"),
+    )
+    monkeypatch.setattr(
+        "backend.services.transaction.get_btc_prices",
+        lambda days, db: dict.fromkeys(days, Decimal("50000")),
+    )
+
+
+@pytest.fixture
+def db(test_db):
+    r = CLIENT.delete("/api/transactions/delete_all")
+    assert r.status_code == 204
+    test_db.expire_all()
+    yield test_db
+    test_db.rollback()
+
+
+def _create(tx: dict) -> dict:
+    r = CLIENT.post("/api/transactions", json=tx)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _seed_mixed_ledger():
+    for tx in _MIXED_LEDGER:
+        _create(tx)
+
+
+def _legacy_gains_and_losses(db):
+    """The per-row Decimal loop get_gains_and_losses used to run (totals only)."""
+    totals = {k: Decimal("0") for k in (
+        "short_term_gains", "short_term_losses", "long_term_gains", "long_term_losses",
+        "sells_proceeds", "withdrawals_spent", "fees_usd", "fees_btc",
+    )}
+    deposits = {s: [Decimal("0"), Decimal("0")] for s in ("income", "interest", "reward", "gift")}
+    for d in db.query(LotDisposal).all():
+        gain = d.realized_gain_usd
+        term = "short" if (d.holding_period or "SHORT").upper() == "SHORT" else "long"
+        if gain is not None and gain > 0:
+            totals[f"{term}_term_gains"] += gain
+        elif gain is not None and gain < 0:
+            totals[f"{term}_term_losses"] += abs(gain)
+    for tx in db.query(Transaction).all():
+        kind = tx.type.lower()
+        if kind == "sell" and tx.proceeds_usd is not None:
+            totals["sells_proceeds"] += Decimal(str(tx.proceeds_usd))
+        if kind == "withdrawal" and (tx.purpose or "").lower() == "spent" and tx.proceeds_usd is not None:
+            totals["withdrawals_spent"] += Decimal(str(tx.proceeds_usd))
+        source = (tx.source or "").lower()
+        if kind == "deposit" and source in deposits and tx.cost_basis_usd is not None and tx.amount is not None:
+            if tx.cost_basis_usd > 0:
+                deposits[source][0] += Decimal(str(tx.cost_basis_usd))
+            if tx.amount > 0:
+                deposits[source][1] += Decimal(str(tx.amount))
+        if tx.fee_amount is not None and (tx.fee_currency or "").lower() in ("usd", "btc"):
+            totals[f"fees_{tx.fee_currency.lower()}"] += Decimal(str(tx.fee_amount))
+
+    cent, sat = Decimal("0.01"), Decimal("0.00000001")
+    q = lambda value, unit=cent: float(value.quantize(unit, rounding=ROUND_HALF_DOWN))
+    return {
+        "sells_proceeds": q(totals["sells_proceeds"]),
+        "withdrawals_spent": q(totals["withdrawals_spent"]),
+        "income_earned": q(deposits["income"][0]),
+        "interest_earned": q(deposits["interest"][0]),
+        "rewards_earned": q(deposits["reward"][0]),
+        "gifts_received": q(deposits["gift"][0]),
+        "short_term_gains": q(totals["short_term_gains"]),
+        "short_term_losses": q(totals["short_term_losses"]),
+        "long_term_gains": q(totals["long_term_gains"]),
+        "long_term_losses": q(totals["long_term_losses"]),
+        "income_btc": q(deposits["income"][1], sat),
+        "interest_btc": q(deposits["interest"][1], sat),
+        "rewards_btc": q(deposits["reward"][1], sat),
+        "gifts_btc": q(deposits["gift"][1], sat),
+        "fees": {"USD": q(totals["fees_usd"]), "BTC": q(totals["fees_btc"], sat)},
+    }
+
+
+def test_gains_and_losses_aggregates_match_row_loop(db):
+    _seed_mixed_ledger()
+    for day, source, amount, basis in ((41, "Interest", "0.00012345", "3.70"),
+                                       (42, "Reward", "0.0005", "15.01"),
+                                       (43, "gift", "0.02", "600.55"),
+                                       (44, "Income", "0.01", "300.10")):
+        _create({"type": "Deposit", "timestamp": _ts(day), "from_account_id": EXTERNAL,
+                 "to_account_id": WALLET, "amount": amount, "cost_basis_usd": basis,
+                 "source": source})
+    _create({"type": "Deposit", "timestamp": _ts(45), "from_account_id": EXTERNAL,
+             "to_account_id": BANK, "amount": "100.005", "source": "N/A",
+             "fee_amount": "0.005", "fee_currency": "usd"})
+    _create({"type": "Sell", "timestamp": _ts(500), "from_account_id": EXCHANGE_BTC,
+             "to_account_id": EXCHANGE_USD, "amount": "0.05", "gross_proceeds_usd": "777.77",
+             "fee_amount": "0.005", "fee_currency": "USD"})
+    # A disposal without a holding period counts as short-term.
+    disposal = db.query(LotDisposal).order_by(LotDisposal.id.desc()).first()
+    disposal.holding_period = None
+    db.commit()
+
+    db.expire_all()
+    result = get_gains_and_losses(db)
+    expected = _legacy_gains_and_losses(db)
+    assert {k: result[k] for k in expected} == expected
+    assert result["short_term_losses"] > 0 and result["long_term_gains"] > 0
+    assert result["fees"]["USD"] == 16.46
+
+
+def _summary_rows(db):
+    db.expire_all()
+    return sorted(
+        (r.account_id, r.year, r.holding_period,
+         *(str(getattr(r, c)) for c in ("balance", "held_btc", "held_cost_usd",
+                                        "realized_gains_usd", "realized_losses_usd",
+                                        "sells_proceeds_usd", "income_usd", "fees_usd")))
+        for r in db.query(PortfolioSummary).all()
+        if any(getattr(r, c) for c in ("balance", "held_btc", "realized_gains_usd",
+                                       "realized_losses_usd", "sells_proceeds_usd",
+                                       "income_usd", "fees_usd"))
+    )
+
+
+def test_portfolio_summary_tracks_edits(db):
+    _seed_mixed_ledger()
+    sell = db.query(Transaction).filter(Transaction.type == "Sell").one()
+    income = db.query(Transaction).filter(Transaction.source == "Income").one()
+    r = CLIENT.put(f"/api/transactions/{sell.id}", json={"timestamp": _ts(420)})
+    assert r.status_code == 200, r.text
+    r = CLIENT.delete(f"/api/transactions/{income.id}")
+    assert r.status_code == 204, r.text
+    _create({"type": "Buy", "timestamp": _ts(5), "from_account_id": EXCHANGE_USD,
+             "to_account_id": EXCHANGE_BTC, "amount": "0.01", "cost_basis_usd": "200"})
+    r = CLIENT.post("/api/transactions/batch", json={"operations": [
+        {"op": "delete_matching", "filter": {"account_id": BANK, "type": "Deposit"}},
+    ]})
+    assert r.status_code == 200, r.text
+
+    maintained = _summary_rows(db)
+    assert any(row[2] == "LONG" for row in maintained)
+    refresh_portfolio_summary(db)
+    db.commit()
+    assert _summary_rows(db) == maintained
+
+    # The endpoints answer from those rows exactly as the raw rows would.
+    lots = db.query(BitcoinLot).filter(BitcoinLot.remaining_btc > 0).all()
+    held = sum(lot.remaining_btc for lot in lots)
+    cost = sum(
+        (lot.cost_basis_usd * (lot.remaining_btc / lot.total_btc)).quantize(Decimal("0.01"), ROUND_HALF_DOWN)
+        for lot in lots
+    )
+    r = CLIENT.get("/api/calculations/average-cost-basis")
+    assert r.json()["averageCostBasis"] == float((cost / held).quantize(Decimal("0.01"), ROUND_HALF_DOWN))
+    for item in CLIENT.get("/api/calculations/accounts/balances").json():
+        ledger = sum(
+            (e.amount for e in db.query(LedgerEntry).filter(LedgerEntry.account_id == item["account_id"])),
+            Decimal("0"),
+        )
+        assert item["balance"] == float(ledger)
+    expected = _legacy_gains_and_losses(db)
+    result = CLIENT.get("/api/calculations/gains-and-losses").json()
+    assert {k: result[k] for k in expected} == expected
+
+
+def test_portfolio_summary_append_rebuilds_only_its_year(db):
+    _seed_mixed_ledger()
+    earlier = {r.id for r in db.query(PortfolioSummary).filter(PortfolioSummary.year == 2023)}
+    assert earlier
+
+    _create({"type": "Deposit", "timestamp": _ts(500), "from_account_id": EXTERNAL,
+             "to_account_id": BANK, "amount": "75", "source": "N/A"})
+    db.expire_all()
+    assert {r.id for r in db.query(PortfolioSummary).filter(PortfolioSummary.year == 2023)} == earlier
+
+    maintained = _summary_rows(db)
+    refresh_portfolio_summary(db)
+    db.commit()
+    assert _summary_rows(db) == maintained
+
+
+def test_portfolio_summary_listens_to_app_sessions_only():
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from backend.database import SessionLocal
+    from backend.services import portfolio_summary
+
+    assert event.contains(SessionLocal, "before_commit", portfolio_summary._refresh_before_commit)
+    assert not event.contains(Session, "before_commit", portfolio_summary._refresh_before_commit)
+
+
+def test_startup_fills_only_an_empty_summary(db, test_engine, monkeypatch):
+    import backend.database as database
+
+    _seed_mixed_ledger()
+    monkeypatch.setattr(database, "SessionLocal", partial(database.SessionLocal, bind=test_engine))
+    ids = {r.id for r in db.query(PortfolioSummary)}
+    database._rebuild_portfolio_summary()
+    db.expire_all()
+    assert {r.id for r in db.query(PortfolioSummary)} == ids
+
+    maintained = _summary_rows(db)
+    db.query(PortfolioSummary).delete()
+    db.commit()
+    database._rebuild_portfolio_summary()
+    assert _summary_rows(db) == maintained
+
+
+def test_balances_and_cost_basis_as_of(db):
+    def current():
+        db.expire_all()
+        balances = CLIENT.get("/api/calculations/accounts/balances").json()
+        basis = CLIENT.get("/api/calculations/average-cost-basis").json()["averageCostBasis"]
+        lots = sorted(
+            (lot.account_id, lot.acquired_date, lot.remaining_btc)
+            for lot in db.query(BitcoinLot).filter(BitcoinLot.remaining_btc > 0)
+        )
+        return balances, basis, lots
+
+    def as_of(moment):
+        params = {"as_of": moment}
+        balances = CLIENT.get("/api/calculations/accounts/balances", params=params).json()
+        basis = CLIENT.get("/api/calculations/average-cost-basis", params=params).json()["averageCostBasis"]
+        lots = sorted(
+            (lot["account_id"], lot["acquired_date"], lot["remaining_btc"])
+            for lot in get_held_lots_as_of(db, datetime.fromisoformat(moment))
+        )
+        return balances, basis, lots
+
+    # Half a second after the Sell: stored as "...12:00:00.500000Z", which
+    # sorts before the Sell's "...12:00:00Z".
+    half_second_buy = {
+        "type": "Buy", "timestamp": (datetime.fromisoformat(_ts(90)) + timedelta(seconds=0.5)).isoformat(),
+        "from_account_id": EXCHANGE_USD, "to_account_id": EXCHANGE_BTC,
+        "amount": "0.02", "cost_basis_usd": "600",
+    }
+    # Each state as the ledger grows; the history is then asked for it.
+    seen = [(_ts(-1), current())]
+    for tx in _MIXED_LEDGER[:7] + [half_second_buy] + _MIXED_LEDGER[7:]:
+        _create(tx)
+        seen.append((tx["timestamp"], current()))
+    before = _snapshot(db)
+
+    for moment, expected in seen:
+        assert as_of(moment) == expected, moment
+    r = CLIENT.get(f"/api/calculations/account/{EXCHANGE_BTC}/balance", params={"as_of": _ts(61)})
+    assert r.json()["balance"] == next(
+        b["balance"] for b in seen[6][1][0] if b["account_id"] == EXCHANGE_BTC
+    )
+
+    # Read-only: nothing was re-lotted or written.
+    assert _snapshot(db) == before
+
+
+def test_portfolio_timeseries_matches_as_of(db, monkeypatch):
+    _seed_mixed_ledger()
+    first = datetime.fromisoformat(_ts(0)).date()
+
+    async def daily_series(start, end, db=None):
+        # Day n is priced 20000 + n; every 7th day has no price.
+        return [
+            (start + timedelta(days=n), 20000.0 + (start - first).days + n)
+            for n in range((end - start).days + 1)
+            if ((start - first).days + n) % 7 != 6
+        ]
+
+    monkeypatch.setattr("backend.services.portfolio_timeseries.price_series.get_daily_series", daily_series)
+    end = first + timedelta(days=420)
+    r = CLIENT.get("/api/calculations/portfolio/timeseries", params={"end": end.isoformat()})
+    assert r.status_code == 200, r.text
+    series = r.json()
+    # From the first lot (the Buy on day 2) through `end`, priced days only.
+    days = [first + timedelta(days=n) for n in range(2, 421) if n % 7 != 6]
+    assert [datetime.fromtimestamp(p["time"] / 1000, tz=timezone.utc).date() for p in series] == days
+
+    for point in series:
+        day_end = datetime.fromtimestamp(point["time"] / 1000, tz=timezone.utc) + timedelta(days=1)
+        held = get_held_lots_as_of(db, day_end - timedelta(microseconds=1))
+        holdings = sum((lot["remaining_btc"] for lot in held), Decimal("0"))
+        cost = sum(
+            (lot["cost_basis_usd"] * (lot["remaining_btc"] / lot["total_btc"])).quantize(Decimal("0.01"), ROUND_HALF_DOWN)
+            for lot in held
+        )
+        value = (holdings * Decimal(repr(point["price"]))).quantize(Decimal("0.01"), ROUND_HALF_DOWN)
+        assert point["holdings_btc"] == float(holdings)
+        assert point["cost_basis_usd"] == float(cost)
+        assert point["value_usd"] == float(value)
+        assert point["unrealized_gain_usd"] == float(value - cost)
+
+    r = CLIENT.get("/api/calculations/portfolio/timeseries", params={"end": end.isoformat(), "points": 50})
+    sampled = r.json()
+    assert len(sampled) == 50
+    assert sampled[0] == series[0] and sampled[-1] == series[-1]
+    assert all(point in series for point in sampled)
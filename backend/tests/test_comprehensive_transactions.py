@@ -2124,10 +2124,9 @@ def run_all_tests():
 
 if __name__ == "__main__":
     from backend.tests.conftest import _seed_test_db
-    from backend.database import Base, get_db
+    from backend.database import Base, SessionLocal, get_db
     from backend.main import app
     from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
     import tempfile, os
 
     tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
@@ -2136,10 +2135,8 @@ if __name__ == "__main__":
     Base.metadata.create_all(bind=engine)
     _seed_test_db(engine)
 
-    TestSessionLocal = sessionmaker(bind=engine)
-
     def override_get_db():
-        db = TestSessionLocal()
+        db = SessionLocal(bind=engine)
         try:
             yield db
         finally:
@@ -813,10 +813,9 @@ def main():
 
     # Set up isolated test database and TestClient
     from backend.tests.conftest import _seed_test_db
-    from backend.database import Base, get_db
+    from backend.database import Base, SessionLocal, get_db
     from backend.main import app
     from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
 
     tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
     tmp.close()
@@ -824,10 +823,8 @@ def main():
     Base.metadata.create_all(bind=engine)
     _seed_test_db(engine)
 
-    TestSessionLocal = sessionmaker(bind=engine)
-
     def override_get_db():
-        db = TestSessionLocal()
+        db = SessionLocal(bind=engine)
         try:
             yield db
         finally:
@@ -0,0 +1,114 @@
+"""
+backend/tests/test_lot_math.py
+
+The integer lot-math core must round exactly like the Decimal expressions it
+replaced, including values sitting on (or within Decimal noise of) a
+half-cent tie.
+"""
+
+import random
+from decimal import Decimal, ROUND_HALF_DOWN
+
+import pytest
+
+from backend.services.lot_math import (
+    LotRecord,
+    btc,
+    usd,
+    to_sats,
+    to_cents,
+    prorate_cost,
+    prorate_proceeds,
+    prorate_proceeds_net_of_fee,
+    value_cents,
+    fraction_e8,
+    scale_cents_e8,
+    price_per_btc_cents,
+)
+
+CENT = Decimal("0.01")
+SAT = Decimal("0.00000001")
+
+
+def _q(value: Decimal) -> int:
+    return to_cents(value.quantize(CENT, rounding=ROUND_HALF_DOWN))
+
+
+def _legacy_cost(cost_cents, part, whole):
+    return _q((usd(cost_cents) / btc(whole)) * btc(part))
+
+
+def _legacy_proceeds(total_cents, part, whole):
+    return _q((btc(part) / btc(whole)) * usd(total_cents))
+
+
+def _legacy_net(total_cents, part, whole, fee):
+    total = usd(total_cents)
+    net = total - btc(fee) * (total / btc(whole))
+    if net < 0:
+        net = Decimal("0")
+    return _q((btc(part) / btc(whole)) * net)
+
+
+def _cases(seed, n=4000):
+    rnd = random.Random(seed)
+    for _ in range(n):
+        whole = rnd.choice([rnd.randint(1, 10), rnd.randint(1, 10 ** 4), rnd.randint(1, 3 * 10 ** 9)])
+        part = rnd.randint(1, whole)
+        cents = rnd.choice([rnd.randint(0, 10), rnd.randint(0, 10 ** 6), rnd.randint(0, 10 ** 11)])
+        yield cents, part, whole
+
+
+def test_conversions_round_trip():
+    assert to_sats(Decimal("1.5")) == 150_000_000
+    assert to_sats(None) == 0
+    assert to_sats("0.00000001") == 1
+    assert to_cents(Decimal("12.34")) == 1234
+    assert btc(150_000_000) == Decimal("1.50000000")
+    assert usd(1234) == Decimal("12.34")
+    assert str(usd(5)) == "0.05"
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_prorations_match_decimal(seed):
+    for cents, part, whole in _cases(seed):
+        assert prorate_cost(cents, part, whole) == _legacy_cost(cents, part, whole)
+        assert prorate_proceeds(cents, part, whole) == _legacy_proceeds(cents, part, whole)
+        fee = random.Random(cents).randint(0, whole)
+        assert prorate_proceeds_net_of_fee(cents, part, whole, fee) == _legacy_net(cents, part, whole, fee)
+
+
+def test_exact_ties_round_half_down():
+    # Exactly half a cent with exact intermediates: rounds down.
+    assert prorate_proceeds(3, 1, 2) == _legacy_proceeds(3, 1, 2) == 1
+    # 0.01 USD over 6 sats, 3 disposed is also exactly half a cent, but the
+    # per-BTC cost (1/6) is rounded first and the product lands just above.
+    assert prorate_cost(1, 3, 6) == _legacy_cost(1, 3, 6) == 1
+    # Repeating-decimal ties: Decimal rounds 1/3 before multiplying back.
+    for cents, part, whole in [(1, 3, 6), (3, 1, 6), (1, 1, 2), (5, 3, 30), (1, 150, 300), (10 ** 11 + 1, 1, 2)]:
+        assert prorate_cost(cents, part, whole) == _legacy_cost(cents, part, whole)
+        assert prorate_proceeds(cents, part, whole) == _legacy_proceeds(cents, part, whole)
+    for cents, part, whole in [(1, 1, 3), (1, 2, 3), (7, 5, 21), (100, 1, 3 * 10 ** 8)]:
+        assert prorate_proceeds(cents, part, whole) == _legacy_proceeds(cents, part, whole)
+
+
+def test_fee_value_matches_decimal():
+    price = Decimal("43210.987654321")
+    for sats in (1, 3, 12345, 99_999_999):
+        assert value_cents(price, sats) == _q(price * btc(sats))
+
+
+def test_average_basis_helpers_match_decimal():
+    for cents, part, whole in list(_cases(11, 2000)) + [(1, 1, 2), (1, 1, 3), (3, 2, 4)]:
+        legacy_fraction = (btc(part) / btc(whole)).quantize(SAT, rounding=ROUND_HALF_DOWN)
+        fraction = fraction_e8(part, whole)
+        assert btc(fraction) == legacy_fraction
+        assert scale_cents_e8(cents, fraction) == _q(usd(cents) * legacy_fraction)
+        assert price_per_btc_cents(cents, whole) == _q(usd(cents) / btc(whole))
+
+
+def test_lot_record_has_no_instance_dict():
+    lot = LotRecord(1, 2, 3, None, 10, 5, 100)
+    assert not hasattr(lot, "__dict__")
+    with pytest.raises(AttributeError):
+        lot.remaining_btc = Decimal("1")
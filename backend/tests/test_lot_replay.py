@@ -0,0 +1,775 @@
+"""
+backend/tests/test_lot_replay.py
+
+Tests for the in-memory FIFO replay engine (backend/services/lot_replay.py).
+
+The replay must reproduce exactly what the per-transaction ORM path writes:
+same lots, same disposals, same transaction-level gain summaries. Each test
+builds a small ledger through the API (ORM path), snapshots it, forces a
+full re-lot and compares. Edits that resume from a lot checkpoint, and bulk
+imports run in deferred-recalculation mode, must land on the same rows as
+the one-at-a-time path.
+"""
+
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, inspect, text
+from fastapi.testclient import TestClient
+
+from backend.models.transaction import (
+    Transaction, LedgerEntry, BitcoinLot, LotDisposal, LotCheckpoint,
+)
+from backend.services import transaction as tx_service
+from backend.services.csv_import import execute_import
+from backend.services.transaction import recalculate_all_transactions
+
+# Authenticated TestClient (set by autouse fixture from conftest.py)
+CLIENT: TestClient = None
+
+EXTERNAL = 99
+BANK = 1
+WALLET = 2
+EXCHANGE_USD = 3
+EXCHANGE_BTC = 4
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _set_client(auth_client):
+    global CLIENT
+    CLIENT = auth_client
+
+
+@pytest.fixture(autouse=True)
+def _no_network(monkeypatch):
+    """Transfer-fee disposals are valued at a fixed stub price."""
+    monkeypatch.setattr(
+        "backend.services.transaction.get_btc_price",
+        lambda timestamp, db: Decimal("50000"),
+    )
+    monkeypatch.setattr(
+        "backend.services.transaction.get_btc_prices",
+        lambda days, db: dict.fromkeys(days, Decimal("50000")),
+    )
+
+
+@pytest.fixture
+def small_checkpoints(monkeypatch):
+    monkeypatch.setattr("backend.services.lot_replay.CHECKPOINT_INTERVAL", 2)
+
+
+@pytest.fixture
+def db(test_db):
+    r = CLIENT.delete("/api/transactions/delete_all")
+    assert r.status_code == 204
+    test_db.expire_all()
+    yield test_db
+    test_db.rollback()
+
+
+def _ts(day: int) -> str:
+    return (datetime(2023, 1, 1, 12, tzinfo=timezone.utc) + timedelta(days=day)).isoformat()
+
+
+def _create(tx: dict) -> dict:
+    r = CLIENT.post("/api/transactions", json=tx)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _snapshot(db):
+    """Content of every derived row, keyed independently of row ids."""
+    db.expire_all()
+    lots = {lot.id: lot for lot in db.query(BitcoinLot).all()}
+    return {
+        "ledger": sorted(
+            (e.transaction_id, e.account_id, str(e.amount), e.currency, e.entry_type)
+            for e in db.query(LedgerEntry).all()
+        ),
+        "lots": sorted(
+            (l.created_txn_id, l.account_id, l.acquired_date, str(l.total_btc),
+             str(l.remaining_btc), str(l.cost_basis_usd),
+             lots[l.parent_lot_id].created_txn_id if l.parent_lot_id else None)
+            for l in lots.values()
+        ),
+        "disposals": sorted(
+            (d.transaction_id, lots[d.lot_id].created_txn_id, str(d.disposed_btc),
+             str(d.disposal_basis_usd), str(d.proceeds_usd_for_that_portion),
+             str(d.realized_gain_usd), d.holding_period)
+            for d in db.query(LotDisposal).all()
+        ),
+        "summaries": sorted(
+            (t.id, str(t.cost_basis_usd), str(t.proceeds_usd),
+             str(t.realized_gain_usd), t.holding_period)
+            for t in db.query(Transaction).all()
+        ),
+    }
+
+
+_MIXED_LEDGER = [
+    {"type": "Deposit", "timestamp": _ts(0), "from_account_id": EXTERNAL,
+     "to_account_id": BANK, "amount": "50000", "source": "N/A"},
+    {"type": "Transfer", "timestamp": _ts(1), "from_account_id": BANK,
+     "to_account_id": EXCHANGE_USD, "amount": "40000",
+     "fee_amount": "0", "fee_currency": "USD"},
+    {"type": "Buy", "timestamp": _ts(2), "from_account_id": EXCHANGE_USD,
+     "to_account_id": EXCHANGE_BTC, "amount": "0.5", "cost_basis_usd": "10000",
+     "fee_amount": "12.34", "fee_currency": "USD"},
+    {"type": "Buy", "timestamp": _ts(30), "from_account_id": EXCHANGE_USD,
+     "to_account_id": EXCHANGE_BTC, "amount": "0.3", "cost_basis_usd": "7777.77",
+     "fee_amount": "3", "fee_currency": "USD"},
+    {"type": "Deposit", "timestamp": _ts(40), "from_account_id": EXTERNAL,
+     "to_account_id": WALLET, "amount": "0.12345678", "cost_basis_usd": "3000",
+     "source": "Income"},
+    {"type": "Transfer", "timestamp": _ts(60), "from_account_id": EXCHANGE_BTC,
+     "to_account_id": WALLET, "amount": "0.6", "fee_amount": "0.0001",
+     "fee_currency": "BTC"},
+    {"type": "Sell", "timestamp": _ts(90), "from_account_id": EXCHANGE_BTC,
+     "to_account_id": EXCHANGE_USD, "amount": "0.1", "gross_proceeds_usd": "3333.33",
+     "fee_amount": "1.11", "fee_currency": "USD"},
+    {"type": "Withdrawal", "timestamp": _ts(400), "from_account_id": WALLET,
+     "to_account_id": EXTERNAL, "amount": "0.25", "proceeds_usd": "9000",
+     "purpose": "Spent"},
+    {"type": "Withdrawal", "timestamp": _ts(410), "from_account_id": WALLET,
+     "to_account_id": EXTERNAL, "amount": "0.01", "purpose": "Gift",
+     "fmv_usd": "400"},
+]
+
+
+def _seed_mixed_ledger():
+    for tx in _MIXED_LEDGER:
+        _create(tx)
+
+
+def test_replay_reproduces_incremental_rows(db):
+    _seed_mixed_ledger()
+    before = _snapshot(db)
+
+    recalculate_all_transactions(db)
+    db.commit()
+
+    assert _snapshot(db) == before
+
+
+def test_replay_is_idempotent(db):
+    _seed_mixed_ledger()
+    recalculate_all_transactions(db)
+    db.commit()
+    first = _snapshot(db)
+
+    recalculate_all_transactions(db)
+    db.commit()
+
+    assert _snapshot(db) == first
+
+
+def test_replay_leaves_ledger_lines_alone(db):
+    _seed_mixed_ledger()
+    # A Sell typed without gross: its fee comes off proceeds once, at entry.
+    sell = _create({"type": "Sell", "timestamp": _ts(95), "from_account_id": EXCHANGE_BTC,
+                    "to_account_id": EXCHANGE_USD, "amount": "0.01", "proceeds_usd": "300",
+                    "fee_amount": "2", "fee_currency": "USD"})
+    lines = {e.id: (e.transaction_id, e.account_id, e.amount) for e in db.query(LedgerEntry).all()}
+
+    for _ in range(2):
+        recalculate_all_transactions(db)
+        db.commit()
+
+    db.expire_all()
+    assert {e.id: (e.transaction_id, e.account_id, e.amount) for e in db.query(LedgerEntry).all()} == lines
+    assert db.get(Transaction, sell["id"]).proceeds_usd == Decimal("298.00")
+
+
+def test_editing_sell_deducts_usd_fee_once(db):
+    _seed_mixed_ledger()
+    sell = _create({"type": "Sell", "timestamp": _ts(95), "from_account_id": EXCHANGE_BTC,
+                    "to_account_id": EXCHANGE_USD, "amount": "0.01", "proceeds_usd": "1000",
+                    "fee_amount": "10", "fee_currency": "USD"})
+
+    def proceeds():
+        db.expire_all()
+        tx = db.get(Transaction, sell["id"])
+        usd_in = sum(e.amount for e in tx.ledger_entries if e.account_id == EXCHANGE_USD)
+        return tx.proceeds_usd, usd_in
+
+    assert proceeds() == (Decimal("990"), Decimal("990"))
+    for _ in range(2):
+        r = CLIENT.put(f"/api/transactions/{sell['id']}", json={"amount": "0.01"})
+        assert r.status_code == 200, r.text
+        assert proceeds() == (Decimal("990"), Decimal("990"))
+
+    r = CLIENT.put(f"/api/transactions/{sell['id']}", json={"fee_amount": "20"})
+    assert r.status_code == 200, r.text
+    assert proceeds() == (Decimal("980"), Decimal("980"))
+
+    r = CLIENT.put(f"/api/transactions/{sell['id']}", json={"proceeds_usd": "2000"})
+    assert r.status_code == 200, r.text
+    assert proceeds() == (Decimal("1980"), Decimal("1980"))
+
+
+def test_replay_backdated_lot_is_consumed_first(db):
+    _create({"type": "Deposit", "timestamp": _ts(10), "from_account_id": EXTERNAL,
+             "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "40000"})
+    sell = _create({"type": "Withdrawal", "timestamp": _ts(20), "from_account_id": WALLET,
+                    "to_account_id": EXTERNAL, "amount": "0.5", "proceeds_usd": "25000",
+                    "purpose": "Spent"})
+    # Backdated acquisition: the withdrawal must now draw from this cheaper lot
+    _create({"type": "Deposit", "timestamp": _ts(5), "from_account_id": EXTERNAL,
+             "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "30000"})
+
+    db.expire_all()
+    tx = db.get(Transaction, sell["id"])
+    assert tx.cost_basis_usd == Decimal("15000.00")
+    assert tx.realized_gain_usd == Decimal("10000.00")
+
+
+def test_replay_rejects_overspend(db):
+    _create({"type": "Deposit", "timestamp": _ts(10), "from_account_id": EXTERNAL,
+             "to_account_id": WALLET, "amount": "0.2", "cost_basis_usd": "4000"})
+    _create({"type": "Withdrawal", "timestamp": _ts(20), "from_account_id": WALLET,
+             "to_account_id": EXTERNAL, "amount": "0.2", "purpose": "Spent",
+             "proceeds_usd": "5000"})
+    # Move the deposit's amount down behind the API's back, then replay
+    db.query(Transaction).filter(Transaction.type == "Deposit").update({"amount": Decimal("0.1")})
+
+    with pytest.raises(HTTPException) as exc:
+        recalculate_all_transactions(db)
+    assert exc.value.status_code == 400
+    assert "Not enough BTC" in exc.value.detail
+
+
+def test_update_resumes_from_checkpoint(db, small_checkpoints):
+    _seed_mixed_ledger()
+    recalculate_all_transactions(db)
+    db.commit()
+    assert db.query(LotCheckpoint).count() == 4
+    sell = db.query(Transaction).filter(Transaction.type == "Sell").one()
+    kept = {cp.id for cp in db.query(LotCheckpoint).all() if cp.as_of_timestamp < sell.timestamp}
+    assert kept
+
+    r = CLIENT.put(f"/api/transactions/{sell.id}", json={"amount": "0.15"})
+    assert r.status_code == 200, r.text
+    resumed = _snapshot(db)
+
+    # Checkpoints before the sell survive the edit
+    assert kept <= {cp.id for cp in db.query(LotCheckpoint).all()}
+
+    recalculate_all_transactions(db)
+    db.commit()
+    assert _snapshot(db) == resumed
+
+
+def test_delete_rewinds_lots_consumed_before_checkpoint(db, small_checkpoints):
+    dep = _create({"type": "Deposit", "timestamp": _ts(1), "from_account_id": EXTERNAL,
+                   "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "20000"})
+    _create({"type": "Deposit", "timestamp": _ts(2), "from_account_id": EXTERNAL,
+             "to_account_id": BANK, "amount": "100"})
+    spend = _create({"type": "Withdrawal", "timestamp": _ts(3), "from_account_id": WALLET,
+                     "to_account_id": EXTERNAL, "amount": "0.4", "purpose": "Spent",
+                     "proceeds_usd": "12000"})
+    _create({"type": "Withdrawal", "timestamp": _ts(4), "from_account_id": WALLET,
+             "to_account_id": EXTERNAL, "amount": "0.1", "purpose": "Gift"})
+    recalculate_all_transactions(db)
+    db.commit()
+
+    r = CLIENT.delete(f"/api/transactions/{spend['id']}")
+    assert r.status_code == 204
+
+    db.expire_all()
+    lot = db.query(BitcoinLot).filter(BitcoinLot.created_txn_id == dep["id"]).one()
+    assert lot.remaining_btc == Decimal("0.9")
+    assert db.query(LotDisposal).filter(LotDisposal.transaction_id == spend["id"]).count() == 0
+
+
+def test_appending_records_checkpoints(db, small_checkpoints):
+    _seed_mixed_ledger()
+
+    checkpoints = db.query(LotCheckpoint).order_by(LotCheckpoint.tx_count).all()
+    assert [cp.tx_count for cp in checkpoints] == [2, 4, 6, 8]
+    last = checkpoints[-1]
+    spend = db.query(Transaction).filter(Transaction.purpose == "Spent").one()
+    assert last.as_of_txn_id == spend.id
+    # Wallet: 0.6 in + 0.12345678 income - 0.25 spent; exchange: 0.8 - 0.6001 - 0.1
+    assert sum(e.remaining_btc for e in last.entries) == Decimal("0.57335678")
+
+
+def test_backdated_usd_create_records_no_checkpoint(db, small_checkpoints):
+    _create({"type": "Deposit", "timestamp": _ts(0), "from_account_id": EXTERNAL,
+             "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "20000"})
+    _create({"type": "Withdrawal", "timestamp": _ts(10), "from_account_id": WALLET,
+             "to_account_id": EXTERNAL, "amount": "0.5", "purpose": "Gift", "fmv_usd": "400"})
+    gift = _create({"type": "Withdrawal", "timestamp": _ts(20), "from_account_id": WALLET,
+                    "to_account_id": EXTERNAL, "amount": "0.2", "purpose": "Gift", "fmv_usd": "400"})
+    checkpoints = {cp.id for cp in db.query(LotCheckpoint).all()}
+    _create({"type": "Deposit", "timestamp": _ts(5), "from_account_id": EXTERNAL,
+             "to_account_id": BANK, "amount": "100", "source": "N/A"})
+    db.expire_all()
+    assert {cp.id for cp in db.query(LotCheckpoint).all()} == checkpoints
+
+    r = CLIENT.put(f"/api/transactions/{gift['id']}", json={"amount": "0.25"})
+    assert r.status_code == 200, r.text
+    resumed = _snapshot(db)
+    recalculate_all_transactions(db)
+    db.commit()
+    assert _snapshot(db) == resumed
+
+
+@pytest.fixture
+def relots(monkeypatch):
+    """Timestamps passed to recalculate_transactions_since, in call order."""
+    calls = []
+    real_since = tx_service.recalculate_transactions_since
+    monkeypatch.setattr(
+        tx_service, "recalculate_transactions_since",
+        lambda session, since: calls.append(since) or real_since(session, since),
+    )
+    return calls
+
+
+def test_usd_only_changes_skip_relot(db, relots):
+    _seed_mixed_ledger()
+    funding = db.query(Transaction).filter(
+        Transaction.type == "Transfer", Transaction.from_account_id == BANK
+    ).one()
+
+    r = CLIENT.put(f"/api/transactions/{funding.id}", json={"amount": "35000", "fee_amount": "5"})
+    assert r.status_code == 200, r.text
+    backdated = _create({"type": "Withdrawal", "timestamp": _ts(-5), "from_account_id": BANK,
+                         "to_account_id": EXTERNAL, "amount": "25"})
+    r = CLIENT.delete(f"/api/transactions/{backdated['id']}")
+    assert r.status_code == 204
+    assert relots == []
+
+    db.expire_all()
+    lines = db.query(LedgerEntry).filter(LedgerEntry.transaction_id == funding.id).all()
+    assert sorted((e.account_id, e.amount) for e in lines if e.entry_type != "FEE") == [
+        (BANK, Decimal("-35005")), (EXCHANGE_USD, Decimal("35000")),
+    ]
+    assert not db.query(LedgerEntry).filter(LedgerEntry.transaction_id == backdated["id"]).count()
+
+    incremental = _snapshot(db)
+    recalculate_all_transactions(db)
+    db.commit()
+    assert _snapshot(db) == incremental
+
+
+def test_moving_usd_transaction_to_btc_account_relots(db, relots):
+    _seed_mixed_ledger()
+    deposit = db.query(Transaction).filter(
+        Transaction.type == "Deposit", Transaction.to_account_id == BANK
+    ).one()
+
+    r = CLIENT.put(f"/api/transactions/{deposit.id}",
+                   json={"type": "Deposit", "from_account_id": EXTERNAL, "to_account_id": WALLET,
+                         "amount": "0.5", "cost_basis_usd": "1", "source": "MyBTC"})
+    assert r.status_code == 200, r.text
+
+    assert relots == [deposit.timestamp]
+    db.expire_all()
+    assert db.query(BitcoinLot).filter(BitcoinLot.created_txn_id == deposit.id).count() == 1
+
+
+def _import_rows():
+    """Backdated rows interleaving with _seed_mixed_ledger()."""
+    def row(day, **fields):
+        fields["timestamp"] = datetime.fromisoformat(_ts(day))
+        for key in ("amount", "cost_basis_usd", "proceeds_usd", "fee_amount", "gross_proceeds_usd"):
+            if key in fields:
+                fields[key] = Decimal(fields[key])
+        return fields
+
+    return [
+        row(20, type="Deposit", from_account_id=EXTERNAL, to_account_id=EXCHANGE_BTC,
+            amount="0.05", cost_basis_usd="1000", source="MyBTC"),
+        row(35, type="Sell", from_account_id=EXCHANGE_BTC, to_account_id=EXCHANGE_USD,
+            amount="0.02", gross_proceeds_usd="500", fee_amount="1", fee_currency="USD"),
+        row(50, type="Transfer", from_account_id=WALLET, to_account_id=EXCHANGE_BTC,
+            amount="0.01", fee_amount="0.00001", fee_currency="BTC"),
+        row(500, type="Withdrawal", from_account_id=EXCHANGE_BTC, to_account_id=EXTERNAL,
+            amount="0.01", purpose="Gift"),
+    ]
+
+
+def test_batch_import_matches_row_by_row(db, monkeypatch):
+    _seed_mixed_ledger()
+    for tx_data in _import_rows():
+        tx_service.create_transaction_record(tx_data, db)
+    row_by_row = _snapshot(db)
+
+    CLIENT.delete("/api/transactions/delete_all")
+    _seed_mixed_ledger()
+    replays = []
+    real_since = tx_service.recalculate_transactions_since
+    monkeypatch.setattr(
+        tx_service, "recalculate_transactions_since",
+        lambda session, since: replays.append(since) or real_since(session, since),
+    )
+    assert execute_import(db, _import_rows()) == 4
+
+    assert replays == [datetime.fromisoformat(_ts(20))]
+    assert _snapshot(db) == row_by_row
+
+
+def test_batch_import_overspend_rolls_back(db):
+    _seed_mixed_ledger()
+    before = _snapshot(db)
+    rows = _import_rows()
+    rows[1]["amount"] = Decimal("5")
+
+    with pytest.raises(HTTPException) as exc:
+        execute_import(db, rows)
+    assert exc.value.status_code == 400
+    assert _snapshot(db) == before
+
+
+def test_batch_endpoint_relots_once(db, relots):
+    _seed_mixed_ledger()
+    spend = db.query(Transaction).filter(Transaction.purpose == "Spent").one()
+    gift_id = db.query(Transaction).filter(Transaction.purpose == "Gift").one().id
+    db.commit()
+
+    r = CLIENT.post("/api/transactions/batch", json={"operations": [
+        {"op": "create", "data": {"type": "Deposit", "timestamp": _ts(20), "from_account_id": EXTERNAL,
+                                  "to_account_id": EXCHANGE_BTC, "amount": "0.05",
+                                  "cost_basis_usd": "1000", "source": "MyBTC"}},
+        {"op": "update", "id": spend.id, "data": {"amount": "0.3", "timestamp": _ts(100)}},
+        {"op": "delete", "id": gift_id},
+    ]})
+    assert r.status_code == 200, r.text
+    results = r.json()
+    assert [x["status"] for x in results] == ["ok", "ok", "ok"]
+    assert results[0]["id"] is not None
+
+    assert relots == [datetime.fromisoformat(_ts(20))]
+    batched = _snapshot(db)
+    recalculate_all_transactions(db)
+    db.commit()
+    assert _snapshot(db) == batched
+    assert db.get(Transaction, gift_id) is None
+
+
+def test_batch_endpoint_is_all_or_nothing(db, relots):
+    _seed_mixed_ledger()
+    spend = db.query(Transaction).filter(Transaction.purpose == "Spent").one()
+    db.commit()
+    before = _snapshot(db)
+
+    # One invalid item: nothing is applied and every item is reported.
+    r = CLIENT.post("/api/transactions/batch", json={"operations": [
+        {"op": "update", "id": spend.id, "data": {"amount": "0.1"}},
+        {"op": "create", "data": {"type": "Sell", "from_account_id": WALLET,
+                                  "to_account_id": EXCHANGE_USD, "amount": "0.1"}},
+        {"op": "delete", "id": 999999},
+    ]})
+    assert r.status_code == 400
+    results = r.json()["detail"]["results"]
+    assert [x["status"] for x in results] == ["rolled_back", "error", "error"]
+    assert results[1]["detail"] == "Sell => from must be Exchange BTC."
+
+    # Valid items whose combined re-lot overspends: rolled back as well.
+    r = CLIENT.post("/api/transactions/batch", json={"operations": [
+        {"op": "update", "id": spend.id, "data": {"amount": "5"}},
+    ]})
+    assert r.status_code == 400
+    assert "Not enough BTC" in r.json()["detail"]["message"]
+    assert _snapshot(db) == before
+
+
+def test_batch_unexpected_error_rolls_back_fee_account(db, monkeypatch):
+    from backend.models.account import Account
+
+    fee_account = db.get(Account, 5)
+    fee_account.name = "BTC Fees (renamed)"
+    db.commit()
+    monkeypatch.setattr(
+        tx_service, "delete_transactions_matching",
+        lambda session, **kw: (_ for _ in ()).throw(ValueError("boom")),
+    )
+    try:
+        # The create adds a new "BTC Fees" account; the next op then fails.
+        r = CLIENT.post("/api/transactions/batch", json={"operations": [
+            {"op": "create", "data": {"type": "Deposit", "timestamp": _ts(0), "from_account_id": EXTERNAL,
+                                      "to_account_id": BANK, "amount": "100", "source": "N/A"}},
+            {"op": "delete_matching", "filter": {"account_id": BANK}},
+        ]})
+        assert r.status_code == 400
+        results = r.json()["detail"]["results"]
+        assert [x["status"] for x in results] == ["rolled_back", "error"]
+        assert results[1]["detail"] == "ValueError: boom"
+        db.expire_all()
+        assert db.query(Account).filter(Account.name == "BTC Fees").count() == 0
+        assert db.query(Transaction).count() == 0
+    finally:
+        fee_account.name = "BTC Fees"
+        db.commit()
+
+
+def test_batch_delete_matching(db, relots):
+    _seed_mixed_ledger()
+    wallet_out = db.query(Transaction).filter(
+        Transaction.from_account_id == WALLET
+    ).order_by(Transaction.timestamp).all()
+    wallet_out[1].is_locked = True
+    spent_id, spent_at, gift_id = wallet_out[0].id, wallet_out[0].timestamp, wallet_out[1].id
+    db.commit()
+
+    r = CLIENT.post("/api/transactions/batch", json={"operations": [
+        {"op": "delete_matching", "filter": {"account_id": WALLET, "type": "Withdrawal"}},
+    ]})
+    assert r.status_code == 200, r.text
+    assert r.json()[0]["deleted"] == 1
+    assert relots == [spent_at]
+
+    db.expire_all()
+    assert db.get(Transaction, spent_id) is None
+    assert db.get(Transaction, gift_id) is not None
+    assert not db.query(LedgerEntry).filter(LedgerEntry.transaction_id == spent_id).count()
+    bulk = _snapshot(db)
+    recalculate_all_transactions(db)
+    db.commit()
+    assert _snapshot(db) == bulk
+    db.get(Transaction, gift_id).is_locked = False
+    db.commit()
+
+
+def test_delete_matching_filters_ids_and_exact_bounds(db):
+    at = datetime(2023, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+    made = [
+        _create({"type": "Deposit", "timestamp": (at + timedelta(microseconds=us)).isoformat(),
+                 "from_account_id": EXTERNAL, "to_account_id": BANK, "amount": "10", "source": "Income"})
+        for us in (0, 250000, 500000, 750000)
+    ]
+    ids = [tx["id"] for tx in made]
+
+    deleted = tx_service.delete_transactions_matching(
+        db, ids=ids[1:],
+        start=at + timedelta(microseconds=250000), end=at + timedelta(microseconds=500000),
+    )
+    assert deleted == 2
+    db.expire_all()
+    assert [db.get(Transaction, i) is not None for i in ids] == [True, False, False, True]
+
+
+def test_closed_tax_year_freezes_lot_baseline(db, monkeypatch):
+    from backend.services import lot_replay
+
+    _seed_mixed_ledger()
+    db.commit()
+    before = _snapshot(db)
+
+    r = CLIENT.post("/api/tax-years/2023/close")
+    assert r.status_code == 200, r.text
+    closed = r.json()
+    db.expire_all()
+    by_year = {}
+    for t in db.query(Transaction).all():
+        by_year.setdefault(t.timestamp.year, []).append(t)
+    assert closed["as_of_txn_id"] == max(by_year[2023], key=lambda t: t.timestamp).id
+    assert closed["open_lots"] == 4  # Exchange BTC remainder, Wallet income + two transferred lots
+    assert all(t.is_locked for t in by_year[2023])
+    assert not any(t.is_locked for t in by_year[2024])
+    db.commit()
+    assert _snapshot(db) == before
+
+    r = CLIENT.post("/api/transactions", json={
+        "type": "Deposit", "timestamp": _ts(100), "from_account_id": EXTERNAL,
+        "to_account_id": WALLET, "amount": "0.1", "cost_basis_usd": "1", "source": "MyBTC"})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Tax year 2023 is closed."
+    assert CLIENT.post("/api/tax-years/2023/close").status_code == 400
+
+    # A full re-lot only replays the open year, from the frozen baseline.
+    replayed = []
+    real_replay = lot_replay.replay_transactions
+    monkeypatch.setattr(lot_replay, "replay_transactions",
+                        lambda session, txs, *a, **kw: replayed.extend(txs) or real_replay(session, txs, *a, **kw))
+    recalculate_all_transactions(db)
+    db.commit()
+    assert sorted(t.purpose for t in replayed) == ["Gift", "Spent"]
+    assert _snapshot(db) == before
+
+    spend_id = next(t.id for t in by_year[2024] if t.purpose == "Spent")
+    r = CLIENT.put(f"/api/transactions/{spend_id}", json={"amount": "0.3"})
+    assert r.status_code == 200, r.text
+    edited = _snapshot(db)
+    recalculate_all_transactions(db)
+    db.commit()
+    assert _snapshot(db) == edited
+
+    r = CLIENT.post("/api/tax-years/2023/reopen")
+    assert r.status_code == 200, r.text
+    assert r.json()["unlocked_transactions"] == len(by_year[2023])
+    assert CLIENT.get("/api/tax-years").json() == []
+    _create({"type": "Deposit", "timestamp": _ts(100), "from_account_id": EXTERNAL,
+             "to_account_id": WALLET, "amount": "0.1", "cost_basis_usd": "1", "source": "MyBTC"})
+
+
+def test_transfer_lots_record_account_and_parent(db):
+    _seed_mixed_ledger()
+    transfer = db.query(Transaction).filter(
+        Transaction.type == "Transfer", Transaction.to_account_id == WALLET
+    ).one()
+
+    for _ in range(2):  # incremental path, then replay
+        db.expire_all()
+        children = db.query(BitcoinLot).filter(BitcoinLot.created_txn_id == transfer.id).all()
+        assert children and all(lot.account_id == WALLET for lot in children)
+        for child in children:
+            parent = db.get(BitcoinLot, child.parent_lot_id)
+            assert parent.account_id == EXCHANGE_BTC
+            assert parent.acquired_date == child.acquired_date
+        recalculate_all_transactions(db)
+        db.commit()
+
+
+def test_upgrade_schema_backfills_lot_account(tmp_path, monkeypatch):
+    import backend.database as database
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE transactions (id INTEGER PRIMARY KEY, to_account_id INTEGER, timestamp VARCHAR)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE ledger_entries (id INTEGER PRIMARY KEY, transaction_id INTEGER, "
+            "account_id INTEGER, amount NUMERIC, currency VARCHAR, entry_type VARCHAR)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE bitcoin_lots (id INTEGER PRIMARY KEY, created_txn_id INTEGER, "
+            "acquired_date VARCHAR, total_btc NUMERIC, remaining_btc NUMERIC, cost_basis_usd NUMERIC)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE lot_checkpoints (id INTEGER PRIMARY KEY, as_of_timestamp VARCHAR, "
+            "as_of_txn_id INTEGER, tx_count INTEGER, created_at VARCHAR)"
+        ))
+        conn.execute(text("INSERT INTO transactions VALUES (7, 4, '2024-01-01T00:00:00Z')"))
+        conn.execute(text("INSERT INTO ledger_entries VALUES (1, 7, 4, 1, 'BTC', 'DEPOSIT')"))
+        conn.execute(text("INSERT INTO bitcoin_lots VALUES (1, 7, '2024-01-01T00:00:00Z', 1, 1, 100)"))
+    monkeypatch.setattr(database, "engine", engine)
+
+    database._upgrade_schema()
+    database._upgrade_schema()  # idempotent
+
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT account_id, parent_lot_id FROM bitcoin_lots")).one()
+    assert tuple(row) == (4, None)
+    assert "ix_bitcoin_lots_open_fifo" in {ix["name"] for ix in inspect(engine).get_indexes("bitcoin_lots")}
+    assert "frozen_year" in {col["name"] for col in inspect(engine).get_columns("lot_checkpoints")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT timestamp FROM ledger_entries")).scalar() == "2024-01-01T00:00:00Z"
+    assert "ix_ledger_entries_account_time" in {ix["name"] for ix in inspect(engine).get_indexes("ledger_entries")}
+
+
+
+
+def test_report_on_closed_year_matches_open_ledger(db, monkeypatch):
+    from backend.services.reports.reporting_core import generate_report_data
+
+    monkeypatch.setattr(
+        "backend.services.reports.reporting_core.get_btc_price",
+        lambda timestamp, db: Decimal("50000"),
+    )
+    # Entered out of order, so rebuilt lots do not get their old ids back.
+    _create({"type": "Deposit", "timestamp": _ts(450), "from_account_id": EXTERNAL,
+             "to_account_id": EXCHANGE_BTC, "amount": "0.5", "cost_basis_usd": "30000", "source": "MyBTC"})
+    _create({"type": "Deposit", "timestamp": _ts(-200), "from_account_id": EXTERNAL,
+             "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "20000", "source": "MyBTC"})
+    _create({"type": "Deposit", "timestamp": _ts(60), "from_account_id": EXTERNAL,
+             "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "25000", "source": "MyBTC"})
+    _create({"type": "Transfer", "timestamp": _ts(150), "from_account_id": WALLET,
+             "to_account_id": EXCHANGE_BTC, "amount": "1.5", "fee_amount": "0.001", "fee_currency": "BTC"})
+    _create({"type": "Withdrawal", "timestamp": _ts(500), "from_account_id": EXCHANGE_BTC,
+             "to_account_id": EXTERNAL, "amount": "1.2", "purpose": "Spent", "proceeds_usd": "50000"})
+    db.commit()
+
+    def balances(year):
+        report = generate_report_data(db, year)
+        db.rollback()  # reports never commit
+        return report["start_of_year_balances"], report["end_of_year_balances"]
+
+    open_reports = {year: balances(year) for year in (2023, 2024)}
+    assert open_reports[2024][1][-1]["quantity"] == pytest.approx(1.299)
+
+    assert CLIENT.post("/api/tax-years/2023/close").status_code == 200
+    db.expire_all()
+    before = _snapshot(db)
+    for year in (2024, 2023, 2024):
+        assert balances(year) == open_reports[year]
+        db.expire_all()
+        assert _snapshot(db) == before
+    assert CLIENT.post("/api/tax-years/2023/reopen").status_code == 200
+
+
+def test_reopen_keeps_manual_locks(db):
+    by_hand = _create({"type": "Deposit", "timestamp": _ts(-200), "from_account_id": EXTERNAL,
+                       "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "20000", "source": "MyBTC"})
+    other = _create({"type": "Deposit", "timestamp": _ts(-100), "from_account_id": EXTERNAL,
+                     "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "20000", "source": "MyBTC"})
+    _create({"type": "Deposit", "timestamp": _ts(10), "from_account_id": EXTERNAL,
+             "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "25000", "source": "MyBTC"})
+    db.get(Transaction, by_hand["id"]).is_locked = True
+    db.commit()
+
+    assert CLIENT.post("/api/tax-years/2023/close").status_code == 200
+    r = CLIENT.post("/api/tax-years/2022/reopen")
+    assert r.status_code == 200, r.text
+    assert r.json()["unlocked_transactions"] == 2
+
+    db.expire_all()
+    assert db.get(Transaction, by_hand["id"]).is_locked
+    assert not db.get(Transaction, other["id"]).is_locked
+    assert CLIENT.get("/api/tax-years").json() == []
+
+
+def test_startup_backfills_transfer_lineage(db, test_engine, monkeypatch):
+    import backend.database as database
+
+    _seed_mixed_ledger()
+    db.commit()
+    assert CLIENT.post("/api/tax-years/2023/close").status_code == 200
+    db.expire_all()
+    before = _snapshot(db)
+    transfer_ids = [t.id for t in db.query(Transaction).filter(Transaction.type == "Transfer")]
+    db.query(BitcoinLot).filter(BitcoinLot.created_txn_id.in_(transfer_ids)).update(
+        {"parent_lot_id": None}, synchronize_session=False
+    )
+    db.commit()
+
+    monkeypatch.setattr(database, "SessionLocal", partial(database.SessionLocal, bind=test_engine))
+    database._backfill_lot_lineage()
+
+    db.expire_all()
+    lots = db.query(BitcoinLot).filter(BitcoinLot.created_txn_id.in_(transfer_ids)).all()
+    assert lots and all(lot.parent_lot_id is not None for lot in lots)
+    assert _snapshot(db) == before
+    assert CLIENT.post("/api/tax-years/2023/reopen").status_code == 200
+
+
+def test_relot_prices_transfer_fees_in_one_batch(db, monkeypatch):
+    _seed_mixed_ledger()
+    for day in (61, 62, 62):
+        _create({"type": "Transfer", "timestamp": _ts(day), "from_account_id": WALLET,
+                 "to_account_id": EXCHANGE_BTC, "amount": "0.01", "fee_amount": "0.0001",
+                 "fee_currency": "BTC"})
+    before = _snapshot(db)
+
+    batches = []
+
+    def batch(days, db):
+        batches.append(sorted(days))
+        return dict.fromkeys(days, Decimal("50000"))
+
+    def single(timestamp, db):
+        raise AssertionError("fee priced inside the FIFO loop")
+
+    monkeypatch.setattr("backend.services.transaction.get_btc_prices", batch)
+    monkeypatch.setattr("backend.services.transaction.get_btc_price", single)
+    recalculate_all_transactions(db, from_scratch=True)
+    db.commit()
+
+    fee_days = [datetime.fromisoformat(_ts(d)).date() for d in (60, 61, 62)]
+    assert batches == [fee_days]
+    assert _snapshot(db) == before
@@ -0,0 +1,314 @@
+"""
+backend/tests/test_price_client.py
+
+Shared pooled price client (backend/services/price_client.py): one
+httpx.AsyncClient serves async route code and the sync facade used from
+request threads; the live-value cache (backend/services/price_cache.py)
+sits on top of it. Responses come from an httpx.MockTransport; no network.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from backend.routers import bitcoin as bitcoin_router
+from backend.services import (
+    bitcoin, price_cache, price_client, price_hedge, price_providers, provider_health,
+)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_provider_health():
+    """Breaker / budget state must not leak between tests."""
+    provider_health.provider_health.clear()
+    yield
+    provider_health.provider_health.clear()
+
+
+@pytest.fixture
+def mock_client(monkeypatch):
+    seen = []
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        with lock:
+            seen.append(request.url.host)
+        if "simple/price" in request.url.path:
+            return httpx.Response(200, json={"bitcoin": {"usd": 65000}})
+        if "/history" in request.url.path:
+            return httpx.Response(200, json={"market_data": {"current_price": {"usd": 16547.91}}})
+        return httpx.Response(404)
+
+    client = price_client.PriceClient(transport=httpx.MockTransport(handler))
+    client.start()
+    monkeypatch.setattr(price_client, "_client", client)
+    yield client, seen
+    client.stop()
+
+
+def test_async_and_sync_callers_share_one_client(mock_client):
+    client, seen = mock_client
+    http = client.http
+
+    assert asyncio.run(bitcoin.get_current_price()) == {"USD": 65000}
+
+    def lookup(day):
+        return price_client.get_price_client().run(bitcoin.fetch_historical_price(date(2023, 1, day)), timeout=5)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lookup, range(1, 9)))
+
+    assert results == [{"USD": 16547.91}] * 8
+    assert len(seen) == 9
+    assert price_client.get_price_client() is client
+    assert client.http is http
+    assert not http.is_closed
+
+
+def test_concurrent_lookups_share_one_fetch(monkeypatch):
+    release = threading.Event()
+    hits = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        hits.append(request.url.params.get("date"))
+        await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+        return httpx.Response(200, json={"market_data": {"current_price": {"usd": 16547.91}}})
+
+    client = price_client.PriceClient(transport=httpx.MockTransport(handler))
+    client.start()
+    monkeypatch.setattr(price_client, "_client", client)
+    try:
+        day = date(2023, 1, 1)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            sync = [pool.submit(client.run, bitcoin.fetch_historical_price(day), 5) for _ in range(3)]
+
+            async def burst():
+                waiting = asyncio.gather(*(bitcoin.fetch_historical_price(day) for _ in range(3)))
+                other = asyncio.ensure_future(bitcoin.fetch_historical_price(date(2023, 1, 2)))
+                await asyncio.sleep(0.2)
+                release.set()
+                return await waiting, await other
+
+            same_day, other_day = asyncio.run(burst())
+            results = [f.result(5) for f in sync] + same_day
+        assert results == [{"USD": 16547.91}] * 6
+        assert other_day == {"USD": 16547.91}
+        assert sorted(hits) == ["01-01-2023", "02-01-2023"]
+        assert client._inflight == {}
+    finally:
+        client.stop()
+
+
+def test_stop_closes_pool(mock_client):
+    client, _ = mock_client
+    http = client.http
+    client.stop()
+    assert http.is_closed
+    assert client.http is None
+
+
+def test_live_cache_serves_stale_while_one_refresh_runs(mock_client, monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    async def fetch():
+        calls.append(len(calls))
+        if len(calls) > 1:
+            await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+        return {"USD": 60000 + len(calls)}
+
+    cache = price_cache.LiveCache("test", fetch, ttl=30, max_stale=600)
+
+    async def burst(n):
+        return await asyncio.gather(*(cache.get() for _ in range(n)))
+
+    # Empty: concurrent callers share one blocking fetch.
+    assert [v for v, _ in asyncio.run(burst(5))] == [{"USD": 60001}] * 5
+    assert len(calls) == 1
+
+    # Fresh: served without an upstream call.
+    value, age = asyncio.run(cache.get())
+    assert value == {"USD": 60001} and age < 30
+    assert len(calls) == 1
+
+    # Past the TTL: the old value comes back at once, one refresh starts.
+    monkeypatch.setattr(cache, "_fetched_at", cache._fetched_at - 45)
+    results = asyncio.run(burst(5))
+    assert [v for v, _ in results] == [{"USD": 60001}] * 5
+    assert all(age >= 45 for _, age in results)
+    release.set()
+    cache._refresh.result(5)
+    assert len(calls) == 2
+    value, age = asyncio.run(cache.get())
+    assert value == {"USD": 60002} and age < 30
+
+
+def test_price_endpoint_reports_cache_age(mock_client, monkeypatch, auth_client):
+    _, seen = mock_client
+    monkeypatch.setattr(price_cache, "current_price_cache", price_cache.LiveCache(
+        "price", price_cache._current_price, ttl=30
+    ))
+    monkeypatch.setattr(bitcoin_router, "current_price_cache", price_cache.current_price_cache)
+    first = auth_client.get("/api/bitcoin/price")
+    second = auth_client.get("/api/bitcoin/price")
+    assert first.status_code == 200, first.text
+    assert first.json()["USD"] == 65000
+    assert second.json()["cache_age_seconds"] >= 0
+    assert len(seen) == 1
+
+
+def test_hedged_lookup_takes_fastest_provider(monkeypatch):
+    cancelled = threading.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "api.coingecko.com":
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        if request.url.host == "api.kraken.com":
+            return httpx.Response(200, json={"error": [], "result": {"XXBTZUSD": {"c": ["64000.5", "1"]}}})
+        return httpx.Response(503)
+
+    client = price_client.PriceClient(transport=httpx.MockTransport(handler))
+    client.start()
+    monkeypatch.setattr(price_client, "_client", client)
+    monkeypatch.setattr(price_hedge, "PRICE_HEDGE_DELAY", 0.05)
+    try:
+        began = time.perf_counter()
+        assert asyncio.run(bitcoin.get_current_price()) == {"USD": 64000.5}
+        assert time.perf_counter() - began < 2
+        assert cancelled.wait(2)
+
+        stats = provider_health.provider_health.snapshot()
+        assert stats["kraken"]["ok"] == 1 and stats["kraken"]["last_latency_ms"] is not None
+        assert stats["coingecko"]["cancelled"] == 1
+        assert "coindesk" not in stats
+    finally:
+        client.stop()
+
+
+def test_hedged_failure_starts_next_provider_at_once():
+    order = []
+
+    async def failing():
+        order.append("a")
+        raise RuntimeError("down")
+
+    async def answering():
+        order.append("b")
+        return 1
+
+    async def run():
+        began = time.perf_counter()
+        result = await price_hedge.hedged([("a", failing), ("b", answering)], delay=5)
+        return result, time.perf_counter() - began
+
+    result, took = asyncio.run(run())
+    assert (result, order) == (1, ["a", "b"])
+    assert took < 1
+    assert asyncio.run(price_hedge.hedged([("a", failing)], delay=5)) is None
+
+
+def test_rate_limited_provider_is_skipped(monkeypatch, auth_client):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.host)
+        if request.url.host == "api.coingecko.com":
+            return httpx.Response(429, headers={"Retry-After": "120"})
+        return httpx.Response(200, json={"error": [], "result": {"XXBTZUSD": {"c": ["64000.5", "1"]}}})
+
+    client = price_client.PriceClient(transport=httpx.MockTransport(handler))
+    client.start()
+    monkeypatch.setattr(price_client, "_client", client)
+    try:
+        assert asyncio.run(bitcoin.get_current_price()) == {"USD": 64000.5}
+        assert asyncio.run(bitcoin.get_current_price()) == {"USD": 64000.5}
+        assert seen == ["api.coingecko.com", "api.kraken.com", "api.kraken.com"]
+    finally:
+        client.stop()
+
+    r = auth_client.get("/api/bitcoin/providers")
+    assert r.status_code == 200
+    coingecko = r.json()["coingecko"]
+    assert (coingecko["state"], coingecko["rate_limited"], coingecko["skipped_open"]) == ("open", 1, 1)
+    assert coingecko["open_for_seconds"] > 60
+    assert r.json()["kraken"]["state"] == "closed"
+
+
+def test_circuit_breaker_and_budget():
+    now = [0.0]
+    health = provider_health.ProviderHealth(clock=lambda: now[0])
+    fail = RuntimeError("timeout")
+
+    for _ in range(provider_health.PROVIDER_FAILURE_THRESHOLD):
+        assert health.acquire("kraken")
+        health.record("kraken", 0.1, ok=False, error=fail)
+    assert not health.acquire("kraken")
+    assert health.snapshot()["kraken"]["state"] == "open"
+
+    # After the cool-down a single trial goes through; success closes it.
+    now[0] += provider_health.PROVIDER_COOLDOWN
+    assert health.acquire("kraken")
+    assert not health.acquire("kraken")
+    health.record("kraken", 0.1, ok=True)
+    assert health.snapshot()["kraken"]["state"] == "closed"
+
+    # An exhausted budget skips the provider until tokens refill.
+    budget = int(health.snapshot()["kraken"]["budget_per_min"])
+    granted = sum(health.acquire("kraken") for _ in range(budget + 5))
+    assert granted < budget + 5
+    assert health.snapshot()["kraken"]["skipped_budget"] == budget + 5 - granted
+    now[0] += 60
+    assert health.acquire("kraken")
+
+
+@pytest.mark.parametrize("layout", ["csv", "sqlite"])
+def test_local_provider_answers_offline(tmp_path, monkeypatch, layout):
+    if layout == "csv":
+        path = tmp_path / "prices.csv"
+        path.write_text("date,price\n2023-01-01,16547.91\n2023-01-02,16625.51\n2023-01-03,16688.47\n")
+    else:
+        path = tmp_path / "prices.db"
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE btc_daily_prices (day TEXT, price_usd NUMERIC)")
+        conn.executemany("INSERT INTO btc_daily_prices VALUES (?, ?)", [
+            ("2023-01-01", 16547.91), ("2023-01-02", 16625.51), ("2023-01-03", 16688.47),
+        ])
+        conn.commit()
+        conn.close()
+
+    def no_network(request: httpx.Request) -> httpx.Response:
+        raise AssertionError(f"unexpected request to {request.url}")
+
+    client = price_client.PriceClient(transport=httpx.MockTransport(no_network))
+    client.start()
+    monkeypatch.setattr(price_client, "_client", client)
+    monkeypatch.setattr(price_providers, "_providers", price_providers.build_providers("local", str(path)))
+    try:
+        assert asyncio.run(bitcoin.get_current_price()) == {"USD": 16688.47}
+        assert asyncio.run(bitcoin.fetch_historical_price(date(2023, 1, 2))) == {"USD": 16625.51}
+        assert asyncio.run(bitcoin.get_price_range(date(2022, 12, 31), date(2023, 1, 2))) == {
+            date(2023, 1, 1): 16547.91, date(2023, 1, 2): 16625.51,
+        }
+        # Misses never open the local provider's circuit.
+        for _ in range(provider_health.PROVIDER_FAILURE_THRESHOLD + 1):
+            with pytest.raises(HTTPException):
+                asyncio.run(bitcoin.fetch_historical_price(date(2020, 1, 1)))
+        assert provider_health.provider_health.snapshot()["local"]["state"] == "closed"
+    finally:
+        client.stop()
+
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError):
+        price_providers.build_providers("coingecko,nope")
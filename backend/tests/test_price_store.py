@@ -0,0 +1,277 @@
+"""
+backend/tests/test_price_store.py
+
+Local daily BTC price store (backend/services/price_store.py): bulk loading,
+read-through lookups and backfill. No test here may reach a price API.
+"""
+
+import asyncio
+import json
+import threading
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from backend.models.btc_price import BtcDailyPrice
+from backend.services import bitcoin, downsample, intraday_prices, price_cache, price_series, price_store
+from backend.services import transaction as tx_service
+
+CLIENT: TestClient = None
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _set_client(auth_client):
+    global CLIENT
+    CLIENT = auth_client
+
+
+@pytest.fixture
+def db(test_db):
+    test_db.query(BtcDailyPrice).delete()
+    test_db.commit()
+    yield test_db
+    test_db.rollback()
+    test_db.query(BtcDailyPrice).delete()
+    test_db.commit()
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Days requested from the price APIs; answers 30000 + day of month."""
+    calls = []
+
+    async def fake_fetch(day):
+        calls.append(day)
+        return {"USD": 30000 + day.day}
+
+    monkeypatch.setattr(bitcoin, "fetch_historical_price", fake_fetch)
+    return calls
+
+
+def test_parse_csv_and_json_layouts():
+    coingecko_csv = (
+        b"snapped_at,price,market_cap,total_volume\n"
+        b"2023-01-01 00:00:00 UTC,16547.91,0,0\n"
+        b"2023-01-02 00:00:00 UTC,16625.51,0,0\n"
+    )
+    assert price_store.parse_price_file(coingecko_csv, "btc-usd-max.csv") == {
+        date(2023, 1, 1): Decimal("16547.91"),
+        date(2023, 1, 2): Decimal("16625.51"),
+    }
+    ms = int(datetime(2023, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    layouts = [
+        {"2023-01-01": 16547.91},
+        [{"date": "2023-01-01", "close": "16547.91"}],
+        {"prices": [[ms, 16547.91]]},
+    ]
+    for layout in layouts:
+        parsed = price_store.parse_price_file(json.dumps(layout).encode(), "prices.json")
+        assert parsed == {date(2023, 1, 1): Decimal("16547.91")}
+
+    with pytest.raises(HTTPException) as exc:
+        price_store.parse_price_file(b"date,price\n2023-01-01,-5\n")
+    assert "row 1" in exc.value.detail
+
+
+def test_btc_price_reads_store_before_network(db, fetches):
+    price_store.store_prices(db, {date(2023, 3, 4): Decimal("22345.67")}, source="file")
+    db.commit()
+
+    at = datetime(2023, 3, 4, 18, tzinfo=timezone.utc)
+    assert tx_service.get_btc_price(at, db) == Decimal("22345.67")
+    assert fetches == []
+
+    # A missing day is fetched once, then served from the store.
+    missing = datetime(2023, 3, 5, 9, tzinfo=timezone.utc)
+    assert tx_service.get_btc_price(missing, db) == Decimal("30005")
+    assert tx_service.get_btc_price(missing, db) == Decimal("30005")
+    assert fetches == [date(2023, 3, 5)]
+
+
+def test_unfinished_day_is_not_stored(db, fetches):
+    today = datetime.now(timezone.utc).date()
+    assert price_store.store_prices(db, {today: 1, today - timedelta(days=1): 2}, source="api") == 1
+    db.commit()
+    r = CLIENT.get("/api/bitcoin/price/history", params={"date": "2023-03-06"})
+    assert r.status_code == 200
+    assert r.json() == {"USD": 30006}
+    db.expire_all()
+    assert price_store.get_stored_price(db, date(2023, 3, 6)) == Decimal("30006")
+
+
+def test_import_endpoint_and_coverage(db):
+    content = b"date,price\n2023-01-01,16547.91\n2023-01-02,16625.51\n"
+    r = CLIENT.post(
+        "/api/bitcoin/price/history/import",
+        files={"file": ("prices.csv", content, "text/csv")},
+    )
+    assert r.status_code == 200, r.text
+    assert r.json() == {"loaded": 2}
+
+    r = CLIENT.get("/api/bitcoin/price/history/coverage")
+    assert r.status_code == 200
+    body = r.json()
+    assert (body["days"], body["first_day"], body["last_day"]) == (2, "2023-01-01", "2023-01-02")
+
+
+def test_backfill_fetches_only_missing_days(db, monkeypatch):
+    requested = []
+
+    async def fake_range(start, end):
+        requested.append((start, end))
+        return {start + timedelta(days=i): 20000 + i for i in range((end - start).days + 1)}
+
+    monkeypatch.setattr(bitcoin, "get_price_range", fake_range)
+    price_store.store_prices(db, {date(2023, 1, 1): 1, date(2023, 1, 2): 1}, source="file")
+    db.commit()
+
+    result = asyncio.run(price_store.backfill_prices(db, date(2023, 1, 1), date(2023, 1, 5)))
+    assert (result["missing"], result["stored"], result["still_missing"]) == (3, 3, 0)
+    assert requested == [(date(2023, 1, 3), date(2023, 1, 5))]
+    assert price_store.get_stored_price(db, date(2023, 1, 1)) == Decimal("1")
+    assert price_store.missing_days(db, date(2023, 1, 1), date(2023, 1, 5)) == []
+
+
+def test_historical_lookup_keeps_store_io_off_the_loop(db, fetches, monkeypatch):
+    loop_threads, io_threads = [], []
+    real_read, real_save = price_store.get_stored_price, price_store.save_prices
+
+    def read(*args):
+        io_threads.append(threading.get_ident())
+        return real_read(*args)
+
+    def save(*args, **kwargs):
+        io_threads.append(threading.get_ident())
+        return real_save(*args, **kwargs)
+
+    monkeypatch.setattr(price_store, "get_stored_price", read)
+    monkeypatch.setattr(price_store, "save_prices", save)
+
+    async def lookup():
+        loop_threads.append(threading.get_ident())
+        return await bitcoin.get_historical_price("2023-03-07", db)
+
+    assert asyncio.run(lookup()) == {"USD": 30007}
+    assert len(io_threads) == 2 and loop_threads[0] not in io_threads
+    assert price_store.get_stored_price(db, date(2023, 3, 7)) == Decimal("30007")
+
+
+def test_batch_prices_use_store_and_few_range_requests(db, fetches, monkeypatch):
+    ranges = []
+
+    async def fake_range(start, end):
+        ranges.append((start, end))
+        return {
+            start + timedelta(days=i): 20000 + i
+            for i in range((end - start).days + 1)
+            if start + timedelta(days=i) != date(2021, 6, 2)
+        }
+
+    monkeypatch.setattr(bitcoin, "get_price_range", fake_range)
+    price_store.store_prices(db, {date(2020, 1, 2): Decimal("7000")}, source="file")
+    db.commit()
+
+    days = [date(2020, 1, 1) + timedelta(days=7 * i) for i in range(150)] + [date(2020, 1, 2)]
+    r = CLIENT.post("/api/bitcoin/price/history/batch", json={"dates": [d.isoformat() for d in days]})
+    assert r.status_code == 200, r.text
+    body = r.json()
+
+    # 150 weekly dates over ~3 years: three range requests, not 150 lookups.
+    assert ranges == [
+        (date(2020, 1, 1), date(2020, 12, 30)),
+        (date(2021, 1, 6), date(2022, 1, 5)),
+        (date(2022, 1, 12), date(2022, 11, 9)),
+    ]
+    # The one day the range left out is looked up on its own.
+    assert fetches == [date(2021, 6, 2)]
+    assert body["missing"] == []
+    assert len(body["prices"]) == 151
+    assert body["prices"]["2020-01-02"] == 7000
+    assert body["prices"]["2021-06-02"] == 30002
+    db.expire_all()
+    assert price_store.missing_days(db, date(2020, 1, 1), date(2020, 1, 1)) == []
+
+
+def test_time_series_appends_only_new_days(db, monkeypatch):
+    ranges = []
+
+    async def fake_range(start, end):
+        ranges.append((start, end))
+        return {day: 20000 + day.toordinal() % 1000 for day in price_store.days_between(start, end)}
+
+    async def fake_live():
+        return {"USD": 99999}
+
+    monkeypatch.setattr(bitcoin, "get_price_range", fake_range)
+    monkeypatch.setattr(price_cache, "current_price_cache", price_cache.LiveCache("price", fake_live, ttl=30))
+    monkeypatch.setattr(price_series, "daily_series", price_series.DailySeries())
+    closed = date(2024, 3, 31)
+    monkeypatch.setattr(price_store, "last_closed_day", lambda: closed)
+
+    series = asyncio.run(bitcoin.get_time_series(30, db=db))
+    assert len(series) == 31 and series[-1]["price"] == 99999
+    assert ranges == [(date(2024, 3, 2), closed)]
+    assert asyncio.run(bitcoin.get_time_series(30, db=db))[:-1] == series[:-1]
+    assert len(ranges) == 1
+
+    # Two days later only the two new days are fetched.
+    closed = date(2024, 4, 2)
+    r = CLIENT.get("/api/bitcoin/price/history/timeseries", params={"days": 30, "points": 10})
+    assert r.status_code == 200, r.text
+    assert ranges[1:] == [(date(2024, 4, 1), date(2024, 4, 2))]
+    points = r.json()
+    assert len(points) == 10
+    assert points[0]["time"] == int(datetime(2024, 3, 4, tzinfo=timezone.utc).timestamp() * 1000)
+    assert points[-1]["price"] == 99999
+
+
+def test_lttb_keeps_ends_and_peaks():
+    series = [(float(x), 100.0) for x in range(1000)]
+    series[437] = (437.0, 5000.0)
+    sampled = downsample.lttb(series, 50)
+    assert len(sampled) == 50
+    assert sampled[0] == series[0] and sampled[-1] == series[-1]
+    assert (437.0, 5000.0) in sampled
+    assert downsample.lttb(series[:20], 50) == series[:20]
+
+
+def test_btc_prices_batch_reads_store_then_fetches_rest(db, monkeypatch):
+    fetched = []
+
+    async def fake_fetch_many(days):
+        fetched.append(list(days))
+        return {day: 40000 + day.day for day in days}
+
+    monkeypatch.setattr(bitcoin, "fetch_historical_prices", fake_fetch_many)
+    price_store.store_prices(db, {date(2023, 5, 1): Decimal("29000")}, source="file")
+    db.commit()
+
+    days = [date(2023, 5, 1), date(2023, 5, 2), date(2023, 5, 9)]
+    prices = tx_service.get_btc_prices(days + days, db)
+    assert prices == {date(2023, 5, 1): Decimal("29000"), date(2023, 5, 2): Decimal("40002"),
+                      date(2023, 5, 9): Decimal("40009")}
+    assert fetched == [[date(2023, 5, 2), date(2023, 5, 9)]]
+    assert price_store.get_stored_price(db, date(2023, 5, 9)) == Decimal("40009")
+
+
+def test_intraday_series_values_fees_at_nearest_bar(db, fetches, monkeypatch):
+    hourly = "timestamp,price\n" + "".join(
+        f"2023-03-04T{h:02d}:00:00Z,{22000 + h}\n" for h in range(24)
+    )
+    series = intraday_prices.IntradaySeries(intraday_prices.parse_intraday_file(hourly.encode(), "h.csv"))
+    monkeypatch.setattr(intraday_prices, "_series", series)
+    monkeypatch.setattr(intraday_prices, "_loaded", True)
+
+    at = datetime(2023, 3, 4, 17, 40, tzinfo=timezone.utc)
+    assert tx_service.get_btc_price(at, db) == Decimal("22018")
+
+    stamps = [at, datetime(2023, 3, 4, 0, 29, tzinfo=timezone.utc), datetime(2023, 3, 6, tzinfo=timezone.utc)]
+    assert series.nearest_many(stamps) == [Decimal("22018"), Decimal("22000"), None]
+
+    # More than INTRADAY_MAX_GAP_SECONDS from any bar: the daily price.
+    price_store.store_prices(db, {date(2023, 3, 6): Decimal("22400")}, source="file")
+    assert tx_service.get_btc_price(stamps[2], db) == Decimal("22400")
+    assert fetches == []
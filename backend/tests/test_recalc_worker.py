@@ -0,0 +1,164 @@
+"""
+backend/tests/test_recalc_worker.py
+
+Opt-in background re-lot (backend/services/recalc_worker.py): edits commit
+immediately, a single worker replays once per burst of edits, and the end
+state matches the synchronous path.
+"""
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from functools import partial
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.database import SessionLocal
+from backend.models.transaction import Transaction, BitcoinLot, LotDisposal
+from backend.services import recalc_worker
+from backend.services import transaction as tx_service
+from backend.services.transaction import recalculate_all_transactions
+
+CLIENT: TestClient = None
+
+EXTERNAL = 99
+WALLET = 2
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _set_client(auth_client):
+    global CLIENT
+    CLIENT = auth_client
+
+
+@pytest.fixture(autouse=True)
+def _no_network(monkeypatch):
+    monkeypatch.setattr(
+        "backend.services.transaction.get_btc_price",
+        lambda timestamp, db: Decimal("50000"),
+    )
+    monkeypatch.setattr(
+        "backend.services.transaction.get_btc_prices",
+        lambda days, db: dict.fromkeys(days, Decimal("50000")),
+    )
+
+
+@pytest.fixture
+def db(test_db):
+    r = CLIENT.delete("/api/transactions/delete_all")
+    assert r.status_code == 204
+    test_db.expire_all()
+    yield test_db
+    test_db.rollback()
+
+
+@pytest.fixture
+def worker(test_engine, monkeypatch):
+    w = recalc_worker.RecalcWorker(session_factory=partial(SessionLocal, bind=test_engine), debounce=0.5)
+    w.start()
+    monkeypatch.setattr(recalc_worker, "_worker", w)
+    yield w
+    w.stop(timeout=30)
+
+
+@pytest.fixture
+def relots(monkeypatch):
+    calls = []
+    real_since = tx_service.recalculate_transactions_since
+    monkeypatch.setattr(
+        tx_service, "recalculate_transactions_since",
+        lambda session, since: calls.append(since) or real_since(session, since),
+    )
+    return calls
+
+
+def _ts(day: int) -> str:
+    return (datetime(2023, 1, 1, 12, tzinfo=timezone.utc) + timedelta(days=day)).isoformat()
+
+
+def _create(tx: dict) -> dict:
+    r = CLIENT.post("/api/transactions", json=tx)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _seed():
+    _create({"type": "Deposit", "timestamp": _ts(0), "from_account_id": EXTERNAL,
+             "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "20000"})
+    _create({"type": "Deposit", "timestamp": _ts(10), "from_account_id": EXTERNAL,
+             "to_account_id": WALLET, "amount": "1", "cost_basis_usd": "30000"})
+    return [
+        _create({"type": "Withdrawal", "timestamp": _ts(20 + i), "from_account_id": WALLET,
+                 "to_account_id": EXTERNAL, "amount": "0.2", "purpose": "Spent",
+                 "proceeds_usd": "9000"})["id"]
+        for i in range(3)
+    ]
+
+
+def _lot_state(db):
+    db.expire_all()
+    state = (
+        sorted((l.created_txn_id, str(l.remaining_btc)) for l in db.query(BitcoinLot).all()),
+        sorted((d.transaction_id, str(d.disposed_btc), str(d.disposal_basis_usd))
+               for d in db.query(LotDisposal).all()),
+    )
+    db.commit()
+    return state
+
+
+def test_status_reports_sync_mode_by_default():
+    r = CLIENT.get("/api/recalc/status")
+    assert r.status_code == 200
+    assert r.json()["mode"] == "sync"
+
+
+def test_edits_are_coalesced_into_one_background_replay(db, worker, relots):
+    spends = _seed()
+    db.commit()
+    assert worker.wait(timeout=30)
+    seeded = worker.ledger_version
+    relots.clear()
+
+    for tx_id, amount in zip(spends, ("0.5", "0.4", "0.3")):
+        r = CLIENT.put(f"/api/transactions/{tx_id}", json={"amount": amount})
+        assert r.status_code == 200, r.text
+
+    assert worker.wait(timeout=30)
+    assert len(relots) == 1
+    status = CLIENT.get("/api/recalc/status").json()
+    assert status["mode"] == "async"
+    assert status["state"] == "done"
+    assert status["ledger_version"] == status["recalculated_version"] == seeded + 3
+    assert status["last_duration_seconds"] is not None
+
+    background = _lot_state(db)
+    recalculate_all_transactions(db)
+    db.commit()
+    assert _lot_state(db) == background
+    assert db.get(Transaction, spends[0]).amount == Decimal("0.5")
+
+
+def test_failed_background_replay_is_flagged(db, worker, monkeypatch):
+    monkeypatch.setattr("backend.routers.recalc.RECALC_WAIT_SECONDS", 5)
+    spends = _seed()
+    db.commit()
+    assert worker.wait(timeout=30)
+
+    r = CLIENT.put(f"/api/transactions/{spends[0]}", json={"amount": "5"})
+    assert r.status_code == 200, r.text
+    assert not worker.wait(timeout=30)
+
+    status = CLIENT.get("/api/recalc/status").json()
+    assert status["state"] == "failed"
+    assert "Not enough BTC" in status["last_error"]
+    assert status["pending_since"] is not None
+
+    r = CLIENT.get("/api/calculations/average-cost-basis")
+    assert r.status_code == 200
+    assert r.headers["X-Recalc-Pending"] == "failed"
+
+    # Fixing the edit re-lots from the failed replay's start point as well.
+    r = CLIENT.put(f"/api/transactions/{spends[0]}", json={"amount": "0.2"})
+    assert r.status_code == 200, r.text
+    assert worker.wait(timeout=30)
+    assert CLIENT.get("/api/recalc/status").json()["state"] == "done"
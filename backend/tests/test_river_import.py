@@ -40,16 +40,20 @@ def _set_client(auth_client):
 def _no_network(monkeypatch):
     """Tests must never hit price APIs: stub historical FMV lookups and the
     live price used for transfer-fee/withdrawal valuation."""
-    async def fake_historical(date: str):
-        return {"USD": 100000.0}
+    async def fake_historical(days):
+        return {day: 100000.0 for day in days}
 
     monkeypatch.setattr(
-        "backend.routers.river_import.get_historical_price", fake_historical
+        "backend.routers.river_import.get_historical_prices", fake_historical
     )
     monkeypatch.setattr(
         "backend.services.transaction.get_btc_price",
         lambda timestamp, db: Decimal("100000"),
     )
+    monkeypatch.setattr(
+        "backend.services.transaction.get_btc_prices",
+        lambda days, db: dict.fromkeys(days, Decimal("100000")),
+    )
 
 
 RIVER_HEADER = (
@@ -148,6 +148,7 @@ declare global {
 
   interface LiveBtcPriceResponse {
     USD: number; // e.g. { USD: 12345.67 }
+    cache_age_seconds?: number; // seconds since the server fetched it
   }
 
   interface BtcPriceHistoryPoint {